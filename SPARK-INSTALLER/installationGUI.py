@@ -1,97 +1,134 @@
+import argparse
 import os
-import subprocess
-import requests
-import tarfile
+import sys
 import platform
-import tkinter as tk
-from tkinter import ttk, messagebox
-from tqdm import tqdm
 import threading
-import queue
+
+# Les modules partagés (downloader, ...) se trouvent à la racine du dépôt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import artifact_cache
+import downloader
+import events
+import extractor
+import lazyimport
+import packages
+import probes
+import stages
+
+# Tk n'est chargé qu'à l'ouverture de la fenêtre : --check fonctionne sans affichage
+tk = lazyimport.module('tkinter')
+ttk = lazyimport.module('tkinter.ttk')
+messagebox = lazyimport.module('tkinter.messagebox')
 
 SPARK_VERSION = "3.4.1"
 SPARK_URL = f"https://archive.apache.org/dist/spark/spark-{SPARK_VERSION}/spark-{SPARK_VERSION}-bin-hadoop3.tgz"
 INSTALL_DIR = "/opt/spark"
 PYTHON_URL = "https://www.python.org/downloads/"
 
+def _report_probe(result, label):
+    if result['ok']:
+        print(f"{label} {result['version']} est déjà installé.")
+    else:
+        print(result['message'])
+    return result['ok']
+
 def is_java_installed():
-    """Vérifie si Java est installé"""
-    try:
-        subprocess.run(['java', '-version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print("Java est déjà installé.")
-        return True
-    except subprocess.CalledProcessError:
-        print("Java n'est pas installé.")
-        return False
+    """Vérifie si une version de Java prise en charge est installée"""
+    return _report_probe(probes.check('java'), "Java")
 
 def is_python_installed():
     """Vérifie si Python est installé"""
-    try:
-        subprocess.run(['python', '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print("Python est déjà installé.")
-        return True
-    except subprocess.CalledProcessError:
-        print("Python n'est pas installé.")
-        return False
+    return _report_probe(probes.check('python'), "Python")
 
 def install_python():
-    """Télécharge et installe Python"""
-    print("Téléchargement de Python...")
-    subprocess.run(['apt-get', 'update'], check=True)
-    subprocess.run(['apt-get', 'install', '-y', 'python3'], check=True)
+    """Installe Python avec apt"""
+    print("Installation de Python...")
+    packages.install([packages.APT_PACKAGES['python']])
     print("Python a été installé avec succès.")
 
 def install_java():
-    """Télécharge et installe OpenJDK"""
+    """Installe OpenJDK avec apt"""
     print("Installation de Java...")
-    subprocess.run(['apt-get', 'update'], check=True)
-    subprocess.run(['apt-get', 'install', '-y', 'openjdk-11-jdk'], check=True)
+    packages.install([packages.APT_PACKAGES['java']])
     print("Java a été installé avec succès.")
 
+def provision_packages():
+    """Installe en une seule transaction apt les prérequis manquants"""
+    needed = packages.missing(probes.check_all())
+    if needed:
+        print(f"Installation de {' '.join(needed)}...")
+        packages.install(needed)
+        if packages.missing(probes.check_all(use_cache=False)):
+            print("Les prérequis sont toujours manquants après apt.")
+            return False
+    return True
+
 def install_winutils():
     """Cette fonction n'est pas nécessaire dans le conteneur"""
     return True
 
-def download_spark():
-    """Télécharge Apache Spark avec une barre de progression"""
+def download_spark(connections=downloader.DOWNLOAD_CONNECTIONS, progress=None):
+    """Télécharge Apache Spark avec une barre de progression, ou le copie depuis le cache
+
+    progress(fait, total) remplace la barre tqdm, par exemple pour l'interface graphique.
+    """
     print("Téléchargement de Spark...")
     os.makedirs(INSTALL_DIR, exist_ok=True)
-    response = requests.get(SPARK_URL, stream=True)
-    if response.status_code != 200:
-        print(f"Erreur lors du téléchargement. Status code: {response.status_code}")
-        return False
     spark_archive = os.path.join(INSTALL_DIR, 'spark.tgz')
-    total_size = int(response.headers.get('Content-Length', 0))
-    with open(spark_archive, "wb") as file, tqdm(
-        desc="Téléchargement", total=total_size, unit="B", unit_scale=True
-    ) as bar:
-        for chunk in response.iter_content(chunk_size=1024):
-            file.write(chunk)
-            bar.update(len(chunk))
+    results = []
+
+    def download(path):
+        results.append(downloader.download_file(SPARK_URL, path, connections=connections,
+                                                progress=progress or True))
+        return results[-1]['sha512']
+
+    try:
+        if artifact_cache.ArtifactCache().fetch(SPARK_URL, spark_archive, download):
+            print("Archive Spark servie depuis le cache.")
+            if progress:
+                size = os.path.getsize(spark_archive)
+                progress(size, size)
+            return True
+    except Exception as e:
+        print(f"Erreur lors du téléchargement : {str(e)}")
+        return False
 
-    print("Téléchargement de Spark terminé.")
+    print(f"Téléchargement de Spark terminé ({downloader.format_rate(results[-1]['rate'])}).")
     return True
 
 def extract_spark():
     """Extraire Spark"""
     print("Extraction de Spark...")
-    with tarfile.open(os.path.join(INSTALL_DIR, 'spark.tgz'), 'r:gz') as tar_ref:
-        tar_ref.extractall(INSTALL_DIR)
+    stats = extractor.extract_archive(os.path.join(INSTALL_DIR, 'spark.tgz'), INSTALL_DIR)
     os.remove(os.path.join(INSTALL_DIR, 'spark.tgz'))
-    print("Extraction terminée.")
+    print(f"Extraction terminée : {extractor.format_timings(stats)}")
 
 def set_env_variables():
     """Définir les variables d'environnement"""
     print("Configuration des variables d'environnement...")
     spark_home = os.path.join(INSTALL_DIR, f"spark-{SPARK_VERSION}-bin-hadoop3")
     
-    # Mise à jour du fichier d'environnement
+    # Mise à jour du fichier d'environnement, sans répéter les lignes déjà présentes
+    lines = [f"SPARK_HOME={spark_home}", f"PATH={spark_home}/bin:$PATH"]
+    existing = open("/etc/environment").read().splitlines() if os.path.exists("/etc/environment") else []
     with open("/etc/environment", "a") as env_file:
-        env_file.write(f"\nSPARK_HOME={spark_home}")
-        env_file.write(f"\nPATH={spark_home}/bin:$PATH")
+        for line in lines:
+            if line not in existing:
+                env_file.write(f"\n{line}")
     
     print("Variables d'environnement configurées.")
 
+def plan_install(listener=None, progress=None):
+    """Étapes de l'installation : apt et le téléchargement de Spark se déroulent en parallèle"""
+    plan = stages.Scheduler(listener)
+    plan.add('packages', provision_packages, label="Prérequis")
+    plan.add('download', lambda: download_spark(progress=progress), label="Téléchargement de Spark")
+    plan.add('winutils', install_winutils, label="WinUtils")
+    plan.add('extract', extract_spark, requires=['download'], label="Extraction de Spark")
+    plan.add('environment', set_env_variables, requires=['extract', 'packages', 'winutils'],
+             label="Variables d'environnement")
+    return plan
+
 class InstallerGUI:
     def __init__(self, root):
         self.root = root
@@ -167,8 +204,9 @@ class InstallerGUI:
         
         # Variables
         self.current_step = 0
-        self.total_steps = 6
-        self.status_queue = queue.Queue()
+        self.total_steps = 5
+        # Les threads de travail passent par le bus : seul le thread Tk touche aux widgets
+        self.bus = events.EventBus()
         
         # Création du conteneur principal avec fond
         self.main_frame = ttk.Frame(self.root)
@@ -216,7 +254,7 @@ class InstallerGUI:
         self.progress_bar = ttk.Progressbar(
             progress_frame,
             variable=self.progress_var,
-            maximum=self.total_steps
+            maximum=100
         )
         self.progress_bar.pack(fill=tk.X)
         
@@ -240,6 +278,24 @@ class InstallerGUI:
         )
         self.status_label.pack()
         
+        # Journal de l'installation, limité à events.LOG_LINES lignes
+        log_frame = ttk.Frame(content_frame)
+        log_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        self.log_text = tk.Text(
+            log_frame,
+            height=8,
+            font=("Consolas", 10),
+            background=self.colors['card'],
+            foreground=self.colors['text'],
+            state=tk.DISABLED,
+            wrap=tk.WORD
+        )
+        log_scrollbar = ttk.Scrollbar(log_frame, command=self.log_text.yview)
+        self.log_text.config(yscrollcommand=log_scrollbar.set)
+        log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
         # Bouton de téléchargement avec cadre
         download_frame = ttk.Frame(content_frame, style='Card.TFrame')
         download_frame.pack(fill=tk.X, pady=20, padx=50)
@@ -276,7 +332,7 @@ class InstallerGUI:
         self.next_button = ttk.Button(
             self.button_frame,
             text="Suivant",
-            command=self.next_step,
+            command=self.finish_installation,
             state=tk.DISABLED,
             style="Action.TButton"
         )
@@ -294,94 +350,75 @@ class InstallerGUI:
         self.update_status()
         
     def update_status(self):
+        """Applique les événements du bus, au plus events.UI_FPS fois par seconde"""
         try:
-            while True:
-                message = self.status_queue.get_nowait()
-                self.log_text.insert(tk.END, message + "\n")
+            lines, progress = self.bus.dispatch()
+            if lines:
+                self.log_text.config(state=tk.NORMAL)
+                self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+                excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - events.LOG_LINES
+                if excess > 0:
+                    self.log_text.delete('1.0', f"{excess + 1}.0")
+                self.log_text.config(state=tk.DISABLED)
                 self.log_text.see(tk.END)
-        except queue.Empty:
-            pass
+            if progress is not None:
+                self.show_progress(*progress)
         finally:
-            self.root.after(100, self.update_status)
+            self.root.after(1000 // events.UI_FPS, self.update_status)
+            
+    def show_progress(self, done, total, rate):
+        """Barre de progression alimentée par les octets réellement reçus"""
+        text = f"{done / 1024 ** 2:.1f} Mo"
+        if total:
+            self.progress_var.set(100 * done / total)
+            text = f"{100 * done / total:.0f}% — {text} / {total / 1024 ** 2:.1f} Mo"
+        if rate and done != total:
+            text += f" — {downloader.format_rate(rate)}"
+        self.progress_label.config(text=text)
             
     def log_message(self, message):
-        self.status_queue.put(message)
+        """Ajoute une ligne au journal ; utilisable depuis n'importe quel thread"""
+        self.bus.log(message)
         
     def check_dependencies(self):
         def check():
             self.log_message("✓ Vérification des prérequis...")
-            java_ok = is_java_installed()
-            python_ok = is_python_installed()
+            results = probes.check_all()
             
-            if java_ok and python_ok:
+            if all(result['ok'] for result in results.values()):
+                for name, result in results.items():
+                    self.log_message(f"✓ {name.capitalize()} {result['version']}")
                 self.log_message("✓ Tous les prérequis sont installés")
-                self.download_button.config(state=tk.NORMAL)
+                self.bus.call(self.download_button.config, state=tk.NORMAL)
             else:
-                if not java_ok:
-                    self.log_message("❌ Java n'est pas installé")
-                if not python_ok:
-                    self.log_message("❌ Python n'est pas installé")
-                self.download_button.config(state=tk.DISABLED)
+                for result in results.values():
+                    if not result['ok']:
+                        self.log_message(f"❌ {result['message']}")
+                if packages.apt_available():
+                    # Les paquets manquants seront installés pendant le téléchargement
+                    self.log_message(f"Paquets à installer : {' '.join(packages.missing(results))}")
+                    self.bus.call(self.download_button.config, state=tk.NORMAL)
+                else:
+                    self.bus.call(self.download_button.config, state=tk.DISABLED)
                 
         threading.Thread(target=check, daemon=True).start()
         
-    def next_step(self):
-        self.current_step += 1
-        self.progress_var.set(self.current_step)
-        
-        if self.current_step == 1:
-            self.status_label.config(text="Téléchargement de Spark...")
-            self.next_button.config(state=tk.DISABLED)
-            threading.Thread(target=self.download_spark_thread, daemon=True).start()
-        elif self.current_step == 2:
-            self.status_label.config(text="Installation de WinUtils...")
-            self.next_button.config(state=tk.DISABLED)
-            threading.Thread(target=self.install_winutils_thread, daemon=True).start()
-        elif self.current_step == 3:
-            self.status_label.config(text="Extraction de Spark...")
-            self.next_button.config(state=tk.DISABLED)
-            threading.Thread(target=self.extract_spark_thread, daemon=True).start()
-        elif self.current_step == 4:
-            self.status_label.config(text="Configuration des variables d'environnement...")
-            self.next_button.config(state=tk.DISABLED)
-            threading.Thread(target=self.set_env_variables_thread, daemon=True).start()
-        elif self.current_step == 5:
-            self.status_label.config(text="Installation terminée!")
-            self.next_button.config(text="Terminer", command=self.finish_installation)
-            
-    def download_spark_thread(self):
-        if download_spark():
-            self.log_message("Téléchargement de Spark réussi.")
-            self.next_button.config(state=tk.NORMAL)
-        else:
-            self.log_message("Erreur lors du téléchargement de Spark.")
-            messagebox.showerror("Erreur", "Échec du téléchargement de Spark.")
+    def on_stage(self, stage):
+        """Appelé par l'ordonnanceur à chaque changement d'état d'une étape"""
+        if stage.status == stages.RUNNING:
+            self.log_message(f"▶ {stage.label}...")
+        elif stage.status == stages.DONE:
+            self.bus.call(self.step_done)
+            self.log_message(f"✓ {stage.label} ({stage.seconds:.1f} s)")
+        elif stage.status == stages.FAILED:
+            self.log_message(f"❌ {stage.label}" + (f" : {stage.error}" if stage.error else ""))
+        elif stage.status == stages.SKIPPED:
+            self.log_message(f"⚠ {stage.label} ignorée")
             
-    def install_winutils_thread(self):
-        if install_winutils():
-            self.log_message("Installation de WinUtils réussie.")
-            self.next_button.config(state=tk.NORMAL)
-        else:
-            self.log_message("Erreur lors de l'installation de WinUtils.")
-            messagebox.showerror("Erreur", "Échec de l'installation de WinUtils.")
-            
-    def extract_spark_thread(self):
-        try:
-            extract_spark()
-            self.log_message("Extraction de Spark réussie.")
-            self.next_button.config(state=tk.NORMAL)
-        except Exception as e:
-            self.log_message(f"Erreur lors de l'extraction: {str(e)}")
-            messagebox.showerror("Erreur", "Échec de l'extraction de Spark.")
-            
-    def set_env_variables_thread(self):
-        try:
-            set_env_variables()
-            self.log_message("Configuration des variables d'environnement réussie.")
-            self.next_button.config(state=tk.NORMAL)
-        except Exception as e:
-            self.log_message(f"Erreur lors de la configuration: {str(e)}")
-            messagebox.showerror("Erreur", "Échec de la configuration des variables d'environnement.")
+    def step_done(self):
+        self.current_step += 1
+        self.status_label.config(
+            text=f"⬇️ Installation de Spark en cours... ({self.current_step}/{self.total_steps})")
             
     def install_java(self):
         self.log_message("Ouverture de la page de téléchargement de Java...")
@@ -400,30 +437,55 @@ class InstallerGUI:
         self.root.quit()
 
     def start_download(self):
-        """Démarre le téléchargement de Spark"""
+        """Lance toutes les étapes de l'installation"""
+        plan = plan_install(self.on_stage, progress=self.bus.progress)
+        self.current_step = 0
+        self.total_steps = len(plan.stages)
+        self.progress_var.set(0)
         self.download_button.config(state=tk.DISABLED)
-        self.status_label.config(text="⬇️ Téléchargement de Spark en cours...")
-        self.log_message("Démarrage du téléchargement de Spark...")
+        self.status_label.config(text="⬇️ Installation de Spark en cours...")
+        self.log_message("Démarrage de l'installation de Spark...")
         
-        def download_thread():
+        def install_thread():
             try:
-                if download_spark():
-                    self.log_message("✓ Téléchargement terminé avec succès")
-                    self.status_label.config(text="✓ Téléchargement terminé !")
-                    self.progress_var.set(self.progress_var.get() + 1)
-                    self.next_button.config(state=tk.NORMAL)
+                report = plan.run()
+                for line in stages.format_report(report).splitlines():
+                    self.log_message(line)
+                if report['ok']:
+                    self.bus.call(self.status_label.config, text="✓ Installation terminée !")
+                    self.bus.call(self.next_button.config, text="Terminer",
+                                  command=self.finish_installation, state=tk.NORMAL)
                 else:
-                    self.log_message("❌ Erreur lors du téléchargement")
-                    self.status_label.config(text="❌ Erreur de téléchargement")
-                    self.download_button.config(state=tk.NORMAL)
+                    self.bus.call(self.status_label.config, text="❌ Erreur d'installation")
+                    self.bus.call(self.download_button.config, state=tk.NORMAL)
+                    self.bus.call(messagebox.showerror, "Erreur", "Échec de l'installation de Spark.")
             except Exception as e:
                 self.log_message(f"❌ Erreur : {str(e)}")
-                self.status_label.config(text="❌ Erreur de téléchargement")
-                self.download_button.config(state=tk.NORMAL)
+                self.bus.call(self.status_label.config, text="❌ Erreur d'installation")
+                self.bus.call(self.download_button.config, state=tk.NORMAL)
         
-        threading.Thread(target=download_thread, daemon=True).start()
+        threading.Thread(target=install_thread, daemon=True).start()
+
+def check_headless():
+    """Vérifie les prérequis dans le terminal, sans ouvrir de fenêtre"""
+    ok = True
+    for name, result in probes.check_all().items():
+        if result['ok']:
+            print(f"✓ {name.capitalize()} {result['version']}")
+        else:
+            print(f"❌ {result['message']}")
+            ok = False
+    return ok
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Installateur graphique de Apache Spark")
+    parser.add_argument(
+        '--check', action='store_true',
+        help="vérifier les prérequis dans le terminal, sans interface graphique"
+    )
+    args = parser.parse_args(argv)
+    if args.check:
+        sys.exit(0 if check_headless() else 1)
     root = tk.Tk()
     app = InstallerGUI(root)
     root.mainloop()
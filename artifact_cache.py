@@ -0,0 +1,155 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+
+import telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+CACHE_DIR = os.path.expanduser(os.environ.get('SPARK_INSTALLER_CACHE', '~/.cache/spark-installer'))
+CACHE_MAX_BYTES = 5 * 1024 ** 3
+
+
+class ArtifactCache:
+    """Cache local d'archives partagé entre installations
+
+    Les archives sont stockées par leur SHA-512 dans objects/, et chaque URL
+    pointe vers son objet via un fichier refs/<empreinte de l'url>.json. La
+    date de modification d'un objet sert d'horloge LRU : elle est mise à
+    jour à chaque utilisation, et les objets les plus anciens sont supprimés
+    dès que le cache dépasse max_bytes.
+
+    Des verrous fcntl sérialisent les téléchargements d'une même URL : un
+    second installateur attend le premier puis trouve l'archive en cache.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        for name in ('objects', 'refs', 'tmp', 'locks'):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    @contextlib.contextmanager
+    def _locked(self, name):
+        with open(os.path.join(self.root, 'locks', name + '.lock'), 'a') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def lock(self, url):
+        """Verrou exclusif sur une URL, tenu pendant son téléchargement"""
+        return self._locked(self.key(url))
+
+    def _index_lock(self):
+        return self._locked('index')
+
+    def _ref_path(self, url):
+        return os.path.join(self.root, 'refs', self.key(url) + '.json')
+
+    def _object_path(self, sha512):
+        return os.path.join(self.root, 'objects', sha512)
+
+    def _lookup(self, url, sha512=None):
+        try:
+            with open(self._ref_path(url)) as f:
+                ref = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if sha512 and ref.get('sha512') != sha512:
+            return None
+        path = self._object_path(ref['sha512'])
+        if not os.path.exists(path) or os.path.getsize(path) != ref.get('size'):
+            return None
+        os.utime(path)
+        return path
+
+    def lookup(self, url, sha512=None):
+        """Chemin de l'archive en cache pour url (et sha512 s'il est donné), ou None"""
+        with self._index_lock():
+            return self._lookup(url, sha512)
+
+    def partial_path(self, url):
+        """Emplacement stable d'un téléchargement en cours, pour pouvoir le reprendre"""
+        return os.path.join(self.root, 'tmp', self.key(url) + '.part')
+
+    def store(self, url, path, sha512):
+        """Range le fichier path sous son SHA-512 et l'associe à url"""
+        target = self._object_path(sha512)
+        with self._index_lock():
+            if os.path.exists(target):
+                os.remove(path)
+            else:
+                os.replace(path, target)
+            os.utime(target)
+            ref = {'url': url, 'sha512': sha512, 'size': os.path.getsize(target)}
+            tmp = self._ref_path(url) + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(ref, f)
+            os.replace(tmp, self._ref_path(url))
+            self._evict(keep=target)
+        return target
+
+    def _evict(self, keep=None):
+        directory = os.path.join(self.root, 'objects')
+        entries = []
+        for name in os.listdir(directory):
+            stat = os.stat(os.path.join(directory, name))
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(directory, name)))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            evicted += 1
+        return evicted
+
+    def evict(self):
+        """Supprime les objets les moins récemment utilisés au-delà de max_bytes"""
+        with self._index_lock():
+            return self._evict()
+
+    @staticmethod
+    def materialize(source, dest):
+        """Place une copie de l'objet à dest, par lien physique si possible"""
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(source, dest)
+        except OSError:
+            shutil.copyfile(source, dest)
+
+    def fetch(self, url, dest, download, sha512=None):
+        """Place l'archive url à dest, depuis le cache ou via download(chemin)
+
+        download reçoit le chemin où écrire l'archive et doit retourner son
+        SHA-512. Retourne True si l'archive venait du cache.
+        """
+        with telemetry.span('cache.fetch') as span, self.lock(url):
+            with self._index_lock():
+                cached = self._lookup(url, sha512)
+                if cached is not None:
+                    self.materialize(cached, dest)
+                    span.set(hit=True)
+                    return True
+            span.set(hit=False)
+            cached = self.store(url, self.partial_path(url), download(self.partial_path(url)))
+            with self._index_lock():
+                self.materialize(cached, dest)
+            return False
@@ -0,0 +1,510 @@
+import argparse
+import base64
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import requests
+from tqdm import tqdm
+
+import bundle
+import downloader
+import extractor
+import installation
+import localserver
+
+PHASES = ['download', 'extract', 'environment']
+SMALL_FILES = 2000
+SMALL_SIZE = 4 * 1024
+JARS = 20
+JAR_SIZE = 8 * 1024 ** 2
+RUNS = 3
+THRESHOLD = 10.0
+# En deçà, un écart de médiane relève du bruit de mesure
+MIN_DELTA = 0.05
+ARCHIVE_MTIME = 1700000000
+# Points d'entrée mesurés par --startup, relatifs à la racine du dépôt
+STARTUP_COMMANDS = {
+    'installation --help': ['installation.py', '--help'],
+    'installation check': ['installation.py', 'check'],
+    'installation list': ['installation.py', 'list'],
+    'installation verify --fast': ['installation.py', 'verify', '--fast'],
+    'installationGUI --check': [os.path.join('SPARK-INSTALLER', 'installationGUI.py'), '--check'],
+}
+# Exécutables produits par pyinstaller installation.spec (-- --onedir)
+FROZEN_BUILDS = {
+    'gelé one-dir': os.path.join('dist', 'installation', 'installation'),
+    'gelé one-file': os.path.join('dist', 'installation'),
+}
+STARTUP_MIN_DELTA = 0.01
+STARTUP_TIMEOUT = 60
+
+
+def _add(tar, name, data, mode=0o644):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = mode
+    info.mtime = ARCHIVE_MTIME
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _add_dir(tar, name):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE
+    info.mode = 0o755
+    info.mtime = ARCHIVE_MTIME
+    tar.addfile(info)
+
+
+def _symlink(name, target):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.SYMTYPE
+    info.linkname = target
+    info.mode = 0o777
+    info.mtime = ARCHIVE_MTIME
+    return info
+
+
+def generate_archive(path, small_files=SMALL_FILES, small_size=SMALL_SIZE, jars=JARS,
+                     jar_size=JAR_SIZE, seed=0):
+    """Génère une archive ressemblant à une distribution Spark
+
+    Petits fichiers texte (compressibles) sous python/, gros jar
+    aléatoires (incompressibles) sous jars/, quelques scripts exécutables et
+    un lien symbolique. Pour des paramètres donnés, l'archive produite est
+    identique octet pour octet d'un lancement à l'autre.
+    """
+    rng = random.Random(seed)
+    top = installation.SPARK_DIST
+    with open(path, 'wb') as raw, \
+            gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as compressed, \
+            tarfile.open(fileobj=compressed, mode='w|') as tar:
+        _add_dir(tar, top)
+        for directory in ('bin', 'conf', 'jars', 'python', 'python/pyspark'):
+            _add_dir(tar, f"{top}/{directory}")
+        for name in ('spark-submit', 'spark-shell', 'pyspark', 'spark-class'):
+            _add(tar, f"{top}/bin/{name}", b'#!/usr/bin/env bash\nexec true "$@"\n', 0o755)
+        tar.addfile(_symlink(f"{top}/bin/spark", 'spark-submit'))
+        for i in range(small_files):
+            package = f"python/pyspark/module{i // 100:03d}"
+            if i % 100 == 0:
+                _add_dir(tar, f"{top}/{package}")
+            data = base64.b64encode(rng.randbytes(small_size * 3 // 4))
+            _add(tar, f"{top}/{package}/file{i:05d}.py", data)
+        for i in range(jars):
+            _add(tar, f"{top}/jars/lib{i:03d}.jar", rng.randbytes(jar_size))
+    return path
+
+
+def prepare_mirror(workdir, params):
+    """Crée (ou réutilise) le miroir local : archive synthétique et son .sha512"""
+    key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+    mirror = os.path.join(workdir, f"mirror-{key}")
+    archive = os.path.join(mirror, installation.SPARK_PATH)
+    if not os.path.exists(archive + '.sha512'):
+        os.makedirs(os.path.dirname(archive), exist_ok=True)
+        generate_archive(archive, **params)
+        digest = hashlib.sha512()
+        with open(archive, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        with open(archive + '.sha512', 'w') as f:
+            f.write(f"{digest.hexdigest()}  {os.path.basename(archive)}\n")
+    return mirror, os.path.getsize(archive)
+
+
+def _timed(func, *args):
+    started = time.monotonic()
+    ok = func(*args)
+    seconds = time.monotonic() - started
+    if ok is False:
+        raise RuntimeError(f"{func.__name__} a échoué")
+    return seconds
+
+
+def run_once(url, workdir, connections, workers, quiet=True):
+    """Une installation complète dans un répertoire jetable ; retourne les durées par phase"""
+    root = tempfile.mkdtemp(prefix='run-', dir=workdir)
+    home = os.path.join(root, 'home')
+    os.makedirs(home)
+    saved = installation.INSTALL_DIR, os.environ.get('HOME')
+    installation.INSTALL_DIR = os.path.join(root, 'spark')
+    # setup_environment écrit dans ~/.bashrc : HOME pointe sur le répertoire jetable
+    os.environ['HOME'] = home
+    output = open(os.devnull, 'w') if quiet else None
+    try:
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                stack.enter_context(contextlib.redirect_stdout(output))
+                stack.enter_context(contextlib.redirect_stderr(output))
+            return {
+                'download': _timed(installation.download_spark, connections, None, [url]),
+                'extract': _timed(installation.extract_spark, workers),
+                'environment': _timed(installation.setup_environment),
+            }
+    finally:
+        installation.INSTALL_DIR = saved[0]
+        if saved[1] is None:
+            os.environ.pop('HOME', None)
+        else:
+            os.environ['HOME'] = saved[1]
+        if output is not None:
+            output.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _iter_content_loop(chunk_size):
+    def copy(response, write, progress):
+        received = 0
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            write(chunk)
+            progress.update(len(chunk))
+            received += len(chunk)
+        return received
+    return copy
+
+
+# Boucles de réception mono-flux comparées par io_benchmark
+IO_LOOPS = {
+    'iter_content 1 Ko': _iter_content_loop(1024),
+    'iter_content 64 Ko': _iter_content_loop(downloader.CHUNK_SIZE),
+    'readinto adaptatif': downloader._copy_body,
+}
+
+
+def io_benchmark(workdir, size, runs, seed=0):
+    """Temps CPU par Go de chaque boucle de réception mono-flux
+
+    Un fichier aléatoire de size octets est servi par localserver et reçu
+    sur une seule connexion. Seul le temps CPU du thread qui reçoit est
+    compté (time.thread_time) : celui du serveur, dans le même processus,
+    ne fausse pas la comparaison.
+    """
+    path = os.path.join(workdir, f"io-{size}.bin")
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        rng = random.Random(seed)
+        with open(path, 'wb') as f:
+            for offset in range(0, size, 8 * 1024 ** 2):
+                f.write(rng.randbytes(min(8 * 1024 ** 2, size - offset)))
+    server = localserver.serve_directory(workdir)
+    session = requests.Session()
+    target = os.path.join(workdir, 'io-received.bin')
+    results = {}
+    try:
+        for name, loop in IO_LOOPS.items():
+            cpu, wall = [], []
+            for _ in range(runs):
+                with open(target, 'wb') as f, open(os.devnull, 'w') as output, \
+                        session.get(server.url + os.path.basename(path), stream=True) as response:
+                    progress = tqdm(total=size, unit='B', unit_scale=True, file=output)
+                    started, clock = time.monotonic(), time.thread_time()
+                    received = loop(response, f.write, progress)
+                    cpu.append(time.thread_time() - clock)
+                    wall.append(time.monotonic() - started)
+                    progress.close()
+                if received != size:
+                    raise RuntimeError(f"{name} : {received} octets reçus sur {size}")
+            results[name] = {
+                'cpu_per_gb': statistics.median(cpu) * 1024 ** 3 / size,
+                'rate': size / statistics.median(wall),
+            }
+    finally:
+        server.shutdown()
+        server.server_close()
+        if os.path.exists(target):
+            os.remove(target)
+    return results
+
+
+def format_io(results, size):
+    """Tableau CPU par Go et débit de chaque boucle"""
+    lines = [f"Réception mono-flux de {size / 1024 ** 2:.0f} Mo",
+             f"{'Boucle':<22} {'CPU/Go':>9} {'Débit':>12}"]
+    for name, stats in results.items():
+        lines.append(f"{name:<22} {stats['cpu_per_gb']:>8.2f}s {downloader.format_rate(stats['rate']):>12}")
+    return '\n'.join(lines)
+
+
+def codec_benchmark(workdir, params, runs, workers=extractor.EXTRACT_WORKERS):
+    """Durée d'extraction de l'archive .tgz face aux bundles de chaque codec disponible"""
+    mirror, _ = prepare_mirror(workdir, params)
+    archive = os.path.join(mirror, installation.SPARK_PATH)
+    tree = tempfile.mkdtemp(prefix='tree-', dir=workdir)
+    sources = {'tgz (gzip)': (archive, lambda root: extractor.extract_archive(archive, root, workers, pigz=False))}
+    if extractor.find_pigz():
+        sources['tgz (pigz)'] = (archive, lambda root: extractor.extract_archive(archive, root, workers))
+    results = {}
+    try:
+        extractor.extract_archive(archive, tree, workers)
+        for codec in bundle.available_codecs():
+            path = os.path.join(workdir, f"bench.{codec}{bundle.BUNDLE_SUFFIX}")
+            bundle.create(tree, path, {'source': os.path.basename(archive)}, codec)
+            sources[f"bundle {codec}"] = (path, lambda root, path=path: bundle.extract(path, root, workers))
+        for name, (path, extract) in sources.items():
+            seconds = []
+            for _ in range(runs):
+                root = tempfile.mkdtemp(prefix='extract-', dir=workdir)
+                try:
+                    started = time.monotonic()
+                    stats = extract(root)
+                    seconds.append(time.monotonic() - started)
+                finally:
+                    shutil.rmtree(root, ignore_errors=True)
+            results[name] = {'bytes': os.path.getsize(path), 'extracted': stats['bytes'],
+                             'seconds': statistics.median(seconds)}
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+    return results
+
+
+def format_codecs(results):
+    """Tableau taille, durée médiane et débit d'extraction de chaque format"""
+    lines = [f"{'Format':<14} {'Taille':>10} {'Extraction':>11} {'Débit':>12}"]
+    for name, stats in results.items():
+        lines.append(f"{name:<14} {stats['bytes'] / 1024 ** 2:>7.1f} Mo {stats['seconds']:>10.3f}s "
+                     f"{downloader.format_rate(stats['extracted'] / stats['seconds']):>12}")
+    return '\n'.join(lines)
+
+
+def startup_commands(root):
+    """Commandes mesurées par --startup : scripts Python et exécutables gelés présents dans dist/"""
+    commands = {name: [sys.executable] + [os.path.join(root, argv[0])] + argv[1:]
+                for name, argv in STARTUP_COMMANDS.items()}
+    for name, path in FROZEN_BUILDS.items():
+        path = os.path.join(root, path)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            commands[f"{name} --help"] = [path, '--help']
+            commands[f"{name} check"] = [path, 'check']
+    return commands
+
+
+def _time_to_output(command):
+    """Délai jusqu'au premier octet écrit sur stdout, puis jusqu'à la fin du processus"""
+    # Sortie non tamponnée : le premier print arrive aussitôt dans le tube
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    started = time.monotonic()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               stdin=subprocess.DEVNULL, env=env)
+    try:
+        process.stdout.read(1)
+        first = time.monotonic() - started
+        process.stdout.read()
+        process.wait(timeout=STARTUP_TIMEOUT)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+    return first, time.monotonic() - started
+
+
+def startup_benchmark(root, runs):
+    """Temps jusqu'à la première sortie de chaque point d'entrée, en médiane sur runs exécutions
+
+    Une exécution d'échauffement non comptée remplit le cache de pages et
+    les __pycache__ : la mesure porte sur un démarrage à chaud, comme
+    pour un utilisateur qui relance l'outil.
+    """
+    results = {}
+    for name, command in startup_commands(root).items():
+        _time_to_output(command)
+        measures = [_time_to_output(command) for _ in range(runs)]
+        results[name] = {
+            'first_output': _stats([first for first, _ in measures]),
+            'total': _stats([total for _, total in measures]),
+        }
+    return results
+
+
+def format_startup(results):
+    """Tableau des délais médians de première sortie et de fin par point d'entrée"""
+    lines = [f"{'Commande':<32} {'1re sortie':>11} {'Min':>9} {'Total':>9}"]
+    for name, stats in results.items():
+        lines.append(f"{name:<32} {stats['first_output']['median']:>10.3f}s "
+                     f"{stats['first_output']['min']:>8.3f}s {stats['total']['median']:>8.3f}s")
+    return '\n'.join(lines)
+
+
+def _stats(values):
+    return {
+        'median': statistics.median(values),
+        'min': min(values),
+        'mean': statistics.mean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+    }
+
+
+def summarize(runs):
+    """Médiane, minimum, moyenne et écart type de chaque phase"""
+    return {phase: _stats([run[phase] for run in runs]) for phase in PHASES}
+
+
+def compare(results, baseline, threshold=THRESHOLD, min_delta=MIN_DELTA):
+    """Phases dont la médiane dépasse celle de baseline de plus de threshold % (et de min_delta s)"""
+    regressions = []
+    for phase, stats in results['summary'].items():
+        before = baseline['summary'].get(phase, {}).get('median')
+        after = stats['median']
+        if before and after > before * (1 + threshold / 100) and after - before > min_delta:
+            regressions.append((phase, before, after, (after / before - 1) * 100))
+    return regressions
+
+
+def format_summary(results):
+    """Tableau des durées par phase"""
+    size = results['archive_bytes'] / 1024 ** 2
+    lines = [f"Archive {size:.1f} Mo, {results['params']['runs']} exécutions",
+             f"{'Phase':<14} {'Médiane':>9} {'Min':>9} {'Moyenne':>9} {'Écart':>9}"]
+    for phase in PHASES:
+        stats = results['summary'][phase]
+        lines.append(f"{phase:<14} {stats['median']:>8.3f}s {stats['min']:>8.3f}s "
+                     f"{stats['mean']:>8.3f}s {stats['stdev']:>8.3f}s")
+    download = results['summary']['download']['median']
+    if download:
+        lines.append(f"Débit médian : {downloader.format_rate(results['archive_bytes'] / download)}")
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure hors ligne des performances de l'installateur")
+    parser.add_argument('--runs', type=int, default=RUNS, help="Nombre d'exécutions")
+    parser.add_argument('--small-files', type=int, default=SMALL_FILES,
+                        help="Nombre de petits fichiers dans l'archive")
+    parser.add_argument('--small-size', type=int, default=SMALL_SIZE // 1024,
+                        help="Taille des petits fichiers en Ko")
+    parser.add_argument('--jars', type=int, default=JARS, help="Nombre de gros jar")
+    parser.add_argument('--jar-size', type=int, default=JAR_SIZE // 1024 ** 2,
+                        help="Taille des jar en Mo")
+    parser.add_argument('--seed', type=int, default=0, help="Graine du contenu généré")
+    parser.add_argument('--rate', type=float, default=None,
+                        help="Débit par connexion du serveur local en Mo/s (défaut : illimité)")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="Latence ajoutée à chaque requête, en millisecondes")
+    parser.add_argument('--connections', type=int, default=downloader.DOWNLOAD_CONNECTIONS,
+                        help="Connexions parallèles pour le téléchargement")
+    parser.add_argument('--extract-workers', type=int, default=extractor.EXTRACT_WORKERS,
+                        help="Threads d'écriture pendant l'extraction")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'spark-installer-bench'),
+                        help="Répertoire des archives générées et des installations jetables")
+    parser.add_argument('--output', default='benchmark.json', help="Fichier de résultats JSON")
+    parser.add_argument('--baseline', help="Résultats JSON de référence à comparer")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="Régression tolérée en pourcentage de la médiane de référence")
+    parser.add_argument('--verbose', action='store_true', help="Afficher la sortie de l'installateur")
+    parser.add_argument('--io', type=int, metavar='MO',
+                        help="Mesurer seulement le CPU par Go des boucles de réception, sur MO Mo")
+    parser.add_argument('--codecs', action='store_true',
+                        help="Mesurer seulement l'extraction du .tgz face aux bundles zstd et lz4")
+    parser.add_argument('--startup', action='store_true',
+                        help="Mesurer seulement le délai de première sortie de chaque point d'entrée "
+                             "(résultats dans --output, comparés à --baseline)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.io:
+        os.makedirs(args.workdir, exist_ok=True)
+        size = args.io * 1024 ** 2
+        print(format_io(io_benchmark(args.workdir, size, args.runs, args.seed), size))
+        return 0
+    if args.startup:
+        return startup_main(args)
+    params = {
+        'small_files': args.small_files,
+        'small_size': args.small_size * 1024,
+        'jars': args.jars,
+        'jar_size': args.jar_size * 1024 ** 2,
+        'seed': args.seed,
+    }
+    os.makedirs(args.workdir, exist_ok=True)
+    if args.codecs:
+        print("Génération de l'archive synthétique...")
+        print(format_codecs(codec_benchmark(args.workdir, params, args.runs, args.extract_workers)))
+        return 0
+    print("Génération de l'archive synthétique...")
+    mirror, size = prepare_mirror(args.workdir, params)
+    rate = args.rate * 1024 ** 2 if args.rate else None
+    server = localserver.serve_directory(mirror, rate=rate, latency=args.latency / 1000)
+    runs = []
+    try:
+        for i in range(args.runs):
+            runs.append(run_once(server.url, args.workdir, args.connections, args.extract_workers,
+                                 quiet=not args.verbose))
+            print(f"  exécution {i + 1}/{args.runs} : "
+                  + ', '.join(f"{phase} {runs[-1][phase]:.3f} s" for phase in PHASES))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    results = {
+        'created': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'archive_bytes': size,
+        'params': dict(params, runs=args.runs, rate=rate, latency=args.latency / 1000,
+                       connections=args.connections, extract_workers=args.extract_workers),
+        'runs': runs,
+        'summary': summarize(runs),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(format_summary(results))
+    print(f"✓ Résultats enregistrés dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for phase, before, after, percent in regressions:
+            print(f"❌ Régression {phase} : {before:.3f} s -> {after:.3f} s (+{percent:.1f} %)")
+        if regressions:
+            return 1
+        print(f"✓ Aucune régression au-delà de {args.threshold:.0f} %")
+    return 0
+
+
+def startup_main(args):
+    """--startup : mesure, enregistre et compare le délai de première sortie"""
+    startup = startup_benchmark(os.path.dirname(os.path.abspath(__file__)), args.runs)
+    results = {
+        'created': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': {'runs': args.runs, 'startup': True},
+        'startup': startup,
+        'summary': {name: stats['first_output'] for name, stats in startup.items()},
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(format_startup(startup))
+    print(f"✓ Résultats enregistrés dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, STARTUP_MIN_DELTA)
+        for name, before, after, percent in regressions:
+            print(f"❌ Régression {name} : {before:.3f} s -> {after:.3f} s (+{percent:.1f} %)")
+        if regressions:
+            return 1
+        print(f"✓ Aucune régression au-delà de {args.threshold:.0f} %")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import importlib
+import json
+import os
+import stat
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import extractor
+import lazyimport
+import manifest
+import telemetry
+
+tarfile = lazyimport.module('tarfile')
+
+MAGIC = b'SPARK-BUNDLE\n'
+FORMAT = 1
+BUNDLE_SUFFIX = '.bundle'
+CODECS = ['zstd', 'lz4']
+DEFAULT_CODEC = 'zstd'
+ZSTD_LEVEL = 3
+READ_CHUNK = 1024 * 1024
+# Dépendances optionnelles (pip install zstandard lz4), importées au premier bundle seulement
+_CODEC_MODULES = {'zstd': 'zstandard', 'lz4': 'lz4.frame'}
+_codecs = {}
+
+
+class BundleError(Exception):
+    """Erreur levée quand un bundle est illisible, incomplet ou altéré"""
+
+
+def _codec_module(codec):
+    """Module Python du codec, ou None s'il n'est pas installé"""
+    if codec not in _codecs:
+        try:
+            _codecs[codec] = importlib.import_module(_CODEC_MODULES[codec])
+        except ImportError:
+            _codecs[codec] = None
+    return _codecs[codec]
+
+
+def available_codecs():
+    """Codecs dont le module Python est installé"""
+    return [codec for codec in CODECS if _codec_module(codec) is not None]
+
+
+def _payload_errors():
+    # lz4 signale une trame altérée par RuntimeError, zstandard par ZstdError
+    zstandard = _codec_module('zstd')
+    return (tarfile.TarError, EOFError, RuntimeError) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def _require(codec):
+    if codec not in CODECS:
+        raise BundleError(f"Codec inconnu : {codec} (disponibles : {', '.join(CODECS)})")
+    if codec not in available_codecs():
+        module = _CODEC_MODULES[codec].split('.')[0]
+        raise BundleError(f"Le codec {codec} nécessite le module {module} (pip install {module})")
+
+
+def _compressor(codec, fileobj):
+    _require(codec)
+    module = _codec_module(codec)
+    if codec == 'zstd':
+        # threads=-1 : compression répartie sur tous les cœurs ; somme xxHash de la trame vérifiée à la lecture
+        return module.ZstdCompressor(level=ZSTD_LEVEL, threads=-1, write_checksum=True).stream_writer(
+            fileobj, closefd=False)
+    return module.LZ4FrameFile(fileobj, mode='wb', content_checksum=True)
+
+
+def _decompressor(codec, fileobj):
+    _require(codec)
+    module = _codec_module(codec)
+    if codec == 'zstd':
+        return module.ZstdDecompressor().stream_reader(fileobj, read_size=READ_CHUNK, closefd=False)
+    return module.LZ4FrameFile(fileobj, mode='rb')
+
+
+def _walk(root):
+    """Chemins relatifs de l'arborescence root, répertoires avant leur contenu, dans un ordre stable"""
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        relative = os.path.relpath(directory, root)
+        if relative != '.':
+            yield relative
+        # Les liens symboliques vers des répertoires sont des entrées, pas des dossiers à parcourir
+        for name in sorted(files + [d for d in dirs if os.path.islink(os.path.join(directory, d))]):
+            yield os.path.normpath(os.path.join(relative, name))
+        dirs[:] = [d for d in dirs if not os.path.islink(os.path.join(directory, d))]
+
+
+def describe(root, workers=manifest.HASH_WORKERS):
+    """Entrées de manifeste (voir manifest.py) de l'arborescence root, SHA-256 calculés en parallèle
+
+    Le premier chemin rencontré d'un inode partagé est le fichier, les
+    suivants des liens physiques vers lui, comme le fait tarfile.
+    """
+    entries = {}
+    inodes = {}
+    files = []
+    for name in _walk(root):
+        path = os.path.join(root, name)
+        info = os.lstat(path)
+        if stat.S_ISLNK(info.st_mode):
+            entries[name] = {'type': 'symlink', 'target': os.readlink(path)}
+        elif stat.S_ISDIR(info.st_mode):
+            entries[name] = {'type': 'dir', 'mode': stat.S_IMODE(info.st_mode)}
+        elif info.st_nlink > 1 and (info.st_dev, info.st_ino) in inodes:
+            entries[name] = {'type': 'hardlink', 'target': inodes[(info.st_dev, info.st_ino)]}
+        else:
+            inodes[(info.st_dev, info.st_ino)] = name
+            entries[name] = {'type': 'file', 'size': info.st_size, 'mode': stat.S_IMODE(info.st_mode),
+                             'mtime': int(info.st_mtime)}
+            files.append(name)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hash') as pool:
+        digests = pool.map(lambda name: manifest.file_digest(os.path.join(root, name)), files)
+        for name, digest in zip(files, digests):
+            entries[name]['sha256'] = digest
+    return entries
+
+
+def create(root, output, info, codec=DEFAULT_CODEC):
+    """Écrit le bundle output à partir de l'arborescence root
+
+    Le fichier commence par MAGIC, la longueur de l'en-tête JSON sur 8
+    octets puis l'en-tête lui-même : info (version, variante, profil...),
+    codec et entrées du manifeste (SHA-256 de chaque fichier). Suit la
+    charge utile : l'archive tar de root compressée par codec, avec la
+    somme de contrôle de trame du codec.
+
+    Retourne un dictionnaire : octets, durée, nombre d'entrées.
+    """
+    _require(codec)
+    started = time.monotonic()
+    with telemetry.span('bundle.create', codec=codec) as span:
+        entries = describe(root)
+        header = dict(info, format=FORMAT, codec=codec, created=time.time(), entries=entries)
+        encoded = json.dumps(header).encode()
+        tmp = f"{output}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC + struct.pack('>Q', len(encoded)) + encoded)
+            compressed = _compressor(codec, f)
+            # Format GNU : dates entières, comme dans les archives Apache
+            with tarfile.open(fileobj=compressed, mode='w|', format=tarfile.GNU_FORMAT) as tar:
+                for name in entries:
+                    tar.add(os.path.join(root, name), arcname=name, recursive=False)
+            compressed.close()
+        os.replace(tmp, output)
+        size = os.path.getsize(output)
+        span.set(bytes=size, entries=len(entries))
+    return {'bytes': size, 'seconds': time.monotonic() - started, 'entries': len(entries)}
+
+
+def _read_header(fileobj):
+    if fileobj.read(len(MAGIC)) != MAGIC:
+        raise BundleError("Ce fichier n'est pas un bundle Spark")
+    try:
+        length, = struct.unpack('>Q', fileobj.read(8))
+        header = json.loads(fileobj.read(length))
+    except (struct.error, ValueError) as e:
+        raise BundleError(f"En-tête de bundle illisible : {e}") from e
+    if header.get('format') != FORMAT:
+        raise BundleError(f"Format de bundle {header.get('format')} non pris en charge")
+    return header
+
+
+def read_info(path):
+    """En-tête du bundle path (version, variante, profil, codec, entrées...), sans le décompresser"""
+    with open(path, 'rb') as f:
+        return _read_header(f)
+
+
+def _compare(expected, entries):
+    """Entrées extraites qui diffèrent de l'en-tête"""
+    mismatched = []
+    for name, entry in entries.items():
+        wanted = expected.get(name)
+        if wanted is None or wanted['type'] != entry['type']:
+            mismatched.append(name)
+        elif entry['type'] == 'file' and (entry['sha256'], entry['size']) != (wanted['sha256'], wanted['size']):
+            mismatched.append(name)
+        elif entry['type'] == 'symlink' and entry['target'] != wanted['target']:
+            mismatched.append(name)
+    return mismatched
+
+
+def extract(path, root, workers=extractor.EXTRACT_WORKERS, keep=None, reuse=None):
+    """Extrait le bundle path dans root et vérifie son contenu
+
+    La somme de trame du codec est contrôlée pendant la décompression et
+    le SHA-256 de chaque fichier écrit est comparé à l'en-tête ; un écart
+    lève BundleError. keep et reuse ont le même rôle que pour
+    extractor.extract_stream.
+
+    Retourne les statistiques de l'extraction, avec l'en-tête (info) et le codec.
+    """
+    with open(path, 'rb') as f:
+        header = _read_header(f)
+        stream = _decompressor(header['codec'], f)
+        try:
+            stats = extractor.extract_stream(stream, root, mode='r|', workers=workers, pigz=False,
+                                             keep=keep, reuse=reuse)
+            # Lit la fin de la trame (bourrage tar) : la somme du codec n'est contrôlée qu'à la fin
+            while stream.read(READ_CHUNK):
+                pass
+        except _payload_errors() as e:
+            raise BundleError(f"Charge utile illisible : bundle altéré ou tronqué ({e})") from e
+        finally:
+            stream.close()
+    mismatched = _compare(header['entries'], stats['entries'])
+    missing = [name for name in header['entries'] if name not in stats['entries']
+               and (keep is None or keep(name))]
+    if mismatched or missing:
+        raise BundleError(f"Le contenu ne correspond pas à l'en-tête : {len(mismatched)} entrées "
+                          f"différentes, {len(missing)} manquantes ({', '.join((mismatched + missing)[:3])})")
+    return dict(stats, info=header, codec=header['codec'])
@@ -0,0 +1,244 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+import lazyimport
+import probes
+import telemetry
+import tuning
+
+statistics = lazyimport.module('statistics')
+
+CDS_DIR = 'cds'
+ARCHIVE_NAME = 'spark.jsa'
+INFO_NAME = 'spark.json'
+# -XX:ArchiveClassesAtExit (archive dynamique) depuis Java 13, liste de classes + -Xshare:dump depuis Java 11
+DYNAMIC_MIN_JAVA = 13
+STATIC_MIN_JAVA = 11
+MEASURE_RUNS = 3
+CDS_TIMEOUT = 600
+
+# Job trivial : démarre une session, exécute une requête et s'arrête
+PYSPARK_JOB = """from pyspark.sql import SparkSession
+spark = SparkSession.builder.master('local[*]').appName('spark-installer-cds').getOrCreate()
+spark.range(1000).selectExpr('sum(id)').collect()
+spark.stop()
+"""
+SQL_JOB = "SELECT sum(id) FROM range(1000)"
+
+
+class CdsError(Exception):
+    """Erreur levée quand l'archive CDS ne peut pas être générée ou que la JVM la refuse"""
+
+
+class CdsUnsupported(CdsError):
+    """Erreur levée quand la JVM ne prend pas en charge les archives CDS des classes applicatives"""
+
+
+def java_binary():
+    """JVM qu'utilisera Spark : $JAVA_HOME/bin/java, sinon java dans le PATH"""
+    if os.environ.get('JAVA_HOME'):
+        return os.path.join(os.environ['JAVA_HOME'], 'bin', 'java')
+    found = shutil.which('java')
+    if found is None:
+        raise CdsUnsupported("java introuvable dans le PATH")
+    return found
+
+
+def java_support(java):
+    """Mode CDS pris en charge par java : 'dynamic', 'static'
+
+    Lève CdsUnsupported pour Java 8 et pour les JVM sans archives CDS
+    applicatives (OpenJ9 par exemple).
+    """
+    try:
+        completed = subprocess.run([java, '-XX:+PrintFlagsFinal', '-version'], stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, timeout=probes.PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise CdsUnsupported(f"java ne démarre pas : {e}") from e
+    output = completed.stdout.decode(errors='replace')
+    version = probes.parse_java_version(output)
+    if completed.returncode != 0 or version is None:
+        raise CdsUnsupported(f"JVM non reconnue ({java})")
+    if version[0] < STATIC_MIN_JAVA or not re.search(r'\bSharedArchiveFile\b', output):
+        raise CdsUnsupported(f"Java {version[0]} ne prend pas en charge les archives CDS applicatives "
+                             f"(Java {STATIC_MIN_JAVA} ou plus, HotSpot)")
+    if version[0] >= DYNAMIC_MIN_JAVA and re.search(r'\bArchiveClassesAtExit\b', output):
+        return 'dynamic', version[0]
+    return 'static', version[0]
+
+
+def archive_path(distribution_dir):
+    return os.path.join(distribution_dir, CDS_DIR, ARCHIVE_NAME)
+
+
+def _fingerprint(java):
+    binary = os.path.realpath(java)
+    stat = os.stat(binary)
+    return {'java': binary, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def current_archive(distribution_dir, java=None):
+    """Chemin de l'archive CDS si elle a été générée par la JVM actuelle, sinon None
+
+    Une archive n'est utilisable que par la JVM qui l'a produite : après
+    une mise à jour de Java, elle est ignorée jusqu'à la prochaine
+    génération.
+    """
+    try:
+        with open(os.path.join(distribution_dir, CDS_DIR, INFO_NAME)) as f:
+            info = json.load(f)
+        fingerprint = _fingerprint(java or java_binary())
+    except (OSError, ValueError, CdsError):
+        return None
+    path = archive_path(distribution_dir)
+    if not os.path.exists(path) or any(info.get(key) != value for key, value in fingerprint.items()):
+        return None
+    return path
+
+
+def _class_path(distribution_dir):
+    # Placé en tête par spark.driver.extraClassPath, jars/* précède conf/ : la JVM refuse
+    # une archive dont le chemin de classes utilisé contient un répertoire non vide
+    return os.path.join(distribution_dir, 'jars', '*')
+
+
+def _java_options(archive, share='auto'):
+    return f'-XX:SharedArchiveFile={archive} -Xshare:{share}'
+
+
+def settings(distribution_dir, java=None):
+    """Réglages (au format de tuning.recommend) qui activent l'archive CDS, si elle est à jour"""
+    archive = current_archive(distribution_dir, java)
+    if archive is None:
+        return []
+    reason = "archive CDS des classes de Spark chargées au démarrage (voir cds.py)"
+    return [
+        (tuning.DEFAULTS_FILE, 'spark.driver.extraClassPath', _class_path(distribution_dir),
+         "même chemin de classes qu'à la génération de l'archive, sans répertoire non vide devant les jar"),
+        (tuning.DEFAULTS_FILE, 'spark.driver.extraJavaOptions', _java_options(archive), reason),
+    ]
+
+
+def _submit(distribution_dir, java_options, class_path=None):
+    command = [os.path.join(distribution_dir, 'bin', 'spark-submit')]
+    if class_path:
+        command += ['--driver-class-path', class_path]
+    return command + ['--driver-java-options', java_options]
+
+
+def _job(distribution_dir, java_options, class_path, workdir):
+    """Commande du job trivial : PySpark si la distribution l'embarque, sinon Spark SQL"""
+    if os.path.isdir(os.path.join(distribution_dir, 'python', 'pyspark')):
+        script = os.path.join(workdir, 'cds_job.py')
+        with open(script, 'w') as f:
+            f.write(PYSPARK_JOB)
+        return _submit(distribution_dir, java_options, class_path) + ['--master', 'local[*]', script]
+    command = [os.path.join(distribution_dir, 'bin', 'spark-sql'), '--master', 'local[*]']
+    if class_path:
+        command += ['--driver-class-path', class_path]
+    return command + ['--driver-java-options', java_options, '-e', SQL_JOB]
+
+
+def _run(command, distribution_dir, env=None):
+    """Lance command ; retourne (durée, sortie). Lève CdsError si la commande échoue"""
+    env = dict(os.environ, SPARK_HOME=distribution_dir, **(env or {}))
+    started = time.monotonic()
+    try:
+        completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   env=env, timeout=CDS_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise CdsError(f"{os.path.basename(command[0])} : {e}") from e
+    seconds = time.monotonic() - started
+    output = completed.stdout.decode(errors='replace')
+    if completed.returncode != 0:
+        lines = [line for line in output.splitlines() if line.strip()]
+        raise CdsError(f"{os.path.basename(command[0])} a échoué (code {completed.returncode}) : "
+                       f"{lines[-1] if lines else ''}")
+    return seconds, output
+
+
+def measure(distribution_dir, java_options, class_path=None, runs=MEASURE_RUNS):
+    """Durées médianes de `spark-submit --version` et du job trivial avec ces options de la JVM"""
+    workdir = tempfile.mkdtemp(prefix='cds-')
+    try:
+        version = [_run(_submit(distribution_dir, java_options, class_path) + ['--version'],
+                        distribution_dir)[0] for _ in range(runs)]
+        job = [_run(_job(distribution_dir, java_options, class_path, workdir), distribution_dir)[0]
+               for _ in range(runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'version': statistics.median(version), 'job': statistics.median(job)}
+
+
+def _dump(distribution_dir, mode, java, archive, workdir):
+    """Exécute le job trivial en enregistrant les classes chargées dans archive"""
+    class_path = _class_path(distribution_dir)
+    if mode == 'dynamic':
+        _run(_job(distribution_dir, f'-XX:ArchiveClassesAtExit={archive}', class_path, workdir),
+             distribution_dir)
+        return
+    # Java 11 et 12 : liste des classes chargées, puis archive statique avec le même chemin de classes
+    classes = os.path.join(workdir, 'classes.lst')
+    _, output = _run(_job(distribution_dir, f'-XX:DumpLoadedClassList={classes}', class_path, workdir),
+                     distribution_dir, env={'SPARK_PRINT_LAUNCH_COMMAND': '1'})
+    match = re.search(r'Spark Command: .*? -cp (\S+)', output)
+    if match is None:
+        raise CdsError("Chemin de classes du driver introuvable dans la commande de lancement")
+    _run([java, '-Xshare:dump', f'-XX:SharedClassListFile={classes}', f'-XX:SharedArchiveFile={archive}',
+          '-cp', match.group(1)], distribution_dir)
+
+
+def generate(distribution_dir, runs=MEASURE_RUNS):
+    """Génère l'archive CDS de distribution_dir et mesure le démarrage avant et après
+
+    La JVM doit accepter l'archive avec -Xshare:on ; sinon elle est écartée
+    et CdsError est levée. Lève CdsUnsupported si la JVM ne prend pas en
+    charge CDS.
+
+    Retourne un dictionnaire : archive, mode, java (version majeure),
+    before et after (voir measure).
+    """
+    java = java_binary()
+    mode, major = java_support(java)
+    class_path = _class_path(distribution_dir)
+    archive = archive_path(distribution_dir)
+    os.makedirs(os.path.dirname(archive), exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix='cds-')
+    tmp = f"{archive}.{os.getpid()}.tmp"
+    try:
+        with telemetry.span('cds', mode=mode, java=major) as span:
+            before = measure(distribution_dir, '-Xshare:auto', runs=runs)
+            with telemetry.span('cds.dump', parent=span):
+                _dump(distribution_dir, mode, java, tmp, workdir)
+            if not os.path.exists(tmp):
+                raise CdsError("La JVM n'a pas écrit d'archive")
+            try:
+                # -Xshare:on : la JVM s'arrête au lieu d'ignorer une archive inutilisable
+                _run(_submit(distribution_dir, _java_options(tmp, 'on'), class_path) + ['--version'],
+                     distribution_dir)
+            except CdsError as e:
+                raise CdsError(f"Archive refusée par la JVM : {e}") from e
+            os.replace(tmp, archive)
+            with open(os.path.join(distribution_dir, CDS_DIR, INFO_NAME), 'w') as f:
+                json.dump(dict(_fingerprint(java), mode=mode, version=major), f)
+            after = measure(distribution_dir, _java_options(archive), class_path, runs)
+            span.set(bytes=os.path.getsize(archive), before=before['job'], after=after['job'])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {'archive': archive, 'mode': mode, 'java': major, 'before': before, 'after': after}
+
+
+def format_measure(result):
+    """Tableau des durées de démarrage sans et avec l'archive"""
+    lines = [f"{'':<26} {'sans CDS':>9} {'avec CDS':>9}"]
+    for key, label in (('version', 'spark-submit --version'), ('job', 'job local[*]')):
+        before, after = result['before'][key], result['after'][key]
+        lines.append(f"{label:<26} {before:>8.2f}s {after:>8.2f}s  ({(after - before) / before:+.0%})")
+    return '\n'.join(lines)
@@ -0,0 +1,286 @@
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import downloader
+import extractor
+import lazyimport
+
+localserver = lazyimport.module('localserver')
+
+ARCHIVE_NAME = 'spark.tgz'
+FANOUT = 2
+ATTEMPTS = 3
+# Cibles distantes : adresse d'écoute par défaut, attente d'un pair qui ne sert pas encore
+# l'archive, et durée pendant laquelle les serveurs restent ouverts une fois les cibles locales installées
+LOCAL_HOST = '127.0.0.1'
+ANY_HOST = '0.0.0.0'
+PEER_WAIT = 1800
+PEER_RETRY = 5
+LINGER = 300
+
+_REMOTE = re.compile(r'^([A-Za-z0-9][\w.-]*):(\d+)$')
+
+
+class ClusterError(Exception):
+    """Erreur levée quand la distribution ne peut pas démarrer"""
+
+
+class _Peers:
+    """Nœuds qui possèdent déjà l'archive vérifiée et peuvent la servir
+
+    Chaque pair accepte au plus `fanout` téléchargements simultanés ; un
+    nouveau nœud est servi par le pair le moins chargé. Comme chaque nœud
+    servi devient pair à son tour, la distribution forme un arbre dont la
+    largeur double à chaque génération (avec fanout=2).
+    """
+
+    def __init__(self, fanout):
+        self.fanout = fanout
+        self.uploads = {}
+        self.cond = threading.Condition()
+
+    def add(self, url):
+        with self.cond:
+            self.uploads[url] = 0
+            self.cond.notify_all()
+
+    def acquire(self, exclude=()):
+        """Réserve le pair libre le moins chargé, en évitant ceux de exclude si possible"""
+        with self.cond:
+            def free():
+                available = [u for u, n in self.uploads.items() if n < self.fanout]
+                return [u for u in available if u not in exclude] or available
+            self.cond.wait_for(lambda: free() or not self.uploads)
+            if not self.uploads:
+                raise ClusterError("Plus aucun pair disponible")
+            url = min(free(), key=lambda u: self.uploads[u])
+            self.uploads[url] += 1
+            return url
+
+    def release(self, url):
+        with self.cond:
+            if url in self.uploads:
+                self.uploads[url] -= 1
+            self.cond.notify_all()
+
+
+def parse_target(target):
+    """(hôte, port) pour une cible distante hôte:port, None pour un répertoire local"""
+    match = _REMOTE.match(target)
+    if match is None or os.path.isdir(target):
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def advertised_host(host):
+    """Nom sous lequel les autres machines joignent un serveur qui écoute sur host"""
+    return socket.getfqdn() if host in (ANY_HOST, '') else host
+
+
+class _Node:
+    def __init__(self, target, port, host=LOCAL_HOST):
+        self.target = target
+        self.port = port
+        self.host = host
+        self.archive = os.path.join(target, ARCHIVE_NAME)
+        self.server = None
+        self.public = None
+        self.downloaded = threading.Event()
+        self.source = None
+        self.download = None
+        self.extract = None
+        self.finished = None
+        self.error = None
+
+    def serve(self, peers):
+        """Sert l'archive vérifiée, et elle seule, depuis un répertoire dédié"""
+        self.public = tempfile.mkdtemp(prefix='.serve-', dir=self.target)
+        published = os.path.join(self.public, ARCHIVE_NAME)
+        try:
+            os.link(self.archive, published)
+        except OSError:
+            shutil.copyfile(self.archive, published)
+        self.server = localserver.serve_directory(self.public, host=self.host, port=self.port)
+        # localserver annonce l'adresse d'écoute, inutilisable telle quelle si c'est 0.0.0.0
+        self.server.url = f"http://{advertised_host(self.host)}:{self.server.server_address[1]}/"
+        peers.add(self.server.url + ARCHIVE_NAME)
+
+    def install(self, keep, workers):
+        self.extract = extractor.extract_archive(self.archive, self.target, workers=workers, keep=keep)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.public is not None:
+            shutil.rmtree(self.public, ignore_errors=True)
+            self.public = None
+
+
+def _seed(node, source, connections, peers):
+    """Premier nœud : télécharge depuis l'amont, vérifie, puis sert l'archive"""
+    os.makedirs(node.target, exist_ok=True)
+    node.source = str(source)
+    node.download = downloader.download_file(source, node.archive, connections=connections)
+    node.serve(peers)
+    node.downloaded.set()
+    return node.download['sha512']
+
+
+def _install_seed(node, keep, workers, started):
+    try:
+        node.install(keep, workers)
+    except Exception as e:
+        node.error = e
+    node.finished = time.monotonic() - started
+
+
+def _join(node, sha512, connections, peers, keep, workers, started, remote=(), wait=PEER_WAIT):
+    """Nœud suivant : télécharge depuis un pair, vérifie, sert puis installe
+
+    Un pair distant (URL de remote) qui ne répond pas n'a sans doute pas
+    encore l'archive : il est réessayé toutes les PEER_RETRY secondes
+    pendant wait secondes avant que ses échecs ne comptent.
+    """
+    tried = []
+    failures = 0
+    deadline = time.monotonic() + wait
+    try:
+        os.makedirs(node.target, exist_ok=True)
+        while node.download is None:
+            url = peers.acquire(exclude=tried)
+            pending = False
+            try:
+                node.download = downloader.download_file(url, node.archive, connections=connections,
+                                                         checksum=sha512, progress=False)
+                node.source = url
+            except Exception:
+                tried.append(url)
+                pending = url in remote and time.monotonic() < deadline
+                if not pending:
+                    failures += 1
+                    if failures >= ATTEMPTS:
+                        raise
+            finally:
+                peers.release(url)
+            if pending:
+                time.sleep(PEER_RETRY)
+        node.serve(peers)
+        node.downloaded.set()
+        node.install(keep, workers)
+    except Exception as e:
+        node.error = e
+    finally:
+        node.downloaded.set()
+    node.finished = time.monotonic() - started
+
+
+def distribute(source, targets, fanout=FANOUT, connections=downloader.DOWNLOAD_CONNECTIONS,
+               base_port=0, keep=None, workers=extractor.EXTRACT_WORKERS, keep_archives=False,
+               host=None, linger=LINGER, wait=PEER_WAIT):
+    """Installe Spark sur plusieurs cibles en ne téléchargeant l'archive qu'une fois
+
+    Le premier nœud récupère l'archive depuis source (URL ou MirrorPool) et
+    la vérifie ; chaque nœud suivant la télécharge depuis un nœud déjà
+    servi, la vérifie avec le même SHA-512, puis la sert à son tour par
+    HTTP, depuis un répertoire qui ne contient qu'elle. base_port fixe le port du premier serveur (0 : ports libres
+    choisis par le système).
+
+    targets mêle répertoires d'installation locaux et cibles distantes
+    hôte:port : d'autres machines qui exécutent la même commande, avec la
+    même liste où leur propre entrée est remplacée par leur répertoire.
+    Les nœuds locaux y téléchargent l'archive dès qu'elles la servent, et
+    la servent à leur tour en écoutant sur host (défaut : 0.0.0.0 s'il y a
+    des cibles distantes, 127.0.0.1 sinon). Si la première cible est
+    distante, c'est elle qui télécharge depuis source ; l'archive est
+    alors vérifiée avec le SHA-512 publié. Les serveurs s'arrêtent dès que
+    toutes les cibles locales ont l'archive, sans attendre la fin des
+    extractions ; avec des cibles distantes, ils restent ouverts linger
+    secondes de plus, le temps que les autres machines se servent.
+
+    Retourne un dictionnaire : durée de convergence, détail par nœud local
+    et cibles distantes.
+    """
+    if not targets:
+        raise ClusterError("Aucune cible")
+    remote = {target: parse_target(target) for target in targets if parse_target(target)}
+    local = [target for target in targets if target not in remote]
+    if not local:
+        raise ClusterError("Aucun répertoire local parmi les cibles")
+    if remote and not base_port:
+        raise ClusterError("Port fixe requis avec des cibles distantes : elles le connaissent d'avance")
+    if host is None:
+        host = ANY_HOST if remote else LOCAL_HOST
+    started = time.monotonic()
+    nodes = [_Node(target, base_port + i if base_port else 0, host) for i, target in enumerate(local)]
+    peers = _Peers(fanout)
+    remote_urls = [f"http://{address}:{port}/{ARCHIVE_NAME}" for address, port in remote.values()]
+    for url in remote_urls:
+        peers.add(url)
+    joining = nodes
+    try:
+        if targets[0] in remote:
+            sha512 = downloader.published_checksum(source)
+            if sha512 is None:
+                raise ClusterError(f"Aucun SHA-512 publié pour {source} : archive des pairs invérifiable")
+        else:
+            sha512 = _seed(nodes[0], source, connections, peers)
+            joining = nodes[1:]
+        # Un thread par nœud : chacun patiente jusqu'à ce qu'un pair se libère
+        with ThreadPoolExecutor(max_workers=len(nodes), thread_name_prefix='node') as pool:
+            if joining is not nodes:
+                pool.submit(_install_seed, nodes[0], keep, workers, started)
+            for node in joining:
+                pool.submit(_join, node, sha512, connections, peers, keep, workers, started,
+                            remote_urls, wait)
+            for node in nodes:
+                node.downloaded.wait()
+            if remote and any(node.server is not None for node in nodes):
+                time.sleep(linger)
+            for node in nodes:
+                node.stop()
+    finally:
+        for node in nodes:
+            node.stop()
+            if not keep_archives and os.path.exists(node.archive):
+                os.remove(node.archive)
+    return {
+        'seconds': time.monotonic() - started,
+        'sha512': sha512,
+        'remote': list(remote),
+        'nodes': [
+            {
+                'target': node.target,
+                'source': node.source,
+                'seconds': node.finished,
+                'rate': node.download['rate'] if node.download else None,
+                'files': node.extract['files'] if node.extract else None,
+                'error': str(node.error) if node.error else None,
+            }
+            for node in nodes
+        ],
+    }
+
+
+def format_report(report):
+    """Tableau récapitulatif de la distribution"""
+    lines = [f"{'Cible':<40} {'Source':<32} {'Terminé à':>10} {'Débit':>12}"]
+    for node in report['nodes']:
+        if node['error']:
+            lines.append(f"{node['target']:<40} ❌ {node['error']}")
+            continue
+        rate = downloader.format_rate(node['rate']) if node['rate'] else '-'
+        lines.append(f"{node['target']:<40} {str(node['source'])[:32]:<32} "
+                     f"{node['seconds']:>9.2f}s {rate:>12}")
+    failed = sum(1 for node in report['nodes'] if node['error'])
+    lines.append(f"Convergence : {report['seconds']:.2f} s pour {len(report['nodes'])} cibles"
+                 + (f", {failed} en échec" if failed else "")
+                 + (f" ({len(report['remote'])} machine(s) distante(s))" if report['remote'] else ""))
+    return '\n'.join(lines)
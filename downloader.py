@@ -0,0 +1,810 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import lazyimport
+import telemetry
+
+http_client = lazyimport.module('http.client')
+requests = lazyimport.module('requests')
+tqdm = lazyimport.module('tqdm')
+urllib3 = lazyimport.module('urllib3')
+
+DOWNLOAD_CONNECTIONS = 8
+SEGMENT_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+READ_CHUNK_MAX = 4 * 1024 * 1024
+READ_TARGET = 0.05
+PROGRESS_INTERVAL = 0.1
+TIMEOUT = 30
+RETRIES = 3
+STATE_SUFFIX = '.state.json'
+POOL_HOSTS = 10
+# Rafale autorisée par le seau à jetons, en secondes de débit
+BUCKET_BURST = 0.25
+BUCKET_POLL = 0.05
+
+
+class DownloadError(Exception):
+    """Erreur levée quand un téléchargement ne peut pas aboutir"""
+
+
+class ChecksumError(DownloadError):
+    """Erreur levée quand le SHA-512 de l'archive ne correspond pas"""
+
+
+def _trace_dns(url):
+    """Mesure la résolution DNS à part, uniquement quand la télémétrie est active"""
+    if not telemetry.enabled():
+        return
+    parts = urllib.parse.urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    with telemetry.span('download.dns', host=parts.hostname):
+        try:
+            socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+        except OSError:
+            pass
+
+
+def probe(session, url):
+    """Retourne (taille, accepte_ranges, validateur) pour l'URL donnée"""
+    _trace_dns(url)
+    # Une requête Range sur le premier octet est plus fiable qu'un HEAD :
+    # certains miroirs n'annoncent pas Accept-Ranges mais répondent en 206.
+    # Le span couvre connexion TCP, négociation TLS et premier octet.
+    with telemetry.span('download.connect', url=url) as span:
+        response = session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=TIMEOUT)
+        span.set(status=response.status_code)
+    try:
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        if response.status_code == 206:
+            content_range = response.headers.get('Content-Range', '')
+            total = content_range.rpartition('/')[2]
+            if total.isdigit():
+                return int(total), True, validator
+        if response.status_code == 200:
+            return int(response.headers.get('Content-Length', 0)), False, validator
+        raise DownloadError(f"Status code: {response.status_code}")
+    finally:
+        response.close()
+
+
+def parse_checksum(text):
+    """Extrait le SHA-512 hexadécimal d'un fichier .sha512 d'Apache
+
+    Accepte le format sha512sum ("<hex>  fichier") comme l'ancien format
+    gpg ("fichier: 5D7B3A5C 0A0B ..." réparti sur plusieurs lignes).
+    """
+    if ':' in text.split('\n', 1)[0]:
+        text = text.split(':', 1)[1]
+    else:
+        text = text.split()[0] if text.split() else ''
+    digest = ''.join(c for c in text if c in '0123456789abcdefABCDEF')
+    if len(digest) != 128:
+        raise DownloadError("Fichier de somme SHA-512 illisible")
+    return digest.lower()
+
+
+def fetch_checksum(session, url):
+    """Télécharge le .sha512 publié à côté de l'archive, ou None s'il n'existe pas"""
+    response = session.get(url + '.sha512', timeout=TIMEOUT)
+    if response.status_code != 200:
+        return None
+    return parse_checksum(response.text)
+
+
+class _SingleSource:
+    """Source de téléchargement à URL fixe
+
+    Les sources exposent url() avant chaque requête, report() pour les octets
+    reçus et failed() après une erreur ; mirrors.MirrorPool s'en sert pour
+    basculer d'un miroir à l'autre en cours de téléchargement.
+    """
+
+    mirrored = False
+    attempts = RETRIES
+
+    def __init__(self, url):
+        self._url = url
+        self.key = url
+
+    def url(self):
+        return self._url
+
+    def candidates(self):
+        return [self._url]
+
+    def report(self, url, count):
+        pass
+
+    def failed(self, url):
+        pass
+
+    def __str__(self):
+        return self._url
+
+
+def _as_source(url):
+    return _SingleSource(url) if isinstance(url, str) else url
+
+
+def split_segments(total_size, segment_size=SEGMENT_SIZE):
+    """Découpe [0, total_size) en intervalles (début, fin) inclusifs"""
+    return [
+        (start, min(start + segment_size, total_size) - 1)
+        for start in range(0, total_size, segment_size)
+    ]
+
+
+def preallocate(path, size):
+    """Crée le fichier de destination à sa taille finale"""
+    # On retire l'ancien fichier plutôt que de le tronquer : il peut s'agir
+    # d'un lien physique vers une archive du cache.
+    if os.path.lexists(path):
+        os.remove(path)
+    with open(path, 'wb') as file:
+        if size and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(file.fileno(), 0, size)
+                return
+            except OSError:
+                pass
+        file.truncate(size)
+
+
+class TokenBucket:
+    """Débit global partagé par tous les transferts du processus
+
+    Seau à jetons : rate octets par seconde, avec une rafale d'au plus
+    burst octets. Un transfert qui a dépassé son crédit s'endort le temps
+    de le reconstituer ; le serveur ralentit alors de lui-même, la fenêtre
+    TCP n'étant plus vidée. Quand plusieurs transferts attendent, les
+    jetons vont d'abord à la priorité la plus haute (voir transfer_priority).
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(int(rate * BUCKET_BURST), CHUNK_SIZE)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.waiting = {}
+        self.cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, count, priority=0):
+        """Décompte count octets déjà reçus ; attend que le crédit redevienne positif"""
+        with self.cond:
+            self.waiting[priority] = self.waiting.get(priority, 0) + 1
+            try:
+                while True:
+                    self._refill()
+                    first = priority >= max(self.waiting)
+                    if first and self.tokens >= 0:
+                        # Le crédit peut devenir négatif : la dette retarde les suivants
+                        self.tokens -= count
+                        return
+                    delay = -self.tokens / self.rate if first else BUCKET_POLL
+                    self.cond.wait(max(delay, 0.001))
+            finally:
+                self.waiting[priority] -= 1
+                if not self.waiting[priority]:
+                    del self.waiting[priority]
+                self.cond.notify_all()
+
+
+_bandwidth = None
+_priority = contextvars.ContextVar('transfer_priority', default=0)
+
+
+def limit_bandwidth(rate, burst=None):
+    """Plafonne à rate octets par seconde l'ensemble des téléchargements ; None lève la limite"""
+    global _bandwidth
+    _bandwidth = TokenBucket(rate, burst) if rate else None
+    return _bandwidth
+
+
+@contextlib.contextmanager
+def transfer_priority(priority):
+    """Priorité des transferts lancés dans ce bloc face au seau à jetons (la plus haute passe d'abord)"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _throttle(count):
+    bucket = _bandwidth
+    if bucket is not None and count:
+        bucket.consume(count, _priority.get())
+
+
+class _BodyReader:
+    """Lit le corps d'une réponse par readinto, par blocs de taille adaptative
+
+    Les octets, décodés si la réponse est compressée, sont lus par
+    l'interface publique d'urllib3, qui contrôle aussi que le corps reçu
+    fait bien Content-Length octets. La taille des lectures part de
+    CHUNK_SIZE et double ou diminue de moitié pour qu'une lecture dure
+    environ READ_TARGET secondes : peu d'itérations Python sur un lien
+    rapide, une progression régulière sur un lien lent.
+    """
+
+    def __init__(self, response):
+        self.raw = response.raw
+        # requests ne décode le contenu que dans iter_content
+        self.raw.decode_content = True
+        self.chunk = CHUNK_SIZE
+
+    def readinto(self, view):
+        """Remplit le début de view ; retourne le nombre d'octets lus (0 en fin de corps)"""
+        size = min(len(view), self.chunk)
+        bucket = _bandwidth
+        if bucket is not None:
+            size = min(size, bucket.burst)
+        started = time.monotonic()
+        try:
+            count = self.raw.readinto(view[:size])
+        except (OSError, http_client.HTTPException, urllib3.exceptions.HTTPError) as e:
+            # iter_content n'est pas utilisé : ces erreurs réseau doivent
+            # devenir des RequestException pour la logique de reprise
+            raise requests.ConnectionError(e) from e
+        elapsed = time.monotonic() - started
+        _throttle(count)
+        if count == size and elapsed < READ_TARGET / 2:
+            self.chunk = min(self.chunk * 2, READ_CHUNK_MAX)
+        elif elapsed > READ_TARGET * 2:
+            self.chunk = max(self.chunk // 2, CHUNK_SIZE)
+        return count
+
+
+def _copy_body(response, consume, progress):
+    """Passe le corps de response à consume(vue) par blocs ; retourne le nombre d'octets
+
+    La vue porte sur un tampon réutilisé : consume doit copier ce qu'il
+    garde. La progression est transmise au plus toutes les
+    PROGRESS_INTERVAL secondes, indépendamment de la taille des blocs.
+    """
+    reader = _BodyReader(response)
+    view = memoryview(bytearray(READ_CHUNK_MAX))
+    counter = telemetry.counter('download.bytes')
+    received = pending = 0
+    reported = time.monotonic()
+    while True:
+        count = reader.readinto(view)
+        if not count:
+            break
+        consume(view[:count])
+        received += count
+        pending += count
+        counter.add(count)
+        now = time.monotonic()
+        if now - reported >= PROGRESS_INTERVAL:
+            progress.update(pending)
+            pending = 0
+            reported = now
+    if pending:
+        progress.update(pending)
+    return received
+
+
+def _segment_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class _Progress:
+    """Compteur d'octets partagé entre les threads, affiché avec tqdm
+
+    enabled peut aussi être une fonction callback(fait, total) : elle
+    remplace alors tqdm (interface graphique) et doit rester peu coûteuse,
+    car elle est appelée depuis les threads de téléchargement.
+    """
+
+    def __init__(self, total, initial=0, desc="Téléchargement", enabled=True):
+        self.lock = threading.Lock()
+        self.callback = enabled if callable(enabled) else None
+        self.done = initial
+        self.total = total
+        self.bar = tqdm.tqdm(desc=desc, total=total, initial=initial, unit='B', unit_scale=True,
+                             disable=not enabled or self.callback is not None)
+
+    def update(self, count):
+        with self.lock:
+            self.done += count
+            self.bar.update(count)
+            done = self.done
+        if self.callback is not None:
+            self.callback(done, self.total)
+
+    def close(self):
+        self.bar.close()
+
+
+class _Journal:
+    """Fichier d'état à côté du téléchargement partiel
+
+    Il mémorise l'empreinte de chaque segment écrit, ce qui permet de
+    reprendre au dernier offset vérifié et de cibler les segments à
+    retélécharger quand la somme SHA-512 finale ne correspond pas.
+    """
+
+    def __init__(self, path, url, size, validator, segment_size):
+        self.path = path + STATE_SUFFIX
+        self.lock = threading.Lock()
+        self.header = {'url': url, 'size': size, 'validator': validator,
+                       'segment_size': segment_size}
+        self.segments = {}
+
+    def load(self):
+        """Relit l'état précédent s'il correspond au même fichier distant"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if any(state.get(key) != value for key, value in self.header.items()):
+            return False
+        self.segments = {int(index): digest for index, digest in state.get('segments', {}).items()}
+        return True
+
+    def record(self, index, digest):
+        with self.lock:
+            self.segments[index] = digest
+            self._save()
+
+    def _save(self):
+        state = dict(self.header, segments=self.segments)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        for path in (self.path, self.path + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class _OrderedHasher:
+    """Calcule le SHA-512 au fil de l'eau sur des segments reçus dans le désordre
+
+    Les segments sont hachés dans l'ordre par un thread dédié, puis transmis
+    à `sink` s'il est fourni. Un worker ne peut prendre un segment que s'il
+    reste dans une fenêtre de `window` segments après le prochain segment à
+    hacher, ce qui borne la mémoire.
+    """
+
+    def __init__(self, first_index, count, window, digest=None, sink=None):
+        self.digest = digest or hashlib.sha512()
+        self.sink = sink
+        self.next_index = first_index
+        self.count = count
+        self.window = window
+        self.pending = {}
+        self.error = None
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='sha512', daemon=True)
+        self.thread.start()
+
+    def wait_turn(self, index):
+        """Bloque tant que le segment est trop loin devant le hachage"""
+        with self.cond:
+            self.cond.wait_for(lambda: index < self.next_index + self.window or self.error)
+            if self.error:
+                raise DownloadError("Téléchargement interrompu")
+
+    def add(self, index, data):
+        with self.cond:
+            self.pending[index] = data
+            self.cond.notify_all()
+
+    def fail(self, error):
+        with self.cond:
+            self.error = error
+            self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.next_index >= self.count
+                                   or self.next_index in self.pending or self.error)
+                if self.next_index >= self.count or self.error:
+                    return
+                data = self.pending.pop(self.next_index)
+            self.digest.update(data)
+            if self.sink is not None:
+                try:
+                    self.sink(data)
+                except BaseException as e:
+                    self.fail(e)
+                    return
+            with self.cond:
+                self.next_index += 1
+                self.cond.notify_all()
+
+    def hexdigest(self):
+        self.thread.join()
+        return self.digest.hexdigest()
+
+
+def _get_range(session, source, start, end):
+    """Récupère l'intervalle [start, end] en mémoire
+
+    Après une erreur, ou si la source a basculé vers un autre miroir pendant
+    la réception, la requête reprend là où elle s'était arrêtée.
+    """
+    expected = end - start + 1
+    # Le segment est lu directement à sa place dans un tampon préalloué
+    buffer = bytearray(expected)
+    view = memoryview(buffer)
+    filled = 0
+    failures = 0
+    received = telemetry.counter('download.bytes')
+    while True:
+        url = source.url()
+        headers = {'Range': f'bytes={start + filled}-{end}'}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                if response.status_code != 206:
+                    raise DownloadError(f"Range {start}-{end} refusé. Status code: {response.status_code}")
+                reader = _BodyReader(response)
+                while filled < expected:
+                    count = reader.readinto(view[filled:])
+                    if not count:
+                        break
+                    filled += count
+                    received.add(count)
+                    source.report(url, count)
+                    if source.url() != url:
+                        break
+            if filled == expected:
+                view.release()
+                return buffer
+            if source.url() == url:
+                raise DownloadError(f"Segment {start}-{end} incomplet ({filled} octets reçus)")
+        except (requests.RequestException, DownloadError):
+            failures += 1
+            telemetry.counter('download.retries').add()
+            source.failed(url)
+            if failures >= source.attempts:
+                raise
+            if source.url() == url:
+                time.sleep(2 ** min(failures - 1, 3))
+
+
+def _write_at(path, offset, data):
+    with open(path, 'r+b') as file:
+        file.seek(offset)
+        file.write(data)
+
+
+def _fetch_segment(session, source, path, index, start, end, journal, hasher, progress):
+    hasher.wait_turn(index)
+    data = _get_range(session, source, start, end)
+    if path is not None:
+        _write_at(path, start, data)
+        journal.record(index, _segment_digest(data))
+    hasher.add(index, data)
+    progress.update(len(data))
+
+
+def _run_segments(session, source, path, segments, first, workers, journal, hasher, progress):
+    """Répartit les segments à partir de `first` sur un pool de connexions"""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='segment') as pool:
+        # Chaque segment hérite du contexte de l'appelant (priorité face au seau à jetons)
+        futures = [
+            pool.submit(contextvars.copy_context().run, _fetch_segment, session, source, path, index,
+                        start, end, journal, hasher, progress)
+            for index, (start, end) in enumerate(segments) if index >= first
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException as e:
+            # Une erreur du sink arrive aux workers sous forme d'interruption :
+            # on remonte l'erreur d'origine.
+            cause = hasher.error
+            hasher.fail(cause or e)
+            for future in futures:
+                future.cancel()
+            if cause is not None:
+                raise cause from None
+            raise
+    sha512 = hasher.hexdigest()
+    if hasher.error is not None:
+        raise hasher.error
+    return sha512
+
+
+def _resume_prefix(path, journal, segments, digest):
+    """Vérifie les segments déjà présents sur disque, dans l'ordre
+
+    S'arrête au premier segment absent ou altéré : tout ce qui suit sera
+    retéléchargé. Retourne l'index du premier segment à récupérer.
+    """
+    if not journal.load() or not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as file:
+        for index, (start, end) in enumerate(segments):
+            expected = journal.segments.get(index)
+            if expected is None:
+                break
+            file.seek(start)
+            data = file.read(end - start + 1)
+            if _segment_digest(data) != expected:
+                break
+            digest.update(data)
+        else:
+            index = len(segments)
+    for stale in [i for i in journal.segments if i >= index]:
+        del journal.segments[stale]
+    return index
+
+
+def _repair_segments(session, source, path, segments, journal, connections):
+    """Retélécharge uniquement les segments dont le contenu diffère
+
+    Compare d'abord le disque au journal (corruption locale), puis, si rien
+    ne diffère, retélécharge chaque segment et ne réécrit que ceux dont
+    l'empreinte a changé. Retourne le nombre de segments réécrits.
+    """
+    def differs_on_disk(index):
+        start, end = segments[index]
+        with open(path, 'rb') as file:
+            file.seek(start)
+            return _segment_digest(file.read(end - start + 1)) != journal.segments.get(index)
+
+    def refetch(index):
+        start, end = segments[index]
+        data = _get_range(session, source, start, end)
+        digest = _segment_digest(data)
+        if digest == journal.segments.get(index):
+            return False
+        _write_at(path, start, data)
+        journal.record(index, digest)
+        return True
+
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix='repair') as pool:
+        damaged = [i for i, bad in enumerate(pool.map(differs_on_disk, range(len(segments)))) if bad]
+        candidates = damaged or range(len(segments))
+        return sum(pool.map(refetch, candidates))
+
+
+def _file_sha512(path):
+    digest = hashlib.sha512()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(SEGMENT_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _download_segmented(session, source, path, total_size, validator, connections, expected,
+                        progress=True):
+    segments = split_segments(total_size)
+    # Les miroirs n'ont pas les mêmes ETag : seules taille et empreintes comptent
+    if source.mirrored:
+        validator = None
+    journal = _Journal(path, source.key, total_size, validator, SEGMENT_SIZE)
+    digest = hashlib.sha512()
+    with telemetry.span('download.resume') as span:
+        first = _resume_prefix(path, journal, segments, digest)
+        span.set(segments=first)
+    if first == 0:
+        preallocate(path, total_size)
+    resumed = sum(end - start + 1 for start, end in segments[:first])
+    if resumed and progress:
+        print(f"Reprise du téléchargement à {resumed} octets")
+
+    workers = max(1, min(connections, len(segments) - first))
+    hasher = _OrderedHasher(first, len(segments), window=2 * workers, digest=digest)
+    bar = _Progress(total_size, initial=resumed, enabled=progress)
+    try:
+        sha512 = _run_segments(session, source, path, segments, first, workers,
+                               journal, hasher, bar)
+    finally:
+        bar.close()
+
+    if expected and sha512 != expected:
+        print("❌ Somme SHA-512 incorrecte, nouvelle récupération des segments altérés...")
+        with telemetry.span('download.repair') as span:
+            repaired = _repair_segments(session, source, path, segments, journal, workers)
+            sha512 = _file_sha512(path) if repaired else sha512
+            span.set(segments=repaired)
+        if sha512 != expected:
+            journal.remove()
+            os.remove(path)
+            raise ChecksumError(f"SHA-512 attendu {expected}, obtenu {sha512}")
+        print(f"✓ {repaired} segment(s) récupéré(s) à nouveau")
+    journal.remove()
+    return total_size - resumed, sha512
+
+
+def _download_single(session, source, path, progress, expected):
+    digest = hashlib.sha512()
+    with session.get(source.url(), stream=True, timeout=TIMEOUT) as response:
+        if response.status_code != 200:
+            raise DownloadError(f"Status code: {response.status_code}")
+        preallocate(path, int(response.headers.get('Content-Length') or 0))
+
+        with open(path, 'r+b') as file:
+            def consume(chunk):
+                file.write(chunk)
+                digest.update(chunk)
+
+            received = _copy_body(response, consume, progress)
+            file.truncate(received)
+    sha512 = digest.hexdigest()
+    if expected and sha512 != expected:
+        os.remove(path)
+        raise ChecksumError(f"SHA-512 attendu {expected}, obtenu {sha512}")
+    return received, sha512
+
+
+_session = None
+_session_size = 0
+_session_lock = threading.Lock()
+
+
+def shared_session(connections=DOWNLOAD_CONNECTIONS):
+    """Session HTTP commune au processus (archive Spark, miroirs, jar Maven)
+
+    Les connexions keep-alive restent ouvertes d'une requête à l'autre, par
+    hôte (POOL_HOSTS hôtes au plus). Le pool est agrandi si un appelant
+    demande plus de `connections` simultanées que les précédents.
+    """
+    global _session, _session_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if connections > _session_size:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=connections)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session_size = connections
+        return _session
+
+
+def _prepare_session(session, connections):
+    return session or shared_session(max(connections, 1))
+
+
+def published_checksum(url, session=None):
+    """SHA-512 publié pour url (URL ou MirrorPool), pris sur le premier miroir qui le fournit, ou None"""
+    session = session or shared_session()
+    with telemetry.span('download.checksum'):
+        for candidate in _as_source(url).candidates():
+            try:
+                expected = fetch_checksum(session, candidate)
+            except requests.RequestException:
+                continue
+            if expected:
+                return expected
+    return None
+
+
+def _expected_checksum(session, source, checksum):
+    if checksum is not True:
+        return checksum or None
+    expected = published_checksum(source, session)
+    if expected is None:
+        print("⚠ Aucun fichier .sha512 publié, l'archive ne sera pas vérifiée")
+    return expected
+
+
+def download_file(url, path, connections=DOWNLOAD_CONNECTIONS, session=None, checksum=True,
+                  progress=True):
+    """Télécharge url vers path, en plusieurs connexions si le serveur accepte les Range.
+
+    url peut aussi être une source à plusieurs miroirs (mirrors.MirrorPool).
+
+    Un téléchargement interrompu reprend au dernier segment vérifié. Le
+    SHA-512 est calculé pendant la réception et comparé au fichier .sha512
+    publié (checksum=True), à une valeur hexadécimale fournie, ou ignoré
+    (checksum=False).
+
+    progress affiche une barre tqdm (True), rien (False), ou appelle
+    progress(fait, total) à chaque bloc reçu.
+
+    Retourne un dictionnaire de statistiques (octets, durée, débit, connexions, sha512).
+    """
+    source = _as_source(url)
+    session = _prepare_session(session, connections)
+    started = time.monotonic()
+    total_size, ranges, validator = probe(session, source.url())
+    expected = _expected_checksum(session, source, checksum)
+
+    with telemetry.span('download.transfer', ranges=ranges) as span:
+        transfer = time.monotonic()
+        if ranges and total_size:
+            received, sha512 = _download_segmented(session, source, path, total_size, validator,
+                                                   connections, expected, progress)
+        else:
+            connections = 1
+            bar = _Progress(total_size or None, enabled=progress)
+            try:
+                received, sha512 = _download_single(session, source, path, bar, expected)
+            finally:
+                bar.close()
+        span.set(bytes=received, connections=connections,
+                 rate=received / max(time.monotonic() - transfer, 1e-6))
+
+    return _stats(received, started, connections, sha512, expected)
+
+
+def stream_file(url, sink, connections=DOWNLOAD_CONNECTIONS, session=None, checksum=True):
+    """Télécharge url sans l'écrire sur disque, en passant les octets à sink dans l'ordre
+
+    Les segments sont récupérés en parallèle comme pour download_file, mais
+    remis à sink dans l'ordre du fichier. Aucune reprise n'est possible :
+    une somme SHA-512 incorrecte lève ChecksumError une fois tout transmis,
+    et l'appelant doit jeter ce qu'il a produit.
+    """
+    source = _as_source(url)
+    session = _prepare_session(session, connections)
+    started = time.monotonic()
+    total_size, ranges, _ = probe(session, source.url())
+    expected = _expected_checksum(session, source, checksum)
+
+    progress = _Progress(total_size or None)
+    transfer = time.monotonic()
+    try:
+        if ranges and total_size:
+            segments = split_segments(total_size)
+            connections = max(1, min(connections, len(segments)))
+            hasher = _OrderedHasher(0, len(segments), window=2 * connections, sink=sink)
+            sha512 = _run_segments(session, source, None, segments, 0, connections,
+                                   None, hasher, progress)
+            received = total_size
+        else:
+            connections = 1
+            digest = hashlib.sha512()
+
+            def consume(chunk):
+                digest.update(chunk)
+                sink(bytes(chunk))
+
+            with session.get(source.url(), stream=True, timeout=TIMEOUT) as response:
+                if response.status_code != 200:
+                    raise DownloadError(f"Status code: {response.status_code}")
+                received = _copy_body(response, consume, progress)
+            sha512 = digest.hexdigest()
+    finally:
+        progress.close()
+    telemetry.observe('download.transfer', time.monotonic() - transfer, bytes=received,
+                      connections=connections, rate=received / max(time.monotonic() - transfer, 1e-6))
+
+    if expected and sha512 != expected:
+        raise ChecksumError(f"SHA-512 attendu {expected}, obtenu {sha512}")
+    return _stats(received, started, connections, sha512, expected)
+
+
+def _stats(received, started, connections, sha512, expected):
+    elapsed = max(time.monotonic() - started, 1e-6)
+    return {
+        'bytes': received,
+        'seconds': elapsed,
+        'rate': received / elapsed,
+        'connections': connections,
+        'sha512': sha512,
+        'verified': bool(expected),
+    }
+
+
+def format_rate(rate):
+    """Formate un débit en octets/s pour l'affichage"""
+    for unit in ('o/s', 'Ko/s', 'Mo/s'):
+        if rate < 1024:
+            return f"{rate:.1f} {unit}"
+        rate /= 1024
+    return f"{rate:.1f} Go/s"
@@ -0,0 +1,65 @@
+import collections
+import queue
+import time
+
+UI_FPS = 10
+LOG_LINES = 500
+
+
+class EventBus:
+    """Canal entre les threads de travail et la boucle principale de l'interface
+
+    Les threads de travail n'appellent jamais l'interface : ils déposent des
+    lignes de journal (log), des appels à exécuter sur le thread principal
+    (call) et l'avancement en octets (progress). Le thread principal appelle
+    dispatch() au plus UI_FPS fois par seconde.
+
+    L'avancement est fusionné : seule la dernière valeur compte, si bien
+    qu'un transfert rapide ne produit pas plus de mises à jour que
+    d'images affichées. Le journal est un tampon circulaire de LOG_LINES
+    lignes : un thread bavard ne peut pas faire grossir la mémoire.
+    """
+
+    def __init__(self, log_lines=LOG_LINES):
+        self.calls = queue.SimpleQueue()
+        self.pending = collections.deque(maxlen=log_lines)
+        self.latest = None
+        self.shown = None
+        self.rate = 0.0
+
+    def log(self, message):
+        """Ajoute une ligne au journal (depuis n'importe quel thread)"""
+        self.pending.append(message)
+
+    def call(self, func, *args, **kwargs):
+        """Exécute func(*args, **kwargs) sur le thread principal au prochain dispatch"""
+        self.calls.put((func, args, kwargs))
+
+    def progress(self, done, total):
+        """Avancement en octets ; ne coûte qu'une affectation"""
+        self.latest = (done, total, time.monotonic())
+
+    def dispatch(self):
+        """À appeler sur le thread principal : exécute les appels en attente
+
+        Retourne (nouvelles lignes du journal, avancement ou None si inchangé).
+        L'avancement est un tuple (fait, total, débit en octets/s).
+        """
+        while True:
+            try:
+                func, args, kwargs = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            func(*args, **kwargs)
+        lines = []
+        while self.pending:
+            lines.append(self.pending.popleft())
+        latest = self.latest
+        if latest is None or latest is self.shown:
+            return lines, None
+        if self.shown is not None and latest[2] > self.shown[2]:
+            instant = (latest[0] - self.shown[0]) / (latest[2] - self.shown[2])
+            # Moyenne glissante pour un débit affiché lisible
+            self.rate = instant if not self.rate else 0.7 * self.rate + 0.3 * instant
+        self.shown = latest
+        return lines, (latest[0], latest[1], self.rate)
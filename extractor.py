@@ -0,0 +1,453 @@
+import hashlib
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import lazyimport
+import telemetry
+
+tarfile = lazyimport.module('tarfile')
+
+QUEUE_DEPTH = 16
+WRITE_CHUNK = 1024 * 1024
+POLL_INTERVAL = 0.5
+EXTRACT_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+MAX_INFLIGHT_BYTES = 256 * 1024 * 1024
+
+# Nom des spans de télémétrie pour chaque phase de _Extraction.timings
+PHASE_SPANS = {
+    'lecture': 'extract.read',
+    'attente': 'extract.backpressure',
+    'écriture': 'extract.write',
+    'liens': 'extract.links',
+    'métadonnées': 'extract.metadata',
+}
+
+
+class ExtractionError(Exception):
+    """Erreur levée quand l'archive ne peut pas être extraite"""
+
+
+def _put(target, item, failed):
+    """Dépose item dans une file bornée sans bloquer si l'autre étage a échoué"""
+    while True:
+        if failed():
+            raise ExtractionError("Étage suivant interrompu")
+        try:
+            target.put(item, timeout=POLL_INTERVAL)
+            return
+        except queue.Full:
+            continue
+
+
+class StreamReader:
+    """Objet fichier en lecture alimenté par un autre thread via une file bornée
+
+    Le thread réseau appelle feed() pour chaque bloc reçu puis close(), ou
+    fail() en cas d'erreur. Le lecteur tar consomme les blocs avec read().
+    La file bornée fait remonter la contre-pression jusqu'au réseau.
+    """
+
+    def __init__(self, depth=QUEUE_DEPTH):
+        self.queue = queue.Queue(maxsize=depth)
+        self.buffer = memoryview(b'')
+        self.eof = False
+        self.aborted = False
+
+    def feed(self, data):
+        _put(self.queue, data, lambda: self.aborted)
+
+    def close(self):
+        _put(self.queue, None, lambda: self.aborted)
+
+    def fail(self, error):
+        if not self.aborted:
+            _put(self.queue, error, lambda: self.aborted)
+
+    def abort(self):
+        """Débloque le producteur quand la lecture est abandonnée"""
+        self.aborted = True
+
+    def _next(self):
+        item = self.queue.get()
+        if item is None:
+            self.eof = True
+        elif isinstance(item, BaseException):
+            self.eof = True
+            raise ExtractionError(f"Réception interrompue : {item}") from item
+        else:
+            self.buffer = memoryview(item)
+
+    def read(self, size=-1):
+        while not self.buffer and not self.eof:
+            self._next()
+        if size is None or size < 0:
+            parts = [bytes(self.buffer)]
+            while not self.eof:
+                self._next()
+                parts.append(bytes(self.buffer))
+            self.buffer = memoryview(b'')
+            return b''.join(parts)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return bytes(chunk)
+
+    def drain(self):
+        """Consomme la fin du flux (bourrage tar) pour libérer le producteur"""
+        self.buffer = memoryview(b'')
+        while not self.eof:
+            self._next()
+            self.buffer = memoryview(b'')
+
+
+def safe_path(root, name):
+    """Chemin de destination d'un membre, en refusant toute sortie de root"""
+    name = os.path.normpath(name.lstrip('/'))
+    if name == '..' or name.startswith('..' + os.sep) or os.path.isabs(name):
+        raise ExtractionError(f"Chemin refusé dans l'archive : {name}")
+    return os.path.join(root, name)
+
+
+class _ByteBudget:
+    """Borne la mémoire occupée par les fichiers en attente d'écriture"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.inflight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, size, failed):
+        # Un fichier plus gros que la limite passe seul
+        with self.cond:
+            while self.inflight and self.inflight + size > self.limit:
+                if failed():
+                    raise ExtractionError("Écriture interrompue")
+                self.cond.wait(POLL_INTERVAL)
+            self.inflight += size
+
+    def release(self, size):
+        with self.cond:
+            self.inflight -= size
+            self.cond.notify_all()
+
+
+def find_pigz():
+    """Chemin de pigz s'il est installé, sinon None"""
+    return shutil.which('pigz')
+
+
+def _pigz_stream(fileobj, pigz):
+    """Lance pigz -dc sur fileobj et retourne (processus, thread d'alimentation)"""
+    try:
+        fileno = fileobj.fileno()
+    except (AttributeError, OSError, ValueError):
+        fileno = None
+    if fileno is not None:
+        process = subprocess.Popen([pigz, '-dc'], stdin=fileobj, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        return process, None
+    process = subprocess.Popen([pigz, '-dc'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+
+    def feed():
+        try:
+            for chunk in iter(lambda: fileobj.read(WRITE_CHUNK), b''):
+                process.stdin.write(chunk)
+        except BaseException as e:
+            feeder.error = e
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, name='pigz-feed', daemon=True)
+    feeder.error = None
+    feeder.start()
+    return process, feeder
+
+
+class _Extraction:
+    """Extraction d'une archive tar lue séquentiellement
+
+    Un seul thread lit et décompresse l'archive ; le contenu de chaque
+    fichier est confié à un pool de threads d'écriture, dans la limite de
+    MAX_INFLIGHT_BYTES en mémoire. Les répertoires sont créés dès qu'ils
+    apparaissent, avant les fichiers qu'ils contiennent ; liens, droits et
+    dates sont appliqués en lot à la fin. Les membres refusés par keep ne
+    sont jamais écrits.
+
+    entries décrit chaque membre écrit (type, taille, droits, date et
+    SHA-256 calculé par le thread d'écriture), pour le manifeste. Si
+    reuse(entry) désigne un fichier existant de même contenu, le fichier
+    est créé par lien physique vers celui-ci au lieu d'être écrit ; il
+    garde alors la date du fichier existant.
+    """
+
+    def __init__(self, root, workers, keep=None, reuse=None):
+        self.root = root
+        self.workers = workers
+        self.keep = keep
+        self.reuse = reuse
+        self.budget = _ByteBudget(MAX_INFLIGHT_BYTES)
+        self.created = set()
+        self.directories = []
+        self.metadata = []
+        self.links = []
+        self.entries = {}
+        self.errors = []
+        self.lock = threading.Lock()
+        self.timings = {'lecture': 0.0, 'attente': 0.0, 'écriture': 0.0,
+                        'liens': 0.0, 'métadonnées': 0.0}
+        self.files = 0
+        self.bytes = 0
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.linked_files = 0
+        self.linked_bytes = 0
+
+    def _makedirs(self, path):
+        if path not in self.created:
+            os.makedirs(path, exist_ok=True)
+            self.created.add(path)
+
+    def _link(self, path, entry):
+        existing = self.reuse(entry)
+        if existing is None:
+            return False
+        try:
+            os.link(existing, path)
+        except OSError:
+            return False
+        entry['mtime'] = int(os.stat(path).st_mtime)
+        entry['linked'] = True
+        with self.lock:
+            self.linked_files += 1
+            self.linked_bytes += entry['size']
+        return True
+
+    def _write(self, path, data, entry):
+        started = time.monotonic()
+        try:
+            entry['sha256'] = hashlib.sha256(data).hexdigest()
+            # Un fichier existant est remplacé, jamais réécrit : il peut être partagé par lien physique
+            if os.path.lexists(path):
+                os.remove(path)
+            if self.reuse is not None and self._link(path, entry):
+                return
+            # Une seule écriture non bufferisée par fichier
+            with open(path, 'wb', buffering=0) as file:
+                view = memoryview(data)
+                while view:
+                    view = view[file.write(view):]
+        except BaseException as e:
+            self.errors.append(e)
+        finally:
+            self.budget.release(len(data))
+            with self.lock:
+                self.timings['écriture'] += time.monotonic() - started
+
+    def run(self, fileobj, mode):
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='write')
+        try:
+            with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+                clock = time.monotonic()
+                for member in tar:
+                    if self.errors:
+                        break
+                    path = safe_path(self.root, member.name)
+                    name = os.path.relpath(path, self.root)
+                    if self.keep is not None and not self.keep(member.name):
+                        if not member.isdir():
+                            self.skipped_files += 1
+                            self.skipped_bytes += member.size
+                        continue
+                    if member.isdir():
+                        self._makedirs(path)
+                        self.entries[name] = {'type': 'dir', 'mode': member.mode & 0o7777}
+                        self.directories.append((path, member.mode, member.mtime, self.entries[name]))
+                    elif member.issym() or member.islnk():
+                        self._makedirs(os.path.dirname(path))
+                        self.links.append((path, member))
+                        if member.issym():
+                            self.entries[name] = {'type': 'symlink', 'target': member.linkname}
+                        else:
+                            target = os.path.relpath(safe_path(self.root, member.linkname), self.root)
+                            self.entries[name] = {'type': 'hardlink', 'target': target}
+                    elif member.isfile():
+                        self._makedirs(os.path.dirname(path))
+                        data = tar.extractfile(member).read()
+                        now = time.monotonic()
+                        self.timings['lecture'] += now - clock
+                        self.budget.acquire(len(data), lambda: bool(self.errors))
+                        clock = time.monotonic()
+                        self.timings['attente'] += clock - now
+                        entry = {'type': 'file', 'size': len(data), 'mode': member.mode & 0o7777,
+                                 'mtime': int(member.mtime)}
+                        self.entries[name] = entry
+                        pool.submit(self._write, path, data, entry)
+                        self.metadata.append((path, member.mode, member.mtime, entry))
+                        self.files += 1
+                        self.bytes += len(data)
+                        continue
+                    now = time.monotonic()
+                    self.timings['lecture'] += now - clock
+                    clock = now
+        finally:
+            pool.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+
+    def finish(self):
+        started = time.monotonic()
+        for path, member in self.links:
+            if os.path.lexists(path):
+                os.remove(path)
+            if member.issym():
+                os.symlink(member.linkname, path)
+            elif os.path.exists(safe_path(self.root, member.linkname)):
+                os.link(safe_path(self.root, member.linkname), path)
+            else:
+                raise ExtractionError(f"{member.name} est un lien vers {member.linkname}, "
+                                      "écarté par le profil d'installation")
+        self.timings['liens'] = time.monotonic() - started
+
+        started = time.monotonic()
+
+        def apply(item):
+            path, mode, mtime, entry = item
+            if entry.get('linked'):
+                # Fichier partagé avec une autre installation : ses métadonnées sont déjà les bonnes
+                return
+            os.chmod(path, mode & 0o7777)
+            os.utime(path, (mtime, mtime))
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='meta') as pool:
+            list(pool.map(apply, self.metadata))
+        # Répertoires en dernier, des plus profonds aux moins profonds
+        for item in reversed(self.directories):
+            apply(item)
+        self.timings['métadonnées'] = time.monotonic() - started
+
+
+def extract_stream(fileobj, root, mode='r|gz', workers=EXTRACT_WORKERS, pigz=None, keep=None,
+                   reuse=None):
+    """Extrait une archive tar.gz lue séquentiellement depuis fileobj
+
+    La décompression se fait sur un seul thread, par pigz s'il est présent
+    (pigz=None le cherche dans le PATH, pigz=False le désactive), sinon par
+    le module gzip. Les écritures sont réparties sur `workers` threads.
+    keep(nom) permet d'écarter des membres (voir profiles.member_filter) ;
+    reuse(entrée) de partager les fichiers identiques avec une autre
+    installation (voir versions.content_index).
+
+    Retourne un dictionnaire de statistiques : fichiers, octets, durée,
+    durées par phase (timings) et description des membres écrits (entries,
+    voir manifest.py).
+    """
+    with telemetry.span('extract', root=root) as span:
+        stats = _extract_stream(fileobj, root, mode, workers, pigz, keep, reuse)
+        span.set(files=stats['files'], bytes=stats['bytes'], pigz=stats['pigz'],
+                 rate=stats['bytes'] / max(stats['seconds'], 1e-6))
+        # Durées cumulées sur les threads d'écriture : des observations, pas des intervalles
+        for phase, seconds in stats['timings'].items():
+            telemetry.observe(PHASE_SPANS[phase], seconds)
+    telemetry.counter('extract.files').add(stats['files'])
+    telemetry.counter('extract.bytes').add(stats['bytes'])
+    return stats
+
+
+def _extract_stream(fileobj, root, mode, workers, pigz, keep, reuse):
+    started = time.monotonic()
+    if pigz is None:
+        pigz = find_pigz() if mode == 'r|gz' else False
+    extraction = _Extraction(root, workers, keep, reuse)
+    if pigz:
+        process, feeder = _pigz_stream(fileobj, pigz)
+        failure = None
+        try:
+            extraction.run(process.stdout, 'r|')
+            # Vide la fin du flux (bourrage tar) pour laisser pigz terminer
+            while process.stdout.read(WRITE_CHUNK):
+                pass
+        except BaseException as e:
+            failure = e
+            if process.poll() is None:
+                process.kill()
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+            if feeder is not None:
+                feeder.join()
+        # L'erreur d'origine (lecture, pigz) prime sur celle de tarfile qui en découle
+        if feeder is not None and feeder.error is not None:
+            raise ExtractionError(f"Lecture interrompue : {feeder.error}") from feeder.error
+        if returncode > 0:
+            message = process.stderr.read().decode(errors='replace').strip()
+            raise ExtractionError(f"pigz a échoué : {message}") from failure
+        if failure is not None:
+            raise failure
+    else:
+        extraction.run(fileobj, mode)
+    extraction.finish()
+    return {
+        'files': extraction.files,
+        'bytes': extraction.bytes,
+        'seconds': time.monotonic() - started,
+        'timings': extraction.timings,
+        'pigz': bool(pigz),
+        'skipped_files': extraction.skipped_files,
+        'skipped_bytes': extraction.skipped_bytes,
+        'linked_files': extraction.linked_files,
+        'linked_bytes': extraction.linked_bytes,
+        'entries': extraction.entries,
+    }
+
+
+def extract_archive(path, root, workers=EXTRACT_WORKERS, pigz=None, keep=None, reuse=None):
+    """Extrait l'archive tar.gz path dans root"""
+    with open(path, 'rb') as source:
+        return extract_stream(source, root, workers=workers, pigz=pigz, keep=keep, reuse=reuse)
+
+
+def format_timings(stats):
+    """Résumé lisible des durées par phase"""
+    phases = ', '.join(f"{name} {seconds:.2f} s" for name, seconds in stats['timings'].items())
+    tool = stats.get('codec') or ('pigz' if stats.get('pigz') else 'gzip')
+    summary = f"{stats['files']} fichiers en {stats['seconds']:.2f} s ({tool} ; {phases})"
+    if stats.get('skipped_files'):
+        summary += (f", {stats['skipped_files']} fichiers ignorés par le profil "
+                    f"({stats['skipped_bytes'] / 1024 ** 2:.1f} Mo économisés)")
+    if stats.get('linked_files'):
+        summary += (f", {stats['linked_files']} fichiers partagés avec d'autres versions "
+                    f"({stats['linked_bytes'] / 1024 ** 2:.1f} Mo non écrits)")
+    return summary
+
+
+def promote(staging, destination):
+    """Déplace le contenu extrait de staging vers destination, en remplaçant l'existant"""
+    for entry in os.listdir(staging):
+        target = os.path.join(destination, entry)
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        elif os.path.lexists(target):
+            os.remove(target)
+        os.rename(os.path.join(staging, entry), target)
+    os.rmdir(staging)
+
+
+def promote_entries(staging, destination, names):
+    """Déplace les seules entrées names de staging vers destination, sans toucher au reste de l'arborescence"""
+    for name in sorted(names):
+        source = os.path.join(staging, name)
+        target = os.path.join(destination, name)
+        if os.path.isdir(source) and not os.path.islink(source):
+            os.makedirs(target, exist_ok=True)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        os.replace(source, target)
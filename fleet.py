@@ -0,0 +1,399 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import downloader
+import extractor
+import manifest
+import maven
+import mirrors
+import profiles
+import telemetry
+import versions
+
+PLAN_WORKERS = 4
+PLAN_KEYS = {'bandwidth', 'workers', 'connections', 'extract_workers', 'mirrors', 'defaults', 'targets'}
+TARGET_DEFAULTS = {
+    'name': None,
+    'variant': versions.DEFAULT_VARIANT,
+    'profile': profiles.DEFAULT_PROFILE,
+    'priority': 0,
+    'packages': [],
+    'repositories': [],
+    'activate': False,
+}
+TARGET_KEYS = set(TARGET_DEFAULTS) | {'version', 'install_dir'}
+
+PENDING = 'en attente'
+INSTALLED = 'installée'
+PRESENT = 'déjà installée'
+FAILED = 'échec'
+
+_output = threading.Lock()
+
+
+class PlanError(Exception):
+    """Erreur levée quand le plan de déploiement est invalide"""
+
+
+def load_plan(path):
+    """Lit un plan de déploiement JSON et le valide (voir validate)"""
+    try:
+        with open(path) as f:
+            document = json.load(f)
+    except (OSError, ValueError) as e:
+        raise PlanError(f"Plan illisible ({path}) : {e}") from e
+    return validate(document)
+
+
+def _target(index, raw, defaults):
+    if not isinstance(raw, dict):
+        raise PlanError(f"Cible {index} : objet JSON attendu")
+    target = {**TARGET_DEFAULTS, **defaults, **raw}
+    unknown = sorted(set(target) - TARGET_KEYS)
+    if unknown:
+        raise PlanError(f"Cible {index} : clés inconnues {', '.join(unknown)}")
+    for key in ('version', 'install_dir'):
+        if not target.get(key):
+            raise PlanError(f"Cible {index} : {key} manquant")
+    if target['variant'] not in versions.VARIANTS:
+        raise PlanError(f"Cible {index} : variante inconnue {target['variant']}")
+    if target['profile'] not in profiles.PROFILES:
+        raise PlanError(f"Cible {index} : profil inconnu {target['profile']}")
+    if not isinstance(target['priority'], int):
+        raise PlanError(f"Cible {index} : priority doit être un entier")
+    target['install_dir'] = os.path.abspath(os.path.expanduser(target['install_dir']))
+    target['distribution'] = versions.distribution(target['version'], target['variant'])
+    target['name'] = target['name'] or f"{target['distribution']}@{target['install_dir']}"
+    return target
+
+
+def _base(url):
+    """URL de base d'un miroir, terminée par "/" comme dans mirrors.Mirror"""
+    return url.rstrip('/') + '/'
+
+
+def validate(document):
+    """Vérifie un plan et complète chaque cible avec les valeurs de defaults puis celles par défaut
+
+    Un plan est un objet JSON : targets (liste de cibles, chacune avec
+    version, install_dir et, au choix, name, variant, profile, priority,
+    packages, repositories, activate), defaults (valeurs communes aux
+    cibles), et les réglages du processus : bandwidth (Mo/s pour
+    l'ensemble des transferts), workers, connections, extract_workers,
+    mirrors.
+    """
+    if not isinstance(document, dict) or not isinstance(document.get('targets'), list) \
+            or not document['targets']:
+        raise PlanError("Le plan doit contenir une liste targets non vide")
+    unknown = sorted(set(document) - PLAN_KEYS)
+    if unknown:
+        raise PlanError(f"Clés inconnues dans le plan : {', '.join(unknown)}")
+    plan_mirrors = document.get('mirrors')
+    if plan_mirrors is not None and (not isinstance(plan_mirrors, list)
+                                     or not all(isinstance(m, str) and m for m in plan_mirrors)):
+        raise PlanError("mirrors doit être une liste d'URL")
+    defaults = document.get('defaults', {})
+    targets = [_target(i, raw, defaults) for i, raw in enumerate(document['targets'], 1)]
+    seen, activated = set(), set()
+    for target in targets:
+        key = (target['install_dir'], target['distribution'])
+        if key in seen:
+            raise PlanError(f"{target['distribution']} apparaît deux fois dans {target['install_dir']}")
+        seen.add(key)
+        if target['activate']:
+            if target['install_dir'] in activated:
+                raise PlanError(f"Plusieurs cibles activent {versions.CURRENT_LINK} "
+                                f"dans {target['install_dir']}")
+            activated.add(target['install_dir'])
+    return {
+        'bandwidth': document.get('bandwidth'),
+        'workers': int(document.get('workers', PLAN_WORKERS)),
+        'connections': int(document.get('connections', downloader.DOWNLOAD_CONNECTIONS)),
+        'extract_workers': int(document.get('extract_workers', extractor.EXTRACT_WORKERS)),
+        'mirrors': [_base(mirror) for mirror in plan_mirrors] if plan_mirrors else None,
+        'targets': targets,
+    }
+
+
+class _PriorityPool:
+    """Pool de threads partagé qui sert d'abord les tâches les plus prioritaires
+
+    À priorité égale, les tâches passent dans l'ordre de soumission. Une
+    tâche peut en soumettre d'autres (l'extraction d'une archive qui vient
+    d'arriver). Ses transferts héritent de sa priorité face au seau à
+    jetons de downloader.
+    """
+
+    def __init__(self, workers):
+        self.queue = []
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.threads = [threading.Thread(target=self._work, name=f'fleet-{i}', daemon=True)
+                        for i in range(max(workers, 1))]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, priority, func, *args):
+        future = Future()
+        with self.cond:
+            heapq.heappush(self.queue, (-priority, next(self.order), future, func, args))
+            self.cond.notify()
+        return future
+
+    def _work(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.queue or self.closed)
+                if not self.queue:
+                    return
+                priority, _, future, func, args = heapq.heappop(self.queue)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with downloader.transfer_priority(-priority):
+                    result = func(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def shutdown(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+
+class _Target:
+    """Une cible du plan et son état pendant l'exécution"""
+
+    def __init__(self, spec, url):
+        self.spec = spec
+        self.url = url
+        self.status = PENDING
+        self.finished = None
+        self.files = None
+        self.jars = 0
+        self.error = None
+
+    def installed(self):
+        """True si le manifeste de la cible correspond déjà à la même archive et au même profil"""
+        try:
+            document = manifest.load(self.spec['install_dir'], self.spec['distribution'])
+        except manifest.ManifestError:
+            return False
+        return document is not None and document.get('url') == self.url \
+            and document.get('profile') == self.spec['profile']
+
+
+class _Archive:
+    """Archive partagée par les cibles d'une même version et variante"""
+
+    def __init__(self, url, path, targets):
+        self.url = url
+        self.path = path
+        self.targets = targets
+        self.priority = max(target.spec['priority'] for target in targets)
+        self.dest = os.path.join(targets[0].spec['install_dir'], f".fleet-{os.path.basename(path)}")
+        self.download = None
+        self.failed = None
+        self.remaining = len(targets)
+        self.lock = threading.Lock()
+
+    def release(self):
+        """Supprime l'archive quand la dernière cible qui l'attendait l'a extraite"""
+        with self.lock:
+            self.remaining -= 1
+            last = self.remaining == 0
+        if last and os.path.exists(self.dest):
+            os.remove(self.dest)
+
+
+def _say(message):
+    # Une ligne entière à la fois : les tâches du pool affichent en même temps
+    with _output:
+        print(message)
+
+
+def _fetch(archive, plan, bases, cache, pool, origin, parent):
+    """Télécharge une archive, puis confie son extraction au pool pour chacune de ses cibles"""
+
+    def download(path):
+        session = downloader.shared_session(plan['connections'])
+        source = bases[0] + archive.path
+        if len(bases) > 1:
+            source = mirrors.select(bases, archive.path, session)
+        archive.download = downloader.download_file(source, path, connections=plan['connections'],
+                                                    session=session, progress=False)
+        return archive.download['sha512']
+
+    try:
+        with telemetry.span('fleet.download', parent=parent, archive=archive.path):
+            os.makedirs(os.path.dirname(archive.dest), exist_ok=True)
+            if cache is None:
+                download(archive.dest)
+            elif cache.fetch(archive.url, archive.dest, download):
+                _say(f"✓ {os.path.basename(archive.path)} servie depuis le cache ({cache.root})")
+    except Exception:
+        archive.failed = time.monotonic() - origin
+        raise
+    if archive.download:
+        _say(f"✓ {os.path.basename(archive.path)} téléchargée "
+              f"({downloader.format_rate(archive.download['rate'])})")
+    return [pool.submit(target.spec['priority'], _install, target, archive, plan, origin, parent)
+            for target in archive.targets]
+
+
+def _install(target, archive, plan, origin, parent):
+    """Extrait l'archive dans la cible, enregistre son manifeste, ajoute ses jar et l'active"""
+    spec = target.spec
+    try:
+        with telemetry.span('fleet.target', parent=parent, target=spec['name']):
+            root = spec['install_dir']
+            reuse = versions.content_index(root, exclude=spec['distribution'])
+            stats = extractor.extract_archive(archive.dest, root, workers=plan['extract_workers'],
+                                              keep=profiles.member_filter(spec['profile']), reuse=reuse)
+            manifest.write(root, spec['distribution'], stats['entries'], version=spec['version'],
+                           url=target.url, profile=spec['profile'])
+            target.files = stats['files']
+            _finish(target)
+        target.status = INSTALLED
+        _say(f"✓ {spec['name']} installée ({stats['files']} fichiers)")
+    finally:
+        target.finished = time.monotonic() - origin
+        archive.release()
+
+
+def _finish(target):
+    """Jar Maven et lien current de la cible, qu'elle vienne d'être extraite ou non"""
+    spec = target.spec
+    distribution_dir = os.path.join(spec['install_dir'], spec['distribution'])
+    if spec['packages']:
+        jars = os.path.join(distribution_dir, 'jars')
+        os.makedirs(jars, exist_ok=True)
+        repositories = [maven.Repository(r) for r in spec['repositories'] or [maven.MAVEN_CENTRAL]]
+        target.jars = len(maven.prefetch(spec['packages'], jars, repositories)['added'])
+    if spec['activate']:
+        versions.switch(spec['install_dir'], spec['distribution'])
+
+
+def _present(target, origin):
+    try:
+        _finish(target)
+        target.status = PRESENT
+        _say(f"✓ {target.spec['name']} déjà installée")
+    finally:
+        target.finished = time.monotonic() - origin
+
+
+def _settle(target, future):
+    try:
+        future.result()
+    except Exception as e:
+        target.status = FAILED
+        target.error = str(e)
+        _say(f"❌ {target.spec['name']} : {str(e)}")
+
+
+def execute(plan, bases, cache=None, archive_base=None):
+    """Installe toutes les cibles de plan avec un seul pool de plan['workers'] threads
+
+    Chaque archive (version et variante) n'est téléchargée qu'une fois,
+    depuis bases (URL de miroirs, sondés s'il y en a plusieurs) ou depuis
+    cache, puis extraite dans chacune de ses cibles. L'URL enregistrée
+    dans les manifestes et utilisée comme clé du cache part de
+    archive_base (par défaut, le dernier miroir). Les cibles de plus
+    haute priorité passent d'abord, au téléchargement comme à
+    l'extraction. Une cible en échec n'arrête pas les autres.
+
+    Retourne un dictionnaire : ok, seconds, bytes et le détail par cible.
+    """
+    origin = time.monotonic()
+    bases = [_base(base) for base in bases]
+    archive_base = _base(archive_base or bases[-1])
+    groups = {}
+    targets = []
+    for spec in plan['targets']:
+        path = versions.archive_path(spec['version'], spec['variant'])
+        target = _Target(spec, archive_base + path)
+        targets.append(target)
+        groups.setdefault(path, []).append(target)
+    pool = _PriorityPool(plan['workers'])
+    waiting = []
+    archives = []
+    try:
+        with telemetry.span('fleet', targets=len(targets), workers=plan['workers']) as span:
+            for path, group in groups.items():
+                todo = [target for target in group if not target.installed()]
+                for target in group:
+                    if target not in todo:
+                        future = pool.submit(target.spec['priority'], _present, target, origin)
+                        waiting.append((target, future))
+                if todo:
+                    archive = _Archive(archive_base + path, path, todo)
+                    archives.append(archive)
+                    waiting.append((archive, pool.submit(archive.priority, _fetch, archive, plan, bases,
+                                                         cache, pool, origin, span)))
+            for owner, future in waiting:
+                if isinstance(owner, _Target):
+                    _settle(owner, future)
+                    continue
+                try:
+                    installs = future.result()
+                except Exception as e:
+                    _say(f"❌ {os.path.basename(owner.path)} : {str(e)}")
+                    for target in owner.targets:
+                        target.status, target.error, target.finished = FAILED, str(e), owner.failed
+                        owner.release()
+                    continue
+                for target, install in zip(owner.targets, installs):
+                    _settle(target, install)
+            received = sum(archive.download['bytes'] for archive in archives if archive.download)
+            span.set(bytes=received)
+    finally:
+        pool.shutdown()
+    return {
+        'ok': all(target.status != FAILED for target in targets),
+        'seconds': time.monotonic() - origin,
+        'bytes': received,
+        'archives': sum(1 for archive in archives if archive.download),
+        'targets': [
+            {
+                'name': target.spec['name'],
+                'distribution': target.spec['distribution'],
+                'install_dir': target.spec['install_dir'],
+                'priority': target.spec['priority'],
+                'status': target.status,
+                'seconds': target.finished,
+                'files': target.files,
+                'jars': target.jars,
+                'error': target.error,
+            }
+            for target in targets
+        ],
+    }
+
+
+def format_report(report):
+    """Tableau récapitulatif du plan, cible par cible, dans l'ordre où elles ont abouti"""
+    lines = [f"{'Cible':<44} {'Priorité':>8} {'Terminé à':>10}  État"]
+    for target in sorted(report['targets'], key=lambda t: t['seconds'] or 0):
+        status = target['status'] + (f" ({target['error']})" if target['error'] else "")
+        if target['jars']:
+            status += f", {target['jars']} jar ajouté(s)"
+        lines.append(f"{target['name'][:44]:<44} {target['priority']:>8} "
+                     f"{target['seconds'] or 0:>9.2f}s  {status}")
+    failed = sum(1 for target in report['targets'] if target['status'] == FAILED)
+    rate = report['bytes'] / report['seconds'] if report['seconds'] else 0
+    lines.append(f"{len(report['targets'])} cibles en {report['seconds']:.2f} s, "
+                 f"{report['archives']} archive(s) téléchargée(s) "
+                 f"({report['bytes'] / 1024 ** 2:.1f} Mo, {downloader.format_rate(rate)})"
+                 + (f", {failed} en échec" if failed else ""))
+    return '\n'.join(lines)
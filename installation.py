@@ -1,89 +1,593 @@
+import argparse
 import os
-import subprocess
-import requests
-from tqdm import tqdm
+import shutil
+import tempfile
+import threading
+
+import artifact_cache
+import bundle
+import cds
+import cluster
+import downloader
+import extractor
+import fleet
+import manifest
+import maven
+import mirrors
+import native
+import packages
+import probes
+import profiles
+import pycompile
+import smoke
+import stages
+import telemetry
+import tuning
+import versions
 
 SPARK_VERSION = "3.4.1"
-SPARK_URL = f"https://archive.apache.org/dist/spark/spark-{SPARK_VERSION}/spark-{SPARK_VERSION}-bin-hadoop3.tgz"
+SPARK_VARIANT = versions.DEFAULT_VARIANT
+SPARK_PATH = versions.archive_path(SPARK_VERSION, SPARK_VARIANT)
+SPARK_MIRRORS = [
+    "https://dlcdn.apache.org/spark/",
+    "https://archive.apache.org/dist/spark/",
+]
+SPARK_URL = SPARK_MIRRORS[-1] + SPARK_PATH
+SPARK_DIST = versions.distribution(SPARK_VERSION, SPARK_VARIANT)
 INSTALL_DIR = "/opt/spark"
 
-def check_prerequisites():
-    """Vérifie si Java et Python sont installés"""
+def select_version(version=SPARK_VERSION, variant=SPARK_VARIANT):
+    """Choisit la version de Spark et la variante Hadoop sur lesquelles porte le script"""
+    global SPARK_VERSION, SPARK_VARIANT, SPARK_PATH, SPARK_URL, SPARK_DIST
+    SPARK_VERSION, SPARK_VARIANT = version, variant
+    SPARK_PATH = versions.archive_path(version, variant)
+    SPARK_URL = SPARK_MIRRORS[-1] + SPARK_PATH
+    SPARK_DIST = versions.distribution(version, variant)
+
+def report_prerequisites(results):
+    """Affiche le résultat des sondes et retourne True si tous les prérequis sont satisfaits"""
+    ok = True
+    for name, result in results.items():
+        label = name.capitalize()
+        if result['ok']:
+            origin = " (cache)" if result['cached'] else ""
+            print(f"✓ {label} {result['version']} est installé{origin}")
+        else:
+            print(f"❌ {result['message']}")
+            ok = False
+    return ok
+
+def check_prerequisites(use_cache=True):
+    """Vérifie en parallèle les versions de Java et Python installées"""
     print("Vérification des prérequis...")
-    
-    # Vérifier Java
-    try:
-        subprocess.run(['java', '-version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print("✓ Java est installé")
-    except subprocess.CalledProcessError:
-        print("❌ Java n'est pas installé")
-        return False
+    return report_prerequisites(probes.check_all(use_cache=use_cache))
 
-    # Vérifier Python
+def provision_packages(results):
+    """Installe en une seule transaction apt les paquets des prérequis manquants"""
+    needed = packages.missing(results)
+    if not needed:
+        return True
+    print(f"\nInstallation des paquets manquants : {' '.join(needed)}...")
     try:
-        subprocess.run(['python', '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print("✓ Python est installé")
-    except subprocess.CalledProcessError:
-        print("❌ Python n'est pas installé")
+        packages.install(needed)
+    except Exception as e:
+        print(f"❌ Erreur lors de l'installation des paquets : {str(e)}")
         return False
-    
-    return True
+    return check_prerequisites(use_cache=False)
 
-def download_spark():
-    """Télécharge Apache Spark"""
+def select_source(bases=None):
+    """Sonde les miroirs et retourne la source de téléchargement à utiliser"""
+    if not bases:
+        return SPARK_URL
+    print("Sondage des miroirs...")
+    return mirrors.select(bases, SPARK_PATH, downloader.shared_session())
+
+def download_spark(connections=downloader.DOWNLOAD_CONNECTIONS, cache=None, bases=None):
+    """Télécharge Apache Spark, ou le copie depuis le cache local"""
     print(f"\nTéléchargement de Apache Spark {SPARK_VERSION}...")
     os.makedirs(INSTALL_DIR, exist_ok=True)
     
     try:
-        response = requests.get(SPARK_URL, stream=True)
-        if response.status_code != 200:
-            print(f"❌ Erreur lors du téléchargement. Status code: {response.status_code}")
-            return False
-            
         spark_archive = os.path.join(INSTALL_DIR, 'spark.tgz')
-        total_size = int(response.headers.get('Content-Length', 0))
-        
-        with open(spark_archive, "wb") as file, tqdm(
-            desc="Téléchargement", 
-            total=total_size, 
-            unit='B', 
-            unit_scale=True
-        ) as bar:
-            for chunk in response.iter_content(chunk_size=1024):
-                file.write(chunk)
-                bar.update(len(chunk))
+        results = []
+
+        def download(path):
+            source = select_source(bases)
+            results.append(downloader.download_file(source, path, connections=connections))
+            return results[-1]['sha512']
+
+        if cache is None:
+            download(spark_archive)
+        elif cache.fetch(SPARK_URL, spark_archive, download):
+            print(f"✓ Archive servie depuis le cache ({cache.root})")
+            return True
+        stats = results[-1]
         
-        print("✓ Téléchargement terminé")
+        print(f"✓ Téléchargement terminé ({stats['connections']} connexion(s), "
+              f"{downloader.format_rate(stats['rate'])})")
+        if stats['verified']:
+            print("✓ Somme SHA-512 vérifiée")
         return True
         
     except Exception as e:
         print(f"❌ Erreur lors du téléchargement : {str(e)}")
         return False
 
-def extract_spark():
+def extract_spark(workers=extractor.EXTRACT_WORKERS, profile=profiles.DEFAULT_PROFILE):
     """Extrait l'archive Spark"""
-    print("\nExtraction de Spark...")
+    print(f"\nExtraction de Spark (profil {profile})...")
+    # Extraction à côté puis remplacement d'un bloc : rien d'une installation précédente
+    # (autre profil) ne subsiste, et un échec laisse la version en place intacte
+    staging = tempfile.mkdtemp(prefix='.spark-', dir=INSTALL_DIR)
     try:
-        import tarfile
-        with tarfile.open(os.path.join(INSTALL_DIR, 'spark.tgz'), 'r:gz') as tar_ref:
-            tar_ref.extractall(INSTALL_DIR)
-        os.remove(os.path.join(INSTALL_DIR, 'spark.tgz'))
-        print("✓ Extraction terminée")
+        archive = os.path.join(INSTALL_DIR, 'spark.tgz')
+        stats = extractor.extract_archive(archive, staging, workers=workers,
+                                          keep=profiles.member_filter(profile),
+                                          reuse=versions.content_index(INSTALL_DIR, exclude=SPARK_DIST))
+        extractor.promote(staging, INSTALL_DIR)
+        os.remove(archive)
+        print(f"✓ Extraction terminée : {extractor.format_timings(stats)}")
+        record_manifest(stats, profile)
         return True
     except Exception as e:
+        shutil.rmtree(staging, ignore_errors=True)
         print(f"❌ Erreur lors de l'extraction : {str(e)}")
         return False
 
+def stream_spark(connections=downloader.DOWNLOAD_CONNECTIONS, cache=None, bases=None,
+                 workers=extractor.EXTRACT_WORKERS, profile=profiles.DEFAULT_PROFILE):
+    """Télécharge et extrait Spark en un seul passage, sans archive temporaire"""
+    print(f"\nTéléchargement et extraction de Apache Spark {SPARK_VERSION}...")
+    os.makedirs(INSTALL_DIR, exist_ok=True)
+    cached = cache.lookup(SPARK_URL) if cache is not None else None
+    if cached is not None:
+        print(f"✓ Archive servie depuis le cache ({cache.root})")
+        return extract_cached(cached, workers, profile)
+    staging = tempfile.mkdtemp(prefix='.spark-', dir=INSTALL_DIR)
+    reader = extractor.StreamReader()
+    result = {}
+
+    def receive():
+        try:
+            source = select_source(bases)
+            result['stats'] = downloader.stream_file(source, reader.feed, connections=connections)
+            reader.close()
+        except BaseException as e:
+            result['error'] = e
+            reader.fail(e)
+
+    receiver = threading.Thread(target=receive, name='receive', daemon=True)
+    receiver.start()
+    try:
+        extracted = extractor.extract_stream(reader, staging, workers=workers,
+                                             keep=profiles.member_filter(profile),
+                                             reuse=versions.content_index(INSTALL_DIR, exclude=SPARK_DIST))
+        reader.drain()
+        receiver.join()
+        if 'error' in result:
+            raise result['error']
+        extractor.promote(staging, INSTALL_DIR)
+        record_manifest(extracted, profile)
+    except Exception as e:
+        reader.abort()
+        receiver.join()
+        shutil.rmtree(staging, ignore_errors=True)
+        print(f"❌ Erreur lors du téléchargement ou de l'extraction : {str(e)}")
+        return False
+
+    stats = result['stats']
+    print(f"✓ Extraction terminée : {extractor.format_timings(extracted)}")
+    print(f"✓ Débit moyen : {downloader.format_rate(stats['rate'])}")
+    if stats['verified']:
+        print("✓ Somme SHA-512 vérifiée")
+    return True
+
+def extract_cached(archive, workers=extractor.EXTRACT_WORKERS, profile=profiles.DEFAULT_PROFILE):
+    """Extrait directement une archive du cache, sans la copier"""
+    staging = tempfile.mkdtemp(prefix='.spark-', dir=INSTALL_DIR)
+    try:
+        with open(archive, 'rb') as source:
+            extracted = extractor.extract_stream(source, staging, workers=workers,
+                                                 keep=profiles.member_filter(profile),
+                                                 reuse=versions.content_index(INSTALL_DIR, exclude=SPARK_DIST))
+        extractor.promote(staging, INSTALL_DIR)
+        record_manifest(extracted, profile)
+    except Exception as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        print(f"❌ Erreur lors de l'extraction : {str(e)}")
+        return False
+    print(f"✓ Extraction terminée : {extractor.format_timings(extracted)}")
+    return True
+
+def record_manifest(stats, profile):
+    """Enregistre chemin, taille, droits et empreinte de chaque fichier installé"""
+    manifest.write(INSTALL_DIR, SPARK_DIST, stats['entries'], version=SPARK_VERSION,
+                   url=SPARK_URL, profile=profile)
+
+def installed_manifest(profile=None):
+    """Manifeste de l'installation existante, s'il correspond à la version (et au profil) voulus"""
+    try:
+        document = manifest.load(INSTALL_DIR, SPARK_DIST)
+    except manifest.ManifestError:
+        return None
+    if document is None or document.get('url') != SPARK_URL:
+        return None
+    if profile is not None and document.get('profile') != profile:
+        return None
+    return document
+
+def verify_spark(document, fast=False):
+    """Compare l'installation existante à son manifeste"""
+    print(f"\nVérification de {os.path.join(INSTALL_DIR, SPARK_DIST)}...")
+    try:
+        result = manifest.verify(INSTALL_DIR, document, fast=fast)
+    except Exception as e:
+        print(f"❌ Erreur lors de la vérification : {str(e)}")
+        return None
+    print(manifest.format_report(result))
+    if result['damaged']:
+        print(f"❌ {len(result['damaged'])} entrées différentes du manifeste")
+    else:
+        print("✓ Installation conforme au manifeste")
+    return result
+
+def remove_damaged(document, damaged):
+    """Supprime les entrées à restaurer et retourne le filtre keep qui les désigne"""
+    keep = manifest.repair_filter(document, damaged)
+    # Supprimer avant de réécrire : un fichier abîmé peut être un lien physique
+    for name, entry in document['entries'].items():
+        path = os.path.join(INSTALL_DIR, name)
+        if entry['type'] != 'dir' and keep(name) and os.path.lexists(path) and not os.path.isdir(path):
+            os.remove(path)
+    return keep
+
+def repair_spark(document, damaged, connections=downloader.DOWNLOAD_CONNECTIONS, cache=None,
+                 bases=None, workers=extractor.EXTRACT_WORKERS):
+    """Restaure depuis l'archive (en cache si possible) les seules entrées endommagées"""
+    print(f"\nRestauration de {len(damaged)} entrées...")
+    archive = cache.lookup(SPARK_URL) if cache is not None else None
+    downloaded = archive is None
+    if downloaded:
+        if not download_spark(connections, cache, bases):
+            return False
+        archive = os.path.join(INSTALL_DIR, 'spark.tgz')
+    try:
+        keep = remove_damaged(document, damaged)
+        stats = extractor.extract_archive(archive, INSTALL_DIR, workers=workers, keep=keep)
+        if downloaded:
+            os.remove(archive)
+    except Exception as e:
+        print(f"❌ Erreur lors de la restauration : {str(e)}")
+        return False
+    expected = document['entries']
+    mismatched = [name for name, entry in stats['entries'].items()
+                  if entry.get('sha256') != expected.get(name, {}).get('sha256')]
+    if mismatched:
+        print(f"❌ L'archive ne correspond plus au manifeste ({len(mismatched)} fichiers), "
+              "réinstallez Spark")
+        return False
+    print(f"✓ {stats['files']} fichiers restaurés en {stats['seconds']:.2f} s")
+    return True
+
+def bundle_spark(args, cache=None, bases=None):
+    """Construit un bundle hors ligne : Spark réduit au profil, jar Maven ajoutés, codec rapide
+
+    Le bundle s'installe ensuite sans réseau avec --bundle.
+    """
+    output = args.output or f"{SPARK_DIST}-{args.profile}{bundle.BUNDLE_SUFFIX}"
+    print(f"\nConstruction du bundle {output} (codec {args.codec}, profil {args.profile})...")
+    workdir = tempfile.mkdtemp(prefix='.bundle-', dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        archive = args.archive
+        if archive is None:
+            archive = os.path.join(workdir, 'spark.tgz')
+
+            def download(path):
+                return downloader.download_file(select_source(bases), path,
+                                                connections=args.connections)['sha512']
+
+            if cache is None:
+                download(archive)
+            else:
+                cache.fetch(SPARK_URL, archive, download)
+        tree = os.path.join(workdir, 'tree')
+        extracted = extractor.extract_archive(archive, tree, workers=args.extract_workers,
+                                              keep=profiles.member_filter(args.profile))
+        print(f"✓ Archive extraite : {extractor.format_timings(extracted)}")
+        coordinates = package_coordinates(args)
+        if coordinates:
+            jars = os.path.join(tree, SPARK_DIST, 'jars')
+            os.makedirs(jars, exist_ok=True)
+            repositories = [maven.Repository(r) for r in args.maven_repos or [maven.MAVEN_CENTRAL]]
+            added = maven.prefetch(coordinates, jars, repositories)
+            print(f"✓ {len(added['added'])} jar Maven ajouté(s) ({added['bytes'] / 1024 ** 2:.1f} Mo)")
+        info = {'version': SPARK_VERSION, 'variant': SPARK_VARIANT, 'distribution': SPARK_DIST,
+                'profile': args.profile, 'packages': coordinates,
+                'source': os.path.basename(archive) if args.archive else SPARK_URL}
+        result = bundle.create(tree, output, info, args.codec)
+        source_size = os.path.getsize(archive)
+    except Exception as e:
+        print(f"❌ Erreur lors de la construction du bundle : {str(e)}")
+        return False
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"✓ Bundle écrit en {result['seconds']:.2f} s : {result['entries']} entrées, "
+          f"{result['bytes'] / 1024 ** 2:.1f} Mo (archive d'origine {source_size / 1024 ** 2:.1f} Mo)")
+    return True
+
+def install_bundle(path, workers=extractor.EXTRACT_WORKERS):
+    """Installe Spark depuis un bundle, ou répare l'installation existante à partir de lui"""
+    print(f"\nInstallation depuis le bundle {path}...")
+    try:
+        info = bundle.read_info(path)
+        document = installed_manifest(info['profile'])
+        if document is not None:
+            result = verify_spark(document, fast=True)
+            if result is None:
+                return False
+            if not result['damaged']:
+                return True
+            # Le bundle est vérifié dans un répertoire à part avant de toucher à la distribution
+            staging = tempfile.mkdtemp(prefix='.spark-', dir=INSTALL_DIR)
+            try:
+                stats = bundle.extract(path, staging, workers=workers,
+                                       keep=manifest.repair_filter(document, result['damaged']))
+                remove_damaged(document, result['damaged'])
+                extractor.promote_entries(staging, INSTALL_DIR, stats['entries'])
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            print(f"✓ {stats['files']} fichiers restaurés en {stats['seconds']:.2f} s")
+            return True
+        os.makedirs(INSTALL_DIR, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.spark-', dir=INSTALL_DIR)
+        try:
+            stats = bundle.extract(path, staging, workers=workers,
+                                   reuse=versions.content_index(INSTALL_DIR, exclude=SPARK_DIST))
+            extractor.promote(staging, INSTALL_DIR)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        record_manifest(stats, info['profile'])
+    except Exception as e:
+        print(f"❌ Erreur lors de l'installation du bundle : {str(e)}")
+        return False
+    print(f"✓ Extraction terminée : {extractor.format_timings(stats)}")
+    return True
+
+def package_coordinates(args):
+    """Coordonnées Maven de --packages (option répétable, valeurs séparées par des virgules)"""
+    return [c.strip() for value in args.packages or [] for c in value.split(',') if c.strip()]
+
+def prefetch_jars(coordinates, repositories=None):
+    """Résout des coordonnées Maven et dépose les jar dans le répertoire jars de Spark
+
+    Les jobs n'ont plus à résoudre spark.jars.packages avec Ivy au démarrage.
+    """
+    print(f"\nRésolution de {len(coordinates)} dépendance(s) Maven...")
+    jars = os.path.join(INSTALL_DIR, SPARK_DIST, 'jars')
+    try:
+        os.makedirs(jars, exist_ok=True)
+        result = maven.prefetch(coordinates, jars,
+                                [maven.Repository(r) for r in repositories or [maven.MAVEN_CENTRAL]])
+    except Exception as e:
+        print(f"❌ Erreur lors de la récupération des jar : {str(e)}")
+        return False
+    for name in result['added']:
+        print(f"  + {name}")
+    for conflict in result['conflicts']:
+        print(f"⚠ Ignoré, une autre version est déjà installée : {conflict}")
+    print(f"✓ {len(result['added'])} jar ajouté(s) ({result['bytes'] / 1024 ** 2:.1f} Mo), "
+          f"{len(result['present'])} déjà présent(s)")
+    return True
+
+def activate_spark():
+    """Fait pointer INSTALL_DIR/current vers la version installée"""
+    try:
+        previous = versions.current(INSTALL_DIR)
+        versions.switch(INSTALL_DIR, SPARK_DIST)
+    except Exception as e:
+        print(f"❌ Erreur lors du changement de version : {str(e)}")
+        return False
+    if previous and previous != SPARK_DIST:
+        print(f"✓ {versions.CURRENT_LINK} : {previous} -> {SPARK_DIST}")
+    else:
+        print(f"✓ {versions.CURRENT_LINK} -> {SPARK_DIST}")
+    return True
+
+def list_spark():
+    """Affiche les versions installées côte à côte"""
+    active = versions.current(INSTALL_DIR)
+    names = versions.installed(INSTALL_DIR)
+    if not names:
+        print(f"Aucune version installée dans {INSTALL_DIR}")
+    for name in names:
+        document = manifest.load(INSTALL_DIR, name)
+        files = [e for e in document['entries'].values() if e['type'] == 'file']
+        shared = sum(e['size'] for e in files if e.get('linked'))
+        total = sum(e['size'] for e in files)
+        print(f"{'*' if name == active else ' '} {name:<40} profil {document.get('profile', '?'):<16} "
+              f"{total / 1024 ** 2:8.1f} Mo ({shared / 1024 ** 2:.1f} Mo partagés)")
+
+def distribute_spark(targets, fanout=cluster.FANOUT, connections=downloader.DOWNLOAD_CONNECTIONS,
+                     bases=None, workers=extractor.EXTRACT_WORKERS, profile=profiles.DEFAULT_PROFILE,
+                     base_port=0, host=None, linger=cluster.LINGER):
+    """Installe Spark sur plusieurs cibles, chaque cible servant l'archive aux suivantes"""
+    print(f"\nDistribution de Apache Spark {SPARK_VERSION} sur {len(targets)} cibles...")
+    try:
+        report = cluster.distribute(select_source(bases), targets, fanout=fanout,
+                                    connections=connections, base_port=base_port,
+                                    keep=profiles.member_filter(profile), workers=workers,
+                                    host=host, linger=linger)
+    except Exception as e:
+        print(f"❌ Erreur lors de la distribution : {str(e)}")
+        return False
+    print(cluster.format_report(report))
+    return not any(node['error'] for node in report['nodes'])
+
+def fleet_spark(path, cache=None, bases=None, bandwidth=None):
+    """Exécute un plan de déploiement : plusieurs versions et cibles dans un seul processus"""
+    try:
+        plan = fleet.load_plan(path)
+    except fleet.PlanError as e:
+        print(f"❌ {str(e)}")
+        return False
+    rate = bandwidth or plan['bandwidth']
+    print(f"\nPlan {path} : {len(plan['targets'])} cible(s), {plan['workers']} workers"
+          + (f", débit plafonné à {rate:g} Mo/s" if rate else ""))
+    if rate and not bandwidth:
+        downloader.limit_bandwidth(rate * 1024 ** 2)
+    try:
+        report = fleet.execute(plan, plan['mirrors'] or bases or [SPARK_MIRRORS[-1]], cache,
+                               archive_base=SPARK_MIRRORS[-1])
+    except Exception as e:
+        print(f"❌ Erreur lors de l'exécution du plan : {str(e)}")
+        return False
+    print(f"\n{fleet.format_report(report)}")
+    return report['ok']
+
+def tune_spark(explain=False, write=True, host=True):
+    """Génère conf/spark-defaults.conf et conf/spark-env.sh d'après la machine
+
+    Les options de l'archive CDS et des bibliothèques natives de Hadoop
+    s'y ajoutent si elles sont installées ; host=False n'écrit que celles-ci.
+    """
+    print("\nRéglage de Spark pour cette machine...")
+    distribution_dir = os.path.join(INSTALL_DIR, SPARK_DIST)
+    try:
+        machine = tuning.inspect_host()
+        settings = (tuning.recommend(machine) if host else []) + cds.settings(distribution_dir) \
+            + native.settings(distribution_dir)
+        if explain:
+            print(tuning.format_explain(machine, settings))
+        if not write:
+            return True
+        settings, unusable = tuning.prepare_local_dirs(settings)
+        for directory, reason in unusable.items():
+            print(f"⚠ {directory} écarté de spark.local.dir : {reason}")
+        result = tuning.apply(os.path.join(distribution_dir, 'conf'), settings)
+    except Exception as e:
+        print(f"❌ Erreur lors du réglage : {str(e)}")
+        return False
+    for filename, entry in result.items():
+        print(f"✓ {entry['path']} {'écrit' if entry['changed'] else 'inchangé'}")
+        if entry['skipped']:
+            print(f"⚠ Conservé tel que défini à la main : {', '.join(entry['skipped'])}")
+    return True
+
+def precompile_python(pythons=None, unpack=False):
+    """Précompile $SPARK_HOME/python pour les interpréteurs de PySpark"""
+    print("\nPrécompilation de PySpark...")
+    candidates = pycompile.interpreters(pythons)
+    if not candidates:
+        print("⚠ Aucun interpréteur Python trouvé, précompilation ignorée")
+        return True
+    try:
+        result = pycompile.precompile(os.path.join(INSTALL_DIR, SPARK_DIST), candidates, unpack)
+        if result['unpacked']:
+            manifest.mark_unpacked(INSTALL_DIR, SPARK_DIST, [os.path.join(SPARK_DIST, 'python', name)
+                                                             for name in result['unpacked']])
+    except pycompile.PycompileError as e:
+        print(f"⚠ Précompilation ignorée : {str(e)}")
+        return True
+    except Exception as e:
+        print(f"❌ Erreur lors de la précompilation : {str(e)}")
+        return False
+    for name in result['unpacked']:
+        print(f"✓ python/{name} décompressé")
+    print(pycompile.format_measure(result))
+    for python, stats in result['interpreters'].items():
+        if stats.get('errors'):
+            print(f"⚠ {stats['errors']} fichier(s) non compilé(s) par {python}")
+    return True
+
+def cds_spark(tune=True):
+    """Génère l'archive CDS des classes de Spark et l'ajoute à la configuration"""
+    print("\nGénération de l'archive CDS (démarrage de la JVM)...")
+    try:
+        result = cds.generate(os.path.join(INSTALL_DIR, SPARK_DIST))
+    except cds.CdsUnsupported as e:
+        print(f"⚠ Archive CDS ignorée : {str(e)}")
+        return True
+    except cds.CdsError as e:
+        print(f"⚠ Archive CDS non générée : {str(e)}")
+        return True
+    except Exception as e:
+        print(f"❌ Erreur lors de la génération de l'archive CDS : {str(e)}")
+        return False
+    print(f"✓ Archive {result['mode']} pour Java {result['java']} : {result['archive']} "
+          f"({os.path.getsize(result['archive']) / 1024 ** 2:.1f} Mo)")
+    print(cds.format_measure(result))
+    return tune_spark(host=tune)
+
+def native_spark(source=None, version=None, cache=None):
+    """Installe les bibliothèques natives de Hadoop dans lib/native et vérifie qu'elles se chargent"""
+    print("\nInstallation des bibliothèques natives de Hadoop...")
+    distribution_dir = os.path.join(INSTALL_DIR, SPARK_DIST)
+    try:
+        result = native.install(distribution_dir, source, version, cache)
+    except Exception as e:
+        print(f"❌ Erreur lors de l'installation des bibliothèques natives : {str(e)}")
+        return False
+    print(f"✓ Hadoop {result['version']} : {len(result['libraries'])} bibliothèque(s) dans {result['dir']}")
+    try:
+        loaded = native.check(distribution_dir)
+    except native.NativeError as e:
+        print(f"⚠ Chargement non vérifié : {str(e)}")
+        return True
+    print(native.format_check(loaded))
+    if not native.loaded(loaded):
+        # Inutile de les déclarer à Spark : il garderait les implémentations Java
+        shutil.rmtree(result['dir'], ignore_errors=True)
+        print("⚠ libhadoop ne se charge pas sur cette machine : bibliothèques retirées")
+    return True
+
+def smoke_spark(smoke_dir=smoke.SMOKE_DIR, threshold=smoke.THRESHOLD):
+    """Lance Spark sur quelques charges courtes hors ligne et compare les mesures aux références
+
+    Retourne False si un job échoue ou si le nœud est nettement en retrait
+    sur ses mesures précédentes ou sur les autres nœuds de smoke_dir.
+    """
+    print("\nValidation de l'installation (shuffle, Parquet, UDF en local[*])...")
+    try:
+        result = smoke.run(os.path.join(INSTALL_DIR, SPARK_DIST))
+    except smoke.SmokeError as e:
+        print(f"❌ Validation impossible : {str(e)}")
+        return False
+    except Exception as e:
+        print(f"❌ Erreur lors de la validation : {str(e)}")
+        return False
+    node = smoke.node_name()
+    try:
+        document = smoke.record(smoke_dir, node, SPARK_DIST, tuning.inspect_host()['cpus'], result)
+    except OSError as e:
+        print(f"❌ Mesures non enregistrées dans {smoke_dir} : {str(e)}")
+        return False
+    references = smoke.baselines(smoke_dir, node)
+    print(smoke.format_run(document['runs'][-1], references))
+    flagged = smoke.compare(document['runs'][-1], references, threshold)
+    if flagged:
+        print(smoke.format_flags(flagged))
+        print(f"❌ {node} en retrait de plus de {threshold:.0f} % sur la référence")
+        return False
+    print(f"✓ Mesures enregistrées dans {os.path.join(smoke_dir, node + '.json')} "
+          f"({len(document['runs'])} exécution(s), {references['nodes']} autre(s) nœud(s))")
+    return True
+
 def setup_environment():
     """Configure les variables d'environnement"""
     print("\nConfiguration des variables d'environnement...")
     try:
-        spark_home = os.path.join(INSTALL_DIR, f"spark-{SPARK_VERSION}-bin-hadoop3")
+        # SPARK_HOME suit le lien current : changer de version ne touche pas au shell
+        spark_home = os.path.join(INSTALL_DIR, versions.CURRENT_LINK)
+        exports = [f'export SPARK_HOME={spark_home}', f'export PATH=$PATH:{spark_home}/bin']
         
         # Ajouter les variables d'environnement
-        with open(os.path.expanduser("~/.bashrc"), "a") as f:
-            f.write(f'\nexport SPARK_HOME={spark_home}')
-            f.write(f'\nexport PATH=$PATH:{spark_home}/bin')
+        bashrc = os.path.expanduser("~/.bashrc")
+        existing = open(bashrc).read().splitlines() if os.path.exists(bashrc) else []
+        with open(bashrc, "a") as f:
+            for line in exports:
+                if line not in existing:
+                    f.write(f'\n{line}')
         
         print("✓ Variables d'environnement configurées")
         print(f"\nPour activer les changements, exécutez: source ~/.bashrc")
@@ -92,24 +596,408 @@ def setup_environment():
         print(f"❌ Erreur lors de la configuration : {str(e)}")
         return False
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Installation de Apache Spark")
+    parser.add_argument(
+        'command', nargs='?', default='install',
+        choices=['install', 'verify', 'repair', 'list', 'switch', 'bundle', 'tune', 'cds', 'precompile',
+                 'check', 'fleet', 'native', 'smoke'],
+        help="install (défaut), verify : comparer l'installation à son manifeste, "
+             "repair : restaurer les fichiers endommagés, list : versions installées, "
+             "switch : activer une version déjà installée, bundle : construire un bundle hors ligne, "
+             "tune : régler spark-defaults.conf et spark-env.sh pour cette machine, "
+             "cds : générer l'archive CDS des classes de Spark, "
+             "precompile : précompiler PySpark pour les interpréteurs de la machine, "
+             "check : vérifier les prérequis sans rien télécharger, "
+             "fleet : exécuter le plan de déploiement --plan, "
+             "native : installer et vérifier les bibliothèques natives de Hadoop, "
+             "smoke : mesurer Spark sur quelques charges courtes et comparer aux références"
+    )
+    parser.add_argument(
+        '--spark-version', default=SPARK_VERSION,
+        help="Version de Spark à installer, vérifier ou activer"
+    )
+    parser.add_argument(
+        '--variant', default=SPARK_VARIANT, choices=versions.VARIANTS,
+        help="Variante de la distribution (version de Hadoop embarquée)"
+    )
+    parser.add_argument(
+        '--fast', action='store_true',
+        help="verify/repair : comparer seulement taille, droits et date, sans relire les fichiers"
+    )
+    parser.add_argument(
+        '--connections', type=int, default=downloader.DOWNLOAD_CONNECTIONS,
+        help="Nombre de connexions parallèles pour le téléchargement (1 = une seule connexion)"
+    )
+    parser.add_argument(
+        '--stream', action='store_true',
+        help="Extraire pendant le téléchargement, sans écrire l'archive sur disque"
+    )
+    parser.add_argument(
+        '--extract-workers', type=int, default=extractor.EXTRACT_WORKERS,
+        help="Nombre de threads d'écriture pendant l'extraction"
+    )
+    parser.add_argument(
+        '--profile', default=profiles.DEFAULT_PROFILE, choices=sorted(profiles.PROFILES),
+        help="Profil d'installation : parties de la distribution à installer"
+    )
+    parser.add_argument(
+        '--bundle', metavar='FICHIER',
+        help="Installer depuis un bundle hors ligne (version, variante et profil sont lus dans le bundle)"
+    )
+    parser.add_argument(
+        '--archive', metavar='FICHIER',
+        help="bundle : archive Spark .tgz à reconditionner (défaut : téléchargée, ou prise dans le cache)"
+    )
+    parser.add_argument(
+        '--output', metavar='FICHIER',
+        help="bundle : fichier à écrire (défaut : <distribution>-<profil>.bundle)"
+    )
+    parser.add_argument(
+        '--codec', default=bundle.DEFAULT_CODEC, choices=bundle.CODECS,
+        help="bundle : compression (zstd ou lz4, décompression bien plus rapide que gzip)"
+    )
+    parser.add_argument(
+        '--no-tune', action='store_true',
+        help="Laisser la configuration de Spark par défaut au lieu de la régler pour cette machine"
+    )
+    parser.add_argument(
+        '--cds', action='store_true',
+        help="Après l'installation, générer une archive CDS des classes de Spark (démarrage de la JVM "
+             "plus rapide) et mesurer le gain"
+    )
+    parser.add_argument(
+        '--no-precompile', action='store_true',
+        help="Ne pas précompiler $SPARK_HOME/python en .pyc après l'installation"
+    )
+    parser.add_argument(
+        '--python', action='append', dest='pythons', metavar='INTERPRETEUR',
+        help="Interpréteur supplémentaire pour lequel précompiler PySpark (répétable ; "
+             "défaut : PYSPARK_PYTHON, PYSPARK_DRIVER_PYTHON et python3)"
+    )
+    parser.add_argument(
+        '--unzip-python', action='store_true',
+        help="Remplacer pyspark.zip et py4j-*-src.zip par leur contenu, importé sans lecture de zip"
+    )
+    parser.add_argument(
+        '--explain', action='store_true',
+        help="Afficher chaque réglage et sa justification (avec tune : sans rien écrire)"
+    )
+    parser.add_argument(
+        '--native', action='store_true',
+        help="Installer libhadoop et les codecs natifs dans lib/native (CRC32C, zlib, zstd natifs)"
+    )
+    parser.add_argument(
+        '--native-source', metavar='SOURCE',
+        help="Bibliothèques natives : répertoire lib/native, archive hadoop-*.tar.gz ou URL de miroir "
+             f"(défaut : {native.HADOOP_MIRROR}) ; implique --native"
+    )
+    parser.add_argument(
+        '--hadoop-version', metavar='VERSION',
+        help="Version de Hadoop des bibliothèques natives (défaut : celle des jar de Spark)"
+    )
+    parser.add_argument(
+        '--smoke', action='store_true',
+        help="Après l'installation, lancer Spark sur des charges courtes hors ligne (shuffle, Parquet, "
+             "UDF Python) et signaler un nœud en retrait sur ses mesures précédentes ou sur la flotte"
+    )
+    parser.add_argument(
+        '--smoke-dir', default=smoke.SMOKE_DIR, metavar='REPERTOIRE',
+        help="Répertoire des mesures de référence, un fichier <nœud>.json par machine (partagé "
+             "entre les nœuds pour comparer à la flotte)"
+    )
+    parser.add_argument(
+        '--smoke-threshold', type=float, default=smoke.THRESHOLD, metavar='POURCENT',
+        help="Écart en %% au-delà duquel une mesure est signalée"
+    )
+    parser.add_argument(
+        '--cluster', nargs='+', metavar='CIBLE',
+        help="Mode grappe : installer sur plusieurs cibles, chaque cible servant les suivantes. Une cible "
+             "est un répertoire local, ou hôte:port pour une autre machine qui exécute la même commande "
+             "(la première cible télécharge depuis l'amont)"
+    )
+    parser.add_argument(
+        '--fanout', type=int, default=cluster.FANOUT,
+        help="Mode grappe : nombre de cibles servies simultanément par chaque cible"
+    )
+    parser.add_argument(
+        '--cluster-port', type=int, default=0,
+        help="Mode grappe : premier port HTTP (les suivants sont consécutifs ; 0 = ports libres, "
+             "interdit avec des cibles distantes)"
+    )
+    parser.add_argument(
+        '--cluster-host', metavar='ADRESSE',
+        help=f"Mode grappe : adresse d'écoute des serveurs (défaut : {cluster.ANY_HOST} avec des cibles "
+             f"distantes, {cluster.LOCAL_HOST} sinon)"
+    )
+    parser.add_argument(
+        '--cluster-linger', type=float, default=cluster.LINGER, metavar='SECONDES',
+        help="Mode grappe : durée pendant laquelle l'archive reste servie aux machines distantes "
+             "une fois les cibles locales installées"
+    )
+    parser.add_argument(
+        '--plan', metavar='FICHIER',
+        help="fleet : plan JSON des versions, profils et répertoires cibles à installer"
+    )
+    parser.add_argument(
+        '--bandwidth', type=float, metavar='MO/S',
+        help="Débit maximal de l'ensemble des téléchargements, en Mo/s (défaut : illimité, "
+             "ou la valeur bandwidth du plan)"
+    )
+    parser.add_argument(
+        '--cache-dir', default=artifact_cache.CACHE_DIR,
+        help="Répertoire du cache d'archives partagé"
+    )
+    parser.add_argument(
+        '--cache-max-size', type=int, default=artifact_cache.CACHE_MAX_BYTES // 1024 ** 2,
+        help="Taille maximale du cache en Mo (les archives les moins récemment utilisées sont supprimées)"
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help="Ne pas utiliser le cache d'archives"
+    )
+    parser.add_argument(
+        '--trace', metavar='FICHIER',
+        help="Écrire les mesures de chaque étape (spans) dans un fichier JSON lines"
+    )
+    parser.add_argument(
+        '--prometheus', metavar='FICHIER',
+        help="Écrire les métriques pour le textfile collector de node_exporter (fichier .prom)"
+    )
+    parser.add_argument(
+        '--timings', action='store_true',
+        help="Afficher à la fin le détail des durées, octets et débits par étape"
+    )
+    parser.add_argument(
+        '--no-apt', action='store_true',
+        help="Ne pas installer les prérequis manquants avec apt-get"
+    )
+    parser.add_argument(
+        '--refresh-probes', action='store_true',
+        help="Relancer java et python pour vérifier les prérequis au lieu d'utiliser le cache"
+    )
+    parser.add_argument(
+        '--packages', action='append', metavar='COORDONNEES',
+        help="Jar Maven à installer avec leurs dépendances, groupe:artefact:version séparés par "
+             "des virgules (comme spark.jars.packages)"
+    )
+    parser.add_argument(
+        '--maven-repo', action='append', dest='maven_repos', metavar='URL',
+        help=f"Dépôt Maven, URL ou répertoire local au même format (répétable ; défaut : {maven.MAVEN_CENTRAL})"
+    )
+    parser.add_argument(
+        '--mirror', action='append', dest='mirrors', metavar='URL',
+        help="URL de base d'un miroir (répétable) ; le plus rapide est choisi"
+    )
+    parser.add_argument(
+        '--no-mirrors', action='store_true',
+        help=f"Télécharger directement depuis {SPARK_URL}"
+    )
+    return parser.parse_args(argv)
+
+def install_spark(args, cache, bases):
+    """Télécharge et extrait Spark, ou répare l'installation existante si elle a un manifeste"""
+    document = installed_manifest(args.profile)
+    if document is not None:
+        result = verify_spark(document, fast=True)
+        if result is None:
+            return False
+        if not result['damaged']:
+            return True
+        return repair_spark(document, result['damaged'], args.connections, cache, bases,
+                            args.extract_workers)
+    
+    if args.stream:
+        return stream_spark(args.connections, cache, bases, args.extract_workers, args.profile)
+    
+    if not download_spark(args.connections, cache, bases):
+        return False
+    
+    return extract_spark(args.extract_workers, args.profile)
+
+def plan_install(args, cache, bases, listener=None):
+    """Graphe des étapes de l'installation
+
+    Chaque étape déclare celles dont elle dépend : la vérification et
+    l'installation des prérequis par apt se déroulent pendant le
+    téléchargement de Spark.
+    """
+    plan = stages.Scheduler(listener)
+    state = {}
+    
+    def probe():
+        print("Vérification des prérequis...")
+        state['results'] = probes.check_all(use_cache=not args.refresh_probes)
+        # Un prérequis manquant n'est bloquant que si apt ne peut pas l'installer
+        return report_prerequisites(state['results']) or not args.no_apt
+    
+    plan.add('prerequisites', probe, label="Prérequis")
+    plan.add('packages', lambda: provision_packages(state['results']),
+             requires=['prerequisites'], label="Paquets apt")
+    if args.bundle:
+        plan.add('spark', lambda: install_bundle(args.bundle, args.extract_workers),
+                 label="Installation du bundle")
+        installed = 'spark'
+    elif args.stream or installed_manifest(args.profile) is not None:
+        plan.add('spark', lambda: install_spark(args, cache, bases), label="Installation de Spark")
+        installed = 'spark'
+    else:
+        plan.add('download', lambda: download_spark(args.connections, cache, bases),
+                 label="Téléchargement")
+        plan.add('extract', lambda: extract_spark(args.extract_workers, args.profile),
+                 requires=['download'], label="Extraction")
+        installed = 'extract'
+    coordinates = package_coordinates(args)
+    if coordinates:
+        plan.add('jars', lambda: prefetch_jars(coordinates, args.maven_repos),
+                 requires=[installed], label="Jars Maven")
+        installed = 'jars'
+    if args.native or args.native_source:
+        # La vérification du chargement lance Java, éventuellement installé par apt
+        plan.add('native', lambda: native_spark(args.native_source, args.hadoop_version, cache),
+                 requires=[installed, 'packages'], label="Bibliothèques natives")
+        installed = 'native'
+    if not args.no_tune:
+        plan.add('tuning', lambda: tune_spark(args.explain), requires=[installed], label="Réglages")
+        installed = 'tuning'
+    ready = [installed, 'packages']
+    if not args.no_precompile:
+        # Les interpréteurs installés par apt doivent être présents
+        plan.add('python', lambda: precompile_python(args.pythons, args.unzip_python),
+                 requires=[installed, 'packages'], label="Précompilation PySpark")
+        ready.append('python')
+    plan.add('activate', activate_spark, requires=ready, label="Activation")
+    plan.add('environment', setup_environment, requires=['activate'], label="Environnement")
+    if args.cds:
+        # Java doit être installé : l'archive est générée en lançant Spark
+        plan.add('cds', lambda: cds_spark(tune=not args.no_tune), requires=['activate'], label="Archive CDS")
+    if args.smoke:
+        # Mesurer la configuration finale, sans job concurrent (génération de l'archive CDS)
+        plan.add('smoke', lambda: smoke_spark(args.smoke_dir, args.smoke_threshold),
+                 requires=['environment'] + (['cds'] if args.cds else []), label="Validation")
+    return plan
+
+def telemetry_sinks(args):
+    """Sinks de télémétrie demandés sur la ligne de commande"""
+    sinks = []
+    if args.trace:
+        sinks.append(telemetry.JsonLinesSink(args.trace))
+    if args.prometheus:
+        sinks.append(telemetry.PrometheusSink(args.prometheus))
+    if args.timings:
+        sinks.append(telemetry.SummarySink(lambda text: print(f"\n{text}")))
+    return sinks
+
+def main(argv=None):
+    args = parse_args(argv)
+    select_version(args.spark_version, args.variant)
+    if args.bundle:
+        # Le bundle décrit lui-même la version, la variante et le profil qu'il contient
+        try:
+            info = bundle.read_info(args.bundle)
+        except (OSError, bundle.BundleError) as e:
+            print(f"❌ Bundle illisible : {str(e)}")
+            return
+        select_version(info['version'], info['variant'])
+        args.profile = info['profile']
+    telemetry.configure(telemetry_sinks(args))
+    if args.bandwidth:
+        downloader.limit_bandwidth(args.bandwidth * 1024 ** 2)
+    try:
+        with telemetry.span('installer', command=args.command, version=SPARK_DIST):
+            run(args)
+    finally:
+        telemetry.close()
+
+def run(args):
     print("=== Installation de Apache Spark ===\n")
     
-    if not check_prerequisites():
-        print("\n❌ Veuillez installer les prérequis manquants avant de continuer.")
+    if args.command == 'list':
+        list_spark()
         return
     
-    if not download_spark():
+    if args.command == 'switch':
+        if activate_spark():
+            print("\n✓ Changement de version terminé")
         return
-        
-    if not extract_spark():
+    
+    if args.command == 'tune':
+        tune_spark(args.explain, write=not args.explain)
         return
-        
-    if not setup_environment():
+    
+    if args.command == 'cds':
+        cds_spark(tune=not args.no_tune)
+        return
+    
+    if args.command == 'smoke':
+        if smoke_spark(args.smoke_dir, args.smoke_threshold):
+            print("\n✓ Validation réussie")
+        return
+    
+    if args.command == 'precompile':
+        precompile_python(args.pythons, args.unzip_python)
+        return
+    
+    if args.command == 'check':
+        if check_prerequisites(use_cache=not args.refresh_probes):
+            print("\n✓ Tous les prérequis sont satisfaits")
+        return
+    
+    cache = None
+    if not args.no_cache:
+        cache = artifact_cache.ArtifactCache(args.cache_dir, args.cache_max_size * 1024 ** 2)
+    
+    bases = None if args.no_mirrors else (args.mirrors or SPARK_MIRRORS)
+    
+    if args.command == 'native':
+        if native_spark(args.native_source, args.hadoop_version, cache):
+            tune_spark(host=not args.no_tune)
+        return
+    
+    if args.command == 'fleet':
+        if not args.plan:
+            print("❌ fleet : indiquer le plan avec --plan")
+            return
+        if fleet_spark(args.plan, cache, bases, args.bandwidth):
+            print("\n✓ Plan exécuté avec succès!")
+        return
+    
+    if args.command == 'bundle':
+        if bundle_spark(args, cache, bases):
+            print("\n✓ Bundle prêt")
+        return
+    
+    if args.command != 'install':
+        document = installed_manifest()
+        if document is None:
+            print(f"❌ Aucun manifeste pour {SPARK_DIST} dans {INSTALL_DIR}")
+            return
+        result = verify_spark(document, args.fast)
+        if args.command == 'repair' and result and result['damaged']:
+            if repair_spark(document, result['damaged'], args.connections, cache, bases,
+                            args.extract_workers):
+                print("\n✓ Réparation terminée avec succès!")
+        return
+    
+    if args.cluster:
+        if not check_prerequisites(use_cache=not args.refresh_probes):
+            print("\n❌ Veuillez installer les prérequis manquants avant de continuer.")
+            return
+        if distribute_spark(args.cluster, args.fanout, args.connections, bases,
+                            args.extract_workers, args.profile, args.cluster_port,
+                            args.cluster_host, args.cluster_linger):
+            print("\n✓ Distribution terminée avec succès!")
+        return
+    
+    report = plan_install(args, cache, bases).run()
+    print(f"\n{stages.format_report(report)}")
+    if not report['ok']:
+        failed = [stage['label'] for stage in report['stages'] if stage['status'] == stages.FAILED]
+        print(f"\n❌ Installation interrompue : échec de {', '.join(failed)}")
         return
         
     print("\n✓ Installation terminée avec succès!")
-    print(f"Spark est installé dans: {INSTALL_DIR}")
+    print(f"Spark est installé dans: {os.path.join(INSTALL_DIR, SPARK_DIST)}")
 
 if __name__ == "__main__":
     main()
@@ -1,38 +1,75 @@
 # -*- mode: python ; coding: utf-8 -*-
+import argparse
 
+# pyinstaller installation.spec -- --onedir : répertoire dist/installation/ au lieu d'un
+# exécutable unique, qui se décompresse dans un répertoire temporaire à chaque lancement
+parser = argparse.ArgumentParser()
+parser.add_argument('--onedir', action='store_true')
+options = parser.parse_args()
 
 a = Analysis(
     ['installation.py'],
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # Modules chargés par lazyimport.module(), invisibles pour l'analyse des imports
+    hiddenimports=['http.client', 'localserver', 'lz4.frame', 'requests', 'statistics', 'tarfile', 'tqdm',
+                   'xml.etree.ElementTree', 'zipfile', 'zstandard'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # La ligne de commande n'utilise jamais Tk
+    excludes=['tkinter'],
     noarchive=False,
     optimize=0,
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='installation',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=True,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if options.onedir:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='installation',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        name='installation',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='installation',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
@@ -0,0 +1,34 @@
+import importlib
+
+
+class _LazyModule:
+    """Module importé au premier accès à l'un de ses attributs
+
+    L'import passe par importlib et son verrou : plusieurs threads peuvent
+    toucher le module en même temps sans risque.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = 'importé' if self._module is not None else 'pas encore importé'
+        return f"<module {self._name} ({state})>"
+
+
+def module(name):
+    """Module name, chargé seulement quand une étape s'en sert
+
+    requests, tqdm ou http.server coûtent plusieurs dizaines de
+    millisecondes à l'import : list, verify ou l'aide en ligne de commande
+    ne doivent pas les payer.
+    """
+    return _LazyModule(name)
@@ -0,0 +1,127 @@
+import http.server
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    """Sert un répertoire avec prise en charge des requêtes Range
+
+    rate (octets/s par connexion) et latency (secondes) simulent un miroir
+    lent ; ils sont définis par serve_directory sur une sous-classe.
+    """
+
+    rate = None
+    latency = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._send(head=False)
+
+    def do_HEAD(self):
+        self._send(head=True)
+
+    def _send(self, head):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        stat = os.stat(path)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{stat.st_size:x}-{int(stat.st_mtime):x}"')
+        self.send_header('Last-Modified', self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        if head:
+            return
+        with open(path, 'rb') as file:
+            file.seek(start)
+            self._copy(file, end - start + 1)
+
+    def _copy(self, file, remaining):
+        if not self.rate:
+            shutil.copyfileobj(_Limited(file, remaining), self.wfile, CHUNK_SIZE)
+            return
+        # Cadence calculée bloc par bloc pour qu'un changement de rate prenne effet aussitôt
+        size = min(CHUNK_SIZE, max(int(self.rate) // 10, 1024))
+        while remaining > 0:
+            started = time.monotonic()
+            chunk = file.read(min(size, remaining))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+            delay = len(chunk) / self.rate - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+
+class _Limited:
+    """Lecture bornée à `remaining` octets d'un fichier"""
+
+    def __init__(self, file, remaining):
+        self.file = file
+        self.remaining = remaining
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Un client qui coupe la connexion (sonde, bascule de miroir) n'est pas une erreur
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve_directory(directory, host='127.0.0.1', port=0, rate=None, latency=0):
+    """Démarre un serveur HTTP en arrière-plan sur directory
+
+    Retourne le serveur ; son URL de base est server.url et server.shutdown()
+    l'arrête. server.handler.rate peut être modifié à chaud pour simuler un
+    miroir qui ralentit. port=0 choisit un port libre.
+    """
+    handler = type('Handler', (_Handler,), {'rate': rate, 'latency': latency})
+
+    def factory(*args, **kwargs):
+        return handler(*args, directory=directory, **kwargs)
+
+    server = _Server((host, port), factory)
+    server.url = f"http://{host}:{server.server_address[1]}/"
+    server.handler = handler
+    thread = threading.Thread(target=server.serve_forever, name='http', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+
+MANIFEST_DIR = '.manifests'
+HASH_WORKERS = os.cpu_count() or 1
+HASH_CHUNK = 1024 * 1024
+
+
+class ManifestError(Exception):
+    """Erreur levée quand le manifeste d'une installation est absent ou illisible"""
+
+
+def manifest_path(root, distribution):
+    """Emplacement du manifeste de root/distribution"""
+    return os.path.join(root, MANIFEST_DIR, distribution + '.json')
+
+
+def write(root, distribution, entries, **info):
+    """Enregistre le manifeste d'une distribution extraite dans root
+
+    entries vient de extractor.extract_stream ; info (version, url, profil...)
+    est recopié tel quel et sert à savoir si le manifeste correspond encore
+    à ce que l'on veut installer.
+    """
+    path = manifest_path(root, distribution)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    document = dict(info, distribution=distribution, created=time.time(), entries=entries)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(document, f)
+    os.replace(tmp, path)
+    return path
+
+
+def mark_unpacked(root, distribution, names):
+    """Signale dans le manifeste que les archives names ont été remplacées par leur contenu
+
+    La vérification accepte alors un répertoire à leur place ; une
+    réparation restaure l'archive d'origine.
+    """
+    document = load(root, distribution)
+    if document is None:
+        raise ManifestError(f"Aucun manifeste pour {distribution}")
+    for name in names:
+        document['entries'][name]['unpacked'] = True
+    info = {key: value for key, value in document.items() if key not in ('distribution', 'created', 'entries')}
+    return write(root, distribution, document['entries'], **info)
+
+
+def load(root, distribution):
+    """Manifeste de root/distribution, ou None s'il n'existe pas"""
+    try:
+        with open(manifest_path(root, distribution)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"Manifeste illisible : {e}") from e
+
+
+def file_digest(path):
+    """SHA-256 d'un fichier lu par blocs (hashlib libère le GIL : les threads se répartissent les cœurs)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb', buffering=0) as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _check(root, name, entry, fast):
+    """Retourne la raison de l'écart entre le disque et entry, ou None"""
+    path = os.path.join(root, name)
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return "absent"
+    kind = entry['type']
+    if kind == 'symlink':
+        if not stat.S_ISLNK(info.st_mode):
+            return "n'est plus un lien symbolique"
+        if os.readlink(path) != entry['target']:
+            return "cible modifiée"
+        return None
+    if kind == 'hardlink':
+        target = os.path.join(root, entry['target'])
+        if not os.path.exists(target) or not os.path.samefile(path, target):
+            return "lien physique rompu"
+        return None
+    if kind == 'dir':
+        if not stat.S_ISDIR(info.st_mode):
+            return "n'est plus un répertoire"
+        if stat.S_IMODE(info.st_mode) != entry['mode']:
+            return "droits modifiés"
+        return None
+    if entry.get('unpacked') and stat.S_ISDIR(info.st_mode):
+        return None
+    if not stat.S_ISREG(info.st_mode):
+        return "n'est plus un fichier"
+    if info.st_size != entry['size']:
+        return "taille modifiée"
+    if stat.S_IMODE(info.st_mode) != entry['mode']:
+        return "droits modifiés"
+    if fast:
+        if int(info.st_mtime) != entry['mtime']:
+            return "date modifiée"
+        return None
+    if file_digest(path) != entry['sha256']:
+        return "contenu modifié"
+    return None
+
+
+def verify(root, document, fast=False, workers=HASH_WORKERS):
+    """Compare l'installation de root à son manifeste
+
+    En mode rapide (fast), seuls type, taille, droits et date sont
+    comparés ; sinon chaque fichier est relu et haché, en parallèle sur
+    `workers` threads.
+
+    Retourne un dictionnaire : nombre d'entrées vérifiées, octets relus,
+    durée et entrées endommagées (damaged, {nom: raison}).
+    """
+    started = time.monotonic()
+    entries = document['entries']
+    with telemetry.span('manifest.verify', fast=fast) as span, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='verify') as pool:
+        reasons = pool.map(lambda item: _check(root, item[0], item[1], fast), entries.items())
+        damaged = {name: reason for name, reason in zip(entries, reasons) if reason}
+        span.set(entries=len(entries), damaged=len(damaged))
+    return {
+        'checked': len(entries),
+        'bytes': 0 if fast else sum(e.get('size', 0) for e in entries.values()),
+        'seconds': time.monotonic() - started,
+        'fast': fast,
+        'damaged': damaged,
+    }
+
+
+def repair_filter(document, damaged):
+    """Fonction keep(nom_du_membre) qui ne retient que les entrées à restaurer
+
+    Un lien physique est restauré avec son fichier cible, et inversement.
+    """
+    names = set(damaged)
+    for name, entry in document['entries'].items():
+        if entry['type'] == 'hardlink' and (name in names or entry['target'] in names):
+            names.update((name, entry['target']))
+
+    def keep(member_name):
+        return os.path.normpath(member_name.lstrip('/')) in names
+
+    return keep
+
+
+def format_report(result, limit=10):
+    """Résumé lisible d'une vérification"""
+    mode = "rapide (taille et date)" if result['fast'] else \
+        f"complète ({result['bytes'] / 1024 ** 2:.0f} Mo hachés)"
+    lines = [f"{result['checked']} entrées vérifiées en {result['seconds']:.2f} s, vérification {mode}"]
+    damaged = sorted(result['damaged'].items())
+    for name, reason in damaged[:limit]:
+        lines.append(f"  {name} : {reason}")
+    if len(damaged) > limit:
+        lines.append(f"  ... et {len(damaged) - limit} autres")
+    return '\n'.join(lines)
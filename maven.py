@@ -0,0 +1,384 @@
+import contextvars
+import hashlib
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import downloader
+import lazyimport
+import telemetry
+
+ET = lazyimport.module('xml.etree.ElementTree')
+requests = lazyimport.module('requests')
+
+MAVEN_CENTRAL = 'https://repo1.maven.org/maven2/'
+MAVEN_WORKERS = 8
+# Connexions par jar : les gros bundles (aws-java-sdk-bundle) profitent des Range
+JAR_CONNECTIONS = 2
+SCOPES = ('compile', 'runtime')
+MAX_PARENTS = 20
+
+
+class MavenError(Exception):
+    """Erreur levée quand une dépendance Maven ne peut pas être résolue ou récupérée"""
+
+
+def parse_coordinate(text):
+    """'groupe:artefact:version' ou 'groupe:artefact:classifier:version' -> dictionnaire"""
+    parts = text.strip().split(':')
+    if len(parts) == 3:
+        group, artifact, version = parts
+        classifier = None
+    elif len(parts) == 4:
+        group, artifact, classifier, version = parts
+    else:
+        raise MavenError(f"Coordonnée Maven invalide : {text} (attendu groupe:artefact:version)")
+    if not all(parts):
+        raise MavenError(f"Coordonnée Maven invalide : {text}")
+    return {'group': group, 'artifact': artifact, 'version': version, 'classifier': classifier}
+
+
+def artifact_path(group, artifact, version, extension='jar', classifier=None):
+    """Chemin relatif d'un fichier dans un dépôt au format Maven"""
+    suffix = f"-{classifier}" if classifier else ''
+    return f"{group.replace('.', '/')}/{artifact}/{version}/{artifact}-{version}{suffix}.{extension}"
+
+
+def jar_name(coordinate):
+    suffix = f"-{coordinate['classifier']}" if coordinate.get('classifier') else ''
+    return f"{coordinate['artifact']}-{coordinate['version']}{suffix}.jar"
+
+
+class Repository:
+    """Dépôt Maven distant (URL) ou local (répertoire au même format)
+
+    Les requêtes passent par la session partagée du downloader : les POM
+    et les jar réutilisent les mêmes connexions keep-alive que l'archive
+    Spark.
+    """
+
+    def __init__(self, location, session=None):
+        if location.startswith('file://'):
+            location = location[len('file://'):]
+        self.local = not location.startswith(('http://', 'https://'))
+        self.location = location if self.local else location.rstrip('/') + '/'
+        # prefetch télécharge MAVEN_WORKERS jar à la fois, chacun sur JAR_CONNECTIONS connexions
+        self.session = session or downloader.shared_session(MAVEN_WORKERS * JAR_CONNECTIONS)
+
+    def __str__(self):
+        return self.location
+
+    def read(self, path):
+        """Contenu de path, ou None s'il n'existe pas dans ce dépôt"""
+        if self.local:
+            try:
+                with open(os.path.join(self.location, path), 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        response = self.session.get(self.location + path, timeout=downloader.TIMEOUT)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise MavenError(f"{self.location + path} : status code {response.status_code}")
+        return response.content
+
+    def fetch(self, path, dest):
+        """Copie ou télécharge path vers dest ; retourne le nombre d'octets"""
+        if self.local:
+            shutil.copyfile(os.path.join(self.location, path), dest)
+        else:
+            downloader.download_file(self.location + path, dest, connections=JAR_CONNECTIONS,
+                                     session=self.session, checksum=False, progress=False)
+        return os.path.getsize(dest)
+
+
+def _strip(element):
+    """Retire les espaces de noms XML pour chercher les balises par leur nom court"""
+    for node in element.iter():
+        if isinstance(node.tag, str) and '}' in node.tag:
+            node.tag = node.tag.split('}', 1)[1]
+    return element
+
+
+def _text(element, tag, default=None):
+    found = element.find(tag) if element is not None else None
+    return found.text.strip() if found is not None and found.text else default
+
+
+class _Pom:
+    """POM effectif : héritage des parents, propriétés et dependencyManagement"""
+
+    def __init__(self, group, artifact, version, packaging, properties, managed, dependencies):
+        self.group = group
+        self.artifact = artifact
+        self.version = version
+        self.packaging = packaging
+        self.properties = properties
+        self.managed = managed
+        self.dependencies = dependencies
+
+
+_PROPERTY = re.compile(r'\$\{([^}]+)\}')
+
+
+def _interpolate(value, properties):
+    for _ in range(10):
+        if value is None or '${' not in value:
+            break
+        value = _PROPERTY.sub(lambda m: properties.get(m.group(1), m.group(0)), value)
+    return value
+
+
+def _pick_version(version):
+    """Version fixe à utiliser : la borne basse d'un intervalle comme [1.2,2.0)"""
+    if version and version[0] in '[(':
+        bounds = version.strip('[]()').split(',')
+        version = bounds[0].strip() or bounds[-1].strip()
+    return version
+
+
+def _dependency(node):
+    return {
+        'group': _text(node, 'groupId'),
+        'artifact': _text(node, 'artifactId'),
+        'version': _text(node, 'version'),
+        'classifier': _text(node, 'classifier'),
+        'type': _text(node, 'type', 'jar'),
+        'scope': _text(node, 'scope'),
+        'optional': _text(node, 'optional', 'false') == 'true',
+        'exclusions': {(_text(e, 'groupId'), _text(e, 'artifactId'))
+                       for e in node.findall('exclusions/exclusion')},
+    }
+
+
+class Resolver:
+    """Résout des coordonnées Maven et leurs dépendances transitives
+
+    Comme Maven, la version la plus proche des racines l'emporte : le
+    graphe est parcouru en largeur, et les POM d'un même niveau sont
+    récupérés en parallèle. Les dépendances test, provided, system et
+    optionnelles ne sont pas suivies ; les exclusions se propagent aux
+    descendants.
+    """
+
+    def __init__(self, repositories, workers=MAVEN_WORKERS):
+        self.repositories = repositories
+        self.workers = workers
+        self.poms = {}
+        self.lock = threading.Lock()
+
+    def _read(self, path):
+        for repository in self.repositories:
+            data = repository.read(path)
+            if data is not None:
+                return data, repository
+        return None, None
+
+    def pom(self, group, artifact, version, depth=0):
+        """POM effectif de group:artifact:version (mis en cache)"""
+        key = (group, artifact, version)
+        with self.lock:
+            if key in self.poms:
+                return self.poms[key]
+        if depth > MAX_PARENTS:
+            raise MavenError(f"Chaîne de POM parents trop longue pour {group}:{artifact}")
+        data, _ = self._read(artifact_path(group, artifact, version, 'pom'))
+        if data is None:
+            raise MavenError(f"POM introuvable : {group}:{artifact}:{version} "
+                             f"(dépôts : {', '.join(map(str, self.repositories))})")
+        try:
+            root = _strip(ET.fromstring(data))
+        except ET.ParseError as e:
+            raise MavenError(f"POM illisible {group}:{artifact}:{version} : {e}") from e
+
+        parent = None
+        parent_node = root.find('parent')
+        if parent_node is not None:
+            parent = self.pom(_text(parent_node, 'groupId'), _text(parent_node, 'artifactId'),
+                              _text(parent_node, 'version'), depth + 1)
+
+        properties = dict(parent.properties) if parent else {}
+        own_group = _text(root, 'groupId') or (parent.group if parent else group)
+        own_version = _text(root, 'version') or (parent.version if parent else version)
+        properties.update({
+            'project.groupId': own_group, 'pom.groupId': own_group,
+            'project.artifactId': artifact, 'pom.artifactId': artifact,
+            'project.version': own_version, 'pom.version': own_version, 'version': own_version,
+        })
+        if parent:
+            properties.update({'project.parent.version': parent.version,
+                               'project.parent.groupId': parent.group})
+        for node in root.findall('properties/*'):
+            properties[node.tag] = (node.text or '').strip()
+
+        def resolved(dependency):
+            for field in ('group', 'artifact', 'version', 'classifier', 'type', 'scope'):
+                dependency[field] = _interpolate(dependency[field], properties)
+            return dependency
+
+        managed = dict(parent.managed) if parent else {}
+        for node in root.findall('dependencyManagement/dependencies/dependency'):
+            dependency = resolved(_dependency(node))
+            if dependency['scope'] == 'import' and dependency['type'] == 'pom':
+                # BOM importé : ses versions gérées s'ajoutent sans écraser les nôtres
+                bom = self.pom(dependency['group'], dependency['artifact'],
+                               _pick_version(dependency['version']), depth + 1)
+                for name, entry in bom.managed.items():
+                    managed.setdefault(name, entry)
+            else:
+                managed[(dependency['group'], dependency['artifact'])] = dependency
+
+        dependencies = list(parent.dependencies) if parent else []
+        for node in root.findall('dependencies/dependency'):
+            dependencies.append(resolved(_dependency(node)))
+
+        pom = _Pom(own_group, artifact, own_version, _text(root, 'packaging', 'jar'),
+                   properties, managed, dependencies)
+        with self.lock:
+            self.poms[key] = pom
+        return pom
+
+    def _children(self, node):
+        """Dépendances directes à suivre pour un nœud du graphe"""
+        pom = self.pom(node['group'], node['artifact'], node['version'])
+        node['packaging'] = pom.packaging
+        children = []
+        for dependency in pom.dependencies:
+            managed = pom.managed.get((dependency['group'], dependency['artifact']), {})
+            version = dependency['version'] or managed.get('version')
+            scope = dependency['scope'] or managed.get('scope') or 'compile'
+            if scope not in SCOPES or dependency['optional'] or dependency['type'] not in ('jar', 'bundle'):
+                continue
+            name = (dependency['group'], dependency['artifact'])
+            if name in node['exclusions'] or (dependency['group'], '*') in node['exclusions'] \
+                    or ('*', '*') in node['exclusions']:
+                continue
+            if not version:
+                raise MavenError(f"Version inconnue pour {name[0]}:{name[1]} "
+                                 f"(dépendance de {node['group']}:{node['artifact']})")
+            children.append({
+                'group': dependency['group'],
+                'artifact': dependency['artifact'],
+                'version': _pick_version(version),
+                'classifier': dependency['classifier'],
+                'exclusions': node['exclusions'] | dependency['exclusions']
+                              | managed.get('exclusions', set()),
+                'parent': f"{node['group']}:{node['artifact']}",
+            })
+        return children
+
+    def resolve(self, coordinates):
+        """Liste ordonnée des artefacts à installer pour coordinates (chaînes ou dictionnaires)"""
+        level = []
+        for coordinate in coordinates:
+            node = parse_coordinate(coordinate) if isinstance(coordinate, str) else dict(coordinate)
+            node.setdefault('classifier', None)
+            node.update(exclusions=set(), parent=None)
+            level.append(node)
+        chosen = {}
+        with telemetry.span('maven.resolve', roots=len(level)) as span, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='maven') as pool:
+            while level:
+                # Le plus proche l'emporte : un artefact déjà retenu n'est pas revisité
+                fresh = []
+                for node in level:
+                    name = (node['group'], node['artifact'], node['classifier'])
+                    if name not in chosen:
+                        chosen[name] = node
+                        fresh.append(node)
+                level = [child for children in pool.map(self._children, fresh) for child in children]
+            span.set(artifacts=len(chosen), poms=len(self.poms))
+        return [node for node in chosen.values() if node.get('packaging', 'jar') != 'pom']
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _provided(names, artifact):
+    """Jar de names qui sont une version de artifact (artefact-version.jar)"""
+    pattern = re.compile(re.escape(artifact) + r'-\d[\w.]*(?:-[\w.]+)?\.jar$')
+    return sorted(name for name in names if pattern.match(name))
+
+
+def _discard(tmp):
+    """Supprime un jar partiel et l'état de reprise que le downloader a pu laisser à côté"""
+    for path in (tmp, tmp + downloader.STATE_SUFFIX):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def prefetch(coordinates, jars_dir, repositories=None, workers=MAVEN_WORKERS):
+    """Résout coordinates et dépose les jar manquants dans jars_dir, en parallèle
+
+    Un artefact dont une autre version est déjà fournie par Spark est
+    laissé de côté : deux versions d'un même jar dans le classpath se
+    marchent dessus. Les sommes .sha1 publiées sont vérifiées.
+
+    Retourne un dictionnaire : added, present, conflicts (noms de jar), bytes.
+    """
+    repositories = repositories or [Repository(MAVEN_CENTRAL)]
+    artifacts = Resolver(repositories, workers).resolve(coordinates)
+    existing = os.listdir(jars_dir)
+    result = {'added': [], 'present': [], 'conflicts': [], 'bytes': 0}
+    todo = []
+    for artifact in artifacts:
+        name = jar_name(artifact)
+        if os.path.exists(os.path.join(jars_dir, name)):
+            result['present'].append(name)
+        elif not artifact.get('classifier') and _provided(existing, artifact['artifact']):
+            provided = ', '.join(_provided(existing, artifact['artifact']))
+            result['conflicts'].append(f"{name} (déjà fourni : {provided})")
+        else:
+            todo.append(artifact)
+
+    counter = telemetry.counter('maven.bytes')
+    # Sans quoi urllib3 referme les connexions en trop (« Connection pool is full »)
+    downloader.shared_session(workers * JAR_CONNECTIONS)
+
+    def fetch(artifact):
+        path = artifact_path(artifact['group'], artifact['artifact'], artifact['version'],
+                             classifier=artifact.get('classifier'))
+        dest = os.path.join(jars_dir, jar_name(artifact))
+        tmp = f"{dest}.{os.getpid()}.tmp"
+        errors = []
+        try:
+            for repository in repositories:
+                try:
+                    size = repository.fetch(path, tmp)
+                except (OSError, requests.RequestException, downloader.DownloadError) as e:
+                    # Le dépôt suivant repart de zéro : pas de reprise sur les octets d'un autre
+                    _discard(tmp)
+                    errors.append(f"{repository} : {e}")
+                    continue
+                published = repository.read(path + '.sha1')
+                if published and published.split()[0].decode(errors='replace').lower() != file_sha1(tmp):
+                    _discard(tmp)
+                    errors.append(f"{repository} : SHA-1 incorrect")
+                    continue
+                os.replace(tmp, dest)
+                counter.add(size)
+                return size
+        except BaseException:
+            _discard(tmp)
+            raise
+        raise MavenError(f"{jar_name(artifact)} introuvable : {'; '.join(errors)}")
+
+    with telemetry.span('maven.fetch', jars=len(todo)) as span, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jar') as pool:
+        # Chaque jar hérite du contexte de l'appelant (priorité face au seau à jetons)
+        futures = [pool.submit(contextvars.copy_context().run, fetch, artifact) for artifact in todo]
+        sizes = [future.result() for future in futures]
+        span.set(bytes=sum(sizes))
+    result['added'] = [jar_name(artifact) for artifact in todo]
+    result['bytes'] = sum(sizes)
+    return result
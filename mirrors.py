@@ -0,0 +1,190 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import lazyimport
+import telemetry
+
+requests = lazyimport.module('requests')
+
+PROBE_BYTES = 1024 * 1024
+PROBE_TIMEOUT = 10
+MAX_FAILURES = 2
+COLLAPSE_RATIO = 0.25
+RATE_WINDOW = 5.0
+
+
+class MirrorError(Exception):
+    """Erreur levée quand aucun miroir n'est utilisable"""
+
+
+class Mirror:
+    """Un miroir candidat et les mesures faites à son sujet"""
+
+    def __init__(self, base, path):
+        self.base = base
+        self.url = base.rstrip('/') + '/' + path.lstrip('/')
+        self.latency = None
+        self.rate = None
+        self.ranges = False
+        self.size = None
+        self.error = None
+        self.failures = 0
+
+    @property
+    def alive(self):
+        return self.error is None and self.failures < MAX_FAILURES
+
+    def __repr__(self):
+        return f"Mirror({self.base!r})"
+
+
+def _total_size(content_range):
+    """Taille totale annoncée par un en-tête Content-Range, ou None (« bytes 0-N/* » : inconnue)"""
+    total = content_range.rpartition('/')[2].strip()
+    return int(total) if total.isdigit() else None
+
+
+def probe_mirror(session, mirror, probe_bytes=PROBE_BYTES):
+    """Mesure latence et débit d'un miroir avec une petite requête Range"""
+    headers = {'Range': f'bytes=0-{probe_bytes - 1}'}
+    started = time.monotonic()
+    try:
+        with session.get(mirror.url, headers=headers, stream=True, timeout=PROBE_TIMEOUT) as response:
+            mirror.latency = time.monotonic() - started
+            if response.status_code not in (200, 206):
+                mirror.error = f"Status code: {response.status_code}"
+                return mirror
+            mirror.ranges = response.status_code == 206
+            if mirror.ranges:
+                mirror.size = _total_size(response.headers.get('Content-Range', ''))
+            received = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                received += len(chunk)
+                if received >= probe_bytes:
+                    break
+        mirror.rate = received / max(time.monotonic() - started, 1e-6)
+    except requests.RequestException as e:
+        mirror.error = type(e).__name__
+    return mirror
+
+
+def rank(mirrors):
+    """Ordonne les miroirs : vivants d'abord, Range avant flux unique, puis débit"""
+    return sorted(mirrors, key=lambda m: (not m.alive, not m.ranges, -(m.rate or 0)))
+
+
+def probe_mirrors(bases, path, session=None):
+    """Sonde tous les miroirs en parallèle et les retourne classés"""
+    session = session or requests.Session()
+    mirrors = [Mirror(base, path) for base in bases]
+    with telemetry.span('mirrors.probe', mirrors=len(mirrors)) as parent:
+        def run(mirror):
+            with telemetry.span('mirrors.probe.mirror', parent=parent, base=mirror.base) as span:
+                probe_mirror(session, mirror)
+                span.set(latency=mirror.latency, rate=mirror.rate or 0, error=mirror.error)
+
+        with ThreadPoolExecutor(max_workers=max(len(mirrors), 1), thread_name_prefix='probe') as pool:
+            list(pool.map(run, mirrors))
+    sizes = {m.size for m in mirrors if m.alive and m.size}
+    if len(sizes) > 1:
+        # Un miroir qui annonce une autre taille ne sert pas la même archive
+        expected = max(sizes, key=lambda s: sum(m.size == s for m in mirrors))
+        for m in mirrors:
+            if m.size and m.size != expected:
+                m.error = f"Taille différente ({m.size} octets)"
+    return rank(mirrors)
+
+
+class MirrorPool:
+    """Source de téléchargement qui bascule entre miroirs
+
+    Le downloader demande url() avant chaque requête, puis signale les octets
+    reçus (report) ou l'échec (failed). Un miroir est abandonné après
+    MAX_FAILURES erreurs, ou écarté quand son débit cumulé sur les
+    RATE_WINDOW dernières secondes tombe sous COLLAPSE_RATIO fois le débit
+    sondé d'un autre miroir.
+
+    key identifie l'artefact quel que soit le miroir (reprise, cache).
+    """
+
+    mirrored = True
+
+    def __init__(self, mirrors, key=None):
+        self.mirrors = [m for m in mirrors if m.alive]
+        if not self.mirrors:
+            errors = ', '.join(f"{m.base} ({m.error})" for m in mirrors)
+            raise MirrorError(f"Aucun miroir disponible : {errors}")
+        self.key = key or self.mirrors[0].url
+        self.attempts = 3 * len(self.mirrors)
+        self.lock = threading.Lock()
+        self._use(self.mirrors[0])
+
+    def _use(self, mirror):
+        self.current = mirror
+        self.since = time.monotonic()
+        self.received = collections.deque()
+
+    def url(self):
+        with self.lock:
+            return self.current.url
+
+    def candidates(self):
+        with self.lock:
+            return [self.current.url] + [m.url for m in self.mirrors if m.alive and m is not self.current]
+
+    def _mirror(self, url):
+        return next((m for m in self.mirrors if m.url == url), None)
+
+    def _switch(self, reason):
+        candidates = [m for m in self.mirrors if m.alive and m is not self.current]
+        if not candidates:
+            return
+        previous = self.current
+        self.mirrors.remove(previous)
+        self.mirrors.append(previous)
+        self._use(candidates[0])
+        print(f"\n⚠ Miroir {previous.base} {reason}, bascule vers {self.current.base}")
+
+    def report(self, url, count):
+        now = time.monotonic()
+        with self.lock:
+            if url != self.current.url:
+                return
+            self.received.append((now, count))
+            while self.received and self.received[0][0] < now - RATE_WINDOW:
+                self.received.popleft()
+            if now - self.since < RATE_WINDOW:
+                return
+            rate = sum(c for _, c in self.received) / RATE_WINDOW
+            best = max((m.rate or 0 for m in self.mirrors if m.alive and m is not self.current), default=0)
+            if rate < COLLAPSE_RATIO * best:
+                # Le débit observé remplace la mesure initiale pour le classement
+                self.current.rate = rate
+                telemetry.counter('mirrors.switches').add()
+                self._switch("trop lent")
+
+    def failed(self, url):
+        with self.lock:
+            mirror = self._mirror(url)
+            if mirror is None:
+                return
+            mirror.failures += 1
+            if mirror is self.current and not mirror.alive:
+                telemetry.counter('mirrors.switches').add()
+                self._switch("en erreur")
+
+    def __str__(self):
+        return self.current.base
+
+
+def select(bases, path, session=None):
+    """Sonde les miroirs et retourne un MirrorPool démarrant sur le plus rapide"""
+    mirrors = probe_mirrors(bases, path, session)
+    for m in mirrors:
+        if m.alive:
+            print(f"  {m.base} : {m.latency * 1000:.0f} ms, {m.rate / 1024 ** 2:.1f} Mo/s")
+        else:
+            print(f"  {m.base} : indisponible ({m.error})")
+    return MirrorPool(mirrors, key=path)
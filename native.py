@@ -0,0 +1,222 @@
+import glob
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+import cds
+import downloader
+import lazyimport
+import telemetry
+import tuning
+
+tarfile = lazyimport.module('tarfile')
+
+NATIVE_DIR = os.path.join('lib', 'native')
+HADOOP_MIRROR = 'https://archive.apache.org/dist/hadoop/common/'
+CHECKER_CLASS = 'org.apache.hadoop.util.NativeLibraryChecker'
+CHECK_TIMEOUT = 120
+# libhadoop doit se charger ; les codecs qu'elle n'a pas trouvés sont signalés sans bloquer
+REQUIRED = ['hadoop']
+LIBHADOOP = 'libhadoop.so'
+
+_HADOOP_JAR = re.compile(r'hadoop-(?:client-api|common)-(\d+\.\d+\.\d+)\.jar$')
+_LIBRARY = re.compile(r'lib[\w.+-]*?\.so(?:\.\d+)*$')
+_CHECK_LINE = re.compile(r'^\s*([\w-]+)\s*:\s*(true|false)\b\s*(.*)$')
+
+
+class NativeError(Exception):
+    """Erreur levée quand les bibliothèques natives de Hadoop ne peuvent pas être installées ou vérifiées"""
+
+
+def hadoop_version(distribution_dir):
+    """Version de Hadoop embarquée dans jars/ (hadoop-client-api-<version>.jar), ou None"""
+    for path in sorted(glob.glob(os.path.join(distribution_dir, 'jars', 'hadoop-*.jar'))):
+        match = _HADOOP_JAR.search(os.path.basename(path))
+        if match:
+            return match.group(1)
+    return None
+
+
+def archive_path(version):
+    """Chemin de l'archive binaire de Hadoop sur un miroir Apache"""
+    return f"hadoop-{version}/hadoop-{version}.tar.gz"
+
+
+def native_dir(distribution_dir):
+    return os.path.join(distribution_dir, NATIVE_DIR)
+
+
+def present(distribution_dir):
+    """True si libhadoop est installée dans lib/native"""
+    return os.path.exists(os.path.join(native_dir(distribution_dir), LIBHADOOP))
+
+
+def _from_directory(directory, staging):
+    """Copie les bibliothèques partagées de directory (ou de directory/lib/native), liens compris"""
+    if os.path.isdir(os.path.join(directory, NATIVE_DIR)):
+        directory = os.path.join(directory, NATIVE_DIR)
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not _LIBRARY.match(name):
+            continue
+        if os.path.islink(path) and '/' not in os.readlink(path):
+            os.symlink(os.readlink(path), os.path.join(staging, name))
+        elif os.path.isfile(path):
+            shutil.copy2(path, os.path.join(staging, name))
+
+
+def _from_archive(fileobj, staging):
+    """Extrait d'une archive Hadoop les seules bibliothèques partagées de lib/native
+
+    L'archive est lue en flux : les .a, la documentation et les jar ne
+    sont jamais écrits.
+    """
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            directory, name = os.path.split(member.name)
+            if not directory.endswith('/' + NATIVE_DIR) or not _LIBRARY.match(name):
+                continue
+            dest = os.path.join(staging, name)
+            if member.issym():
+                # Seuls les liens vers une bibliothèque voisine (libhadoop.so -> libhadoop.so.1.0.0)
+                if '/' not in member.linkname:
+                    os.symlink(member.linkname, dest)
+            elif member.isfile():
+                with archive.extractfile(member) as source, open(dest, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.chmod(dest, 0o755)
+
+
+def _download(url, path, cache, connections):
+    def download(dest):
+        return downloader.download_file(url, dest, connections=connections)['sha512']
+
+    if cache is None:
+        download(path)
+    elif cache.fetch(url, path, download):
+        print(f"✓ Archive Hadoop servie depuis le cache ({cache.root})")
+
+
+def install(distribution_dir, source=None, version=None, cache=None,
+            connections=downloader.DOWNLOAD_CONNECTIONS):
+    """Installe libhadoop et les bibliothèques natives de Hadoop dans distribution_dir/lib/native
+
+    source est un répertoire (lib/native d'une installation de Hadoop, ou
+    répertoire contenant les .so), une archive hadoop-<version>.tar.gz
+    locale, ou l'URL de base d'un miroir Apache (défaut : HADOOP_MIRROR).
+    La version est celle des jar Hadoop de Spark, sauf si version est
+    donnée (variante without-hadoop). Le répertoire lib/native précédent
+    est remplacé d'un bloc.
+
+    Retourne un dictionnaire : dir, version, source, libraries.
+    """
+    version = version or hadoop_version(distribution_dir)
+    if version is None:
+        raise NativeError("Version de Hadoop introuvable dans jars/ : la préciser (variante without-hadoop)")
+    target = native_dir(distribution_dir)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.native-', dir=os.path.dirname(target))
+    try:
+        with telemetry.span('native.install', version=version) as span:
+            if source and os.path.isdir(source):
+                _from_directory(source, staging)
+            elif source and os.path.isfile(source):
+                with open(source, 'rb') as f:
+                    _from_archive(f, staging)
+            else:
+                source = (source or HADOOP_MIRROR).rstrip('/') + '/' + archive_path(version)
+                archive = os.path.join(staging, '.hadoop.tar.gz')
+                _download(source, archive, cache, connections)
+                try:
+                    with open(archive, 'rb') as f:
+                        _from_archive(f, staging)
+                finally:
+                    os.remove(archive)
+            libraries = sorted(os.listdir(staging))
+            if LIBHADOOP not in libraries:
+                raise NativeError(f"{LIBHADOOP} absente de {source}")
+            span.set(libraries=len(libraries))
+        os.chmod(staging, 0o755)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.rename(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return {'dir': target, 'version': version, 'source': source, 'libraries': libraries}
+
+
+def _library_path(directory):
+    current = os.environ.get('LD_LIBRARY_PATH')
+    return f"{directory}{os.pathsep}{current}" if current else directory
+
+
+def check(distribution_dir):
+    """Charge les bibliothèques natives comme le ferait Spark et rapporte le résultat par bibliothèque
+
+    Exécute NativeLibraryChecker (la classe derrière `hadoop checknative`)
+    avec les jar de Spark et java.library.path pointant sur lib/native ;
+    sans jar Hadoop (variante without-hadoop), `hadoop checknative` du
+    PATH. Retourne {bibliothèque: {'ok', 'detail'}} (hadoop, zlib, zstd,
+    snappy, lz4, bzip2, openssl...).
+    """
+    directory = native_dir(distribution_dir)
+    env = dict(os.environ, LD_LIBRARY_PATH=_library_path(directory))
+    if hadoop_version(distribution_dir):
+        try:
+            java = cds.java_binary()
+        except cds.CdsError as e:
+            raise NativeError(str(e)) from e
+        command = [java, f'-Djava.library.path={directory}', '-cp',
+                   os.path.join(distribution_dir, 'jars', '*'), CHECKER_CLASS, '-a']
+    elif shutil.which('hadoop'):
+        command = ['hadoop', 'checknative', '-a']
+        env['JAVA_LIBRARY_PATH'] = directory
+    else:
+        raise NativeError("Ni jar Hadoop dans Spark ni commande hadoop pour vérifier le chargement")
+    try:
+        # -a : code de retour non nul dès qu'une bibliothèque manque ; seule la sortie compte
+        completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+                                   timeout=CHECK_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise NativeError(f"{os.path.basename(command[0])} : {e}") from e
+    output = completed.stdout.decode(errors='replace')
+    result = {}
+    for line in output.splitlines():
+        match = _CHECK_LINE.match(line)
+        if match:
+            result[match.group(1)] = {'ok': match.group(2) == 'true', 'detail': match.group(3).strip()}
+    if not result:
+        lines = [line for line in output.splitlines() if line.strip()]
+        raise NativeError(f"Vérification impossible : {lines[-1] if lines else completed.returncode}")
+    return result
+
+
+def loaded(result):
+    """True si toutes les bibliothèques de REQUIRED se chargent"""
+    return all(result.get(name, {}).get('ok') for name in REQUIRED)
+
+
+def format_check(result):
+    """Une ligne par bibliothèque : chargée (✓) ou repli sur l'implémentation Java (⚠)"""
+    lines = []
+    for name, entry in result.items():
+        mark = '✓' if entry['ok'] else ('❌' if name in REQUIRED else '⚠')
+        lines.append(f"{mark} {name:<8} {entry['detail'] or ('chargée' if entry['ok'] else 'absente')}")
+    return '\n'.join(lines)
+
+
+def settings(distribution_dir):
+    """Réglages (au format de tuning.recommend) qui font charger lib/native, si libhadoop y est"""
+    if not present(distribution_dir):
+        return []
+    directory = native_dir(distribution_dir)
+    reason = "bibliothèques natives de Hadoop (CRC32C, zlib, zstd...) au lieu des implémentations Java"
+    return [
+        (tuning.DEFAULTS_FILE, 'spark.driver.extraLibraryPath', directory, reason),
+        (tuning.DEFAULTS_FILE, 'spark.executor.extraLibraryPath', directory, reason),
+        (tuning.ENV_FILE, 'LD_LIBRARY_PATH', f"{directory}${{LD_LIBRARY_PATH:+:$LD_LIBRARY_PATH}}",
+         "processus lancés hors de spark-submit (pyspark, spark-shell, workers du mode standalone)"),
+    ]
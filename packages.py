@@ -0,0 +1,42 @@
+import os
+import shutil
+import subprocess
+
+import telemetry
+
+# Paquet apt qui fournit chaque prérequis sondé par probes.py
+APT_PACKAGES = {
+    'java': 'openjdk-11-jdk',
+    'python': 'python3',
+}
+
+
+class PackageError(Exception):
+    """Erreur levée quand les paquets manquants ne peuvent pas être installés"""
+
+
+def apt_available():
+    """Vrai si apt-get est présent sur la machine"""
+    return shutil.which('apt-get') is not None
+
+
+def missing(results):
+    """Paquets apt à installer d'après les résultats de probes.check_all"""
+    return [APT_PACKAGES[name] for name, result in results.items()
+            if not result['ok'] and name in APT_PACKAGES]
+
+
+def install(packages):
+    """Installe packages en une seule transaction apt, précédée d'un seul apt-get update"""
+    if not packages:
+        return
+    if not apt_available():
+        raise PackageError(f"apt-get introuvable, installez manuellement : {' '.join(packages)}")
+    env = dict(os.environ, DEBIAN_FRONTEND='noninteractive')
+    for command in (['apt-get', 'update'], ['apt-get', 'install', '-y'] + list(packages)):
+        with telemetry.span(f"apt.{command[1]}", packages=' '.join(packages)):
+            completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        if completed.returncode != 0:
+            output = completed.stdout.decode(errors='replace').strip().splitlines()
+            raise PackageError(f"{' '.join(command)} a échoué (code {completed.returncode}) : "
+                               + ' / '.join(output[-3:]))
@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import artifact_cache
+import telemetry
+
+PROBE_CACHE = os.path.join(artifact_cache.CACHE_DIR, 'probes.json')
+PROBE_TIMEOUT = 30
+
+# Versions prises en charge par Spark 3.4
+JAVA_VERSIONS = (8, 11, 17)
+PYTHON_MIN_VERSION = (3, 7)
+
+
+def parse_java_version(output):
+    """Version majeure de Java d'après la sortie de `java -version` (1.8.0_372 -> 8)"""
+    match = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+    if not match:
+        return None
+    major = int(match.group(1))
+    if major == 1 and match.group(2):
+        major = int(match.group(2))
+    return (major,)
+
+
+def parse_python_version(output):
+    """Version de Python d'après la sortie de `python --version`"""
+    match = re.search(r'Python (\d+)\.(\d+)(?:\.(\d+))?', output)
+    if not match:
+        return None
+    return tuple(int(part) for part in match.groups() if part is not None)
+
+
+def _java_supported(version):
+    return version[0] in JAVA_VERSIONS
+
+
+def _python_supported(version):
+    return version[:2] >= PYTHON_MIN_VERSION
+
+
+# nom -> (binaires candidats, argument, analyse, contrôle, versions attendues)
+PROBES = {
+    'java': (['java'], '-version', parse_java_version, _java_supported,
+             ' ou '.join(str(v) for v in JAVA_VERSIONS)),
+    'python': (['python3', 'python'], '--version', parse_python_version, _python_supported,
+               f"{'.'.join(map(str, PYTHON_MIN_VERSION))} ou plus"),
+}
+
+
+class _ProbeCache:
+    """Résultats de sondes indexés par le chemin résolu du binaire
+
+    Une entrée n'est réutilisée que si la date de modification et la taille
+    du binaire n'ont pas changé depuis la sonde.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.dirty = False
+
+    def get(self, binary, stat):
+        entry = self.entries.get(binary)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return entry['output']
+        return None
+
+    def put(self, binary, stat, output):
+        with self.lock:
+            self.entries[binary] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'output': output}
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+def _run(name, cache):
+    candidates, argument, parse, supported, expected = PROBES[name]
+    result = {'name': name, 'ok': False, 'path': None, 'version': None, 'cached': False}
+    for candidate in candidates:
+        found = shutil.which(candidate)
+        if found:
+            break
+    else:
+        result['message'] = f"{name} introuvable dans le PATH"
+        return result
+
+    binary = os.path.realpath(found)
+    result['path'] = binary
+    stat = os.stat(binary)
+    output = cache.get(binary, stat) if cache else None
+    if output is not None:
+        result['cached'] = True
+    else:
+        try:
+            completed = subprocess.run([binary, argument], stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, timeout=PROBE_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            result['message'] = f"{name} ne démarre pas : {e}"
+            return result
+        output = completed.stdout.decode(errors='replace')
+        if completed.returncode != 0:
+            result['message'] = f"{name} a échoué (code {completed.returncode})"
+            return result
+        if cache:
+            cache.put(binary, stat, output)
+
+    version = parse(output)
+    if version is None:
+        result['message'] = f"Version de {name} illisible"
+        return result
+    result['version'] = '.'.join(map(str, version))
+    result['ok'] = supported(version)
+    if not result['ok']:
+        result['message'] = f"{name} {result['version']} non pris en charge (attendu : {expected})"
+    return result
+
+
+def check_all(names=None, use_cache=True, cache_path=PROBE_CACHE):
+    """Lance toutes les sondes en parallèle et retourne {nom: résultat}
+
+    Chaque résultat est un dictionnaire : ok, path, version, cached et,
+    en cas d'échec, message.
+    """
+    names = list(names or PROBES)
+    cache = _ProbeCache(cache_path) if use_cache else None
+    with telemetry.span('prerequisites.probe') as parent:
+        def run(name):
+            with telemetry.span(f"prerequisites.{name}", parent=parent) as span:
+                result = _run(name, cache)
+                span.set(version=result['version'], cached=result['cached'], ok=result['ok'])
+                return result
+
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='probe') as pool:
+            results = dict(zip(names, pool.map(run, names)))
+    if cache:
+        cache.save()
+    return results
+
+
+def check(name, use_cache=True):
+    """Lance une seule sonde"""
+    return check_all([name], use_cache)[name]
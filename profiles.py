@@ -0,0 +1,70 @@
+import fnmatch
+
+DEFAULT_PROFILE = 'full'
+
+# Motifs relatifs à la racine de la distribution (spark-<version>-bin-hadoop3/).
+# Un motif terminé par "/" désigne un répertoire et tout son contenu ; les
+# autres suivent fnmatch. Un membre est ignoré s'il correspond à un motif
+# "exclude" sans correspondre à un motif "include".
+_UNUSED_ON_NODES = ['examples/', 'R/', 'data/', 'licenses/', 'kubernetes/', 'yarn/']
+
+PROFILES = {
+    'full': {
+        'description': "Distribution complète",
+        'exclude': [],
+        'include': [],
+    },
+    'scala-batch': {
+        'description': "Jobs Scala/Java en batch, sans PySpark ni SparkR",
+        'exclude': _UNUSED_ON_NODES + ['python/', 'bin/pyspark*', 'bin/sparkR*', 'bin/*.cmd'],
+        'include': [],
+    },
+    'minimal-pyspark': {
+        'description': "PySpark sans tests, documentation ni exemples",
+        'exclude': _UNUSED_ON_NODES + [
+            'bin/*.cmd',
+            'bin/sparkR*',
+            'python/docs/',
+            'python/test_coverage/',
+            'python/test_support/',
+            'python/run-tests*',
+            'python/pyspark/tests/',
+            'python/pyspark/*/tests/',
+            'python/pyspark/*/*/tests/',
+        ],
+        'include': [],
+    },
+}
+
+
+class ProfileError(Exception):
+    """Erreur levée pour un profil d'installation inconnu"""
+
+
+def _matches(path, pattern):
+    if pattern.endswith('/'):
+        # Le répertoire lui-même ou tout ce qu'il contient ; les jokers valent aussi ici
+        return fnmatch.fnmatchcase(path, pattern[:-1]) or fnmatch.fnmatchcase(path, pattern + '*')
+    return fnmatch.fnmatchcase(path, pattern)
+
+
+def member_filter(name):
+    """Retourne une fonction keep(nom_du_membre) pour le profil donné, ou None pour tout garder"""
+    if name not in PROFILES:
+        raise ProfileError(f"Profil inconnu : {name} (disponibles : {', '.join(PROFILES)})")
+    profile = PROFILES[name]
+    if not profile['exclude']:
+        return None
+
+    def keep(member_name):
+        if member_name.startswith('./'):
+            member_name = member_name[2:]
+        parts = member_name.strip('/').split('/', 1)
+        if len(parts) < 2:
+            return True
+        path = parts[1]
+        if not any(_matches(path, pattern) for pattern in profile['exclude']):
+            return True
+        return any(_matches(path, pattern) for pattern in profile['include'])
+
+    return keep
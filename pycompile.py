@@ -0,0 +1,199 @@
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import lazyimport
+import probes
+import telemetry
+
+statistics = lazyimport.module('statistics')
+zipfile = lazyimport.module('zipfile')
+
+# Fichiers .pyc par empreinte du source (PEP 552) : identiques d'une machine à l'autre
+INVALIDATION_MODE = 'checked-hash'
+MIN_PYTHON = (3, 7)
+COMPILE_TIMEOUT = 900
+MEASURE_RUNS = 3
+# Archives que Spark met en tête du PYTHONPATH du driver et des workers
+PYTHON_ZIPS = ['lib/pyspark.zip', 'lib/py4j-*-src.zip']
+DRIVER_IMPORT = 'import pyspark, pyspark.sql'
+WORKER_IMPORT = 'import pyspark.daemon, pyspark.worker'
+
+
+class PycompileError(Exception):
+    """Erreur levée quand un interpréteur ne peut pas précompiler la distribution"""
+
+
+def interpreters(extra=None):
+    """Interpréteurs qui exécuteront PySpark : PYSPARK_PYTHON, PYSPARK_DRIVER_PYTHON, python3 et extra
+
+    Un même binaire (même chemin résolu) n'apparaît qu'une fois.
+    """
+    candidates = [os.environ.get('PYSPARK_PYTHON'), os.environ.get('PYSPARK_DRIVER_PYTHON')]
+    candidates += list(extra or []) + ['python3']
+    found = {}
+    for candidate in candidates:
+        path = shutil.which(candidate) if candidate else None
+        if path:
+            found.setdefault(os.path.realpath(path), path)
+    return list(found.values())
+
+
+def _version(python):
+    try:
+        completed = subprocess.run([python, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   timeout=probes.PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise PycompileError(f"{python} ne démarre pas : {e}") from e
+    version = probes.parse_python_version(completed.stdout.decode(errors='replace'))
+    if version is None:
+        raise PycompileError(f"Version de {python} illisible")
+    if version[:2] < MIN_PYTHON:
+        raise PycompileError(f"{python} {'.'.join(map(str, version))} : .pyc par empreinte à partir de "
+                             f"Python {'.'.join(map(str, MIN_PYTHON))}")
+    return version
+
+
+def zips(python_dir):
+    """Archives zip de python_dir importées par PySpark, chemins relatifs à python_dir"""
+    found = []
+    for pattern in PYTHON_ZIPS:
+        found += sorted(glob.glob(os.path.join(python_dir, pattern)))
+    return [os.path.relpath(path, python_dir) for path in found]
+
+
+def unpack_zips(python_dir):
+    """Remplace chaque archive zip par un répertoire du même nom contenant ses fichiers
+
+    Spark place ces chemins en tête du PYTHONPATH ; Python importe depuis
+    un répertoire nommé pyspark.zip comme depuis n'importe quel
+    répertoire, sans lecture ni décompression de zip, et peut y trouver
+    des .pyc. Retourne les chemins remplacés, relatifs à python_dir.
+    """
+    unpacked = []
+    for name in zips(python_dir):
+        path = os.path.join(python_dir, name)
+        if not os.path.isfile(path):
+            continue
+        tmp = tempfile.mkdtemp(prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(path))
+        try:
+            with zipfile.ZipFile(path) as archive:
+                archive.extractall(tmp)
+            os.chmod(tmp, 0o755)
+            os.remove(path)
+            os.rename(tmp, path)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        unpacked.append(name)
+    return unpacked
+
+
+def compile_tree(python, python_dir):
+    """Précompile python_dir pour l'interpréteur python, sur tous les cœurs
+
+    Retourne le nombre de fichiers en erreur (sources propres à une autre
+    version de Python, par exemple).
+    """
+    _version(python)
+    command = [python, '-m', 'compileall', '-q', '-j', '0', '--invalidation-mode', INVALIDATION_MODE,
+               python_dir]
+    try:
+        completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   timeout=COMPILE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise PycompileError(f"compileall avec {python} : {e}") from e
+    output = completed.stdout.decode(errors='replace')
+    errors = sum(1 for line in output.splitlines() if line.startswith('***'))
+    if completed.returncode != 0 and errors == 0:
+        raise PycompileError(f"compileall avec {python} a échoué (code {completed.returncode})")
+    return errors
+
+
+def python_path(python_dir, role):
+    """PYTHONPATH que Spark donne au driver PySpark (bin/pyspark) ou aux workers"""
+    py4j = glob.glob(os.path.join(python_dir, 'lib', 'py4j-*-src.zip'))
+    if role == 'driver':
+        entries = py4j + [python_dir]
+    else:
+        entries = [os.path.join(python_dir, 'lib', 'pyspark.zip')] + py4j
+    return os.pathsep.join(entries)
+
+
+def measure(python, python_dir, bytecode=True, runs=MEASURE_RUNS):
+    """Durées médianes d'import de PySpark par le driver et par un worker
+
+    Rien n'est écrit sur disque, comme sur une image en lecture seule ;
+    bytecode=False ignore aussi les .pyc existants.
+    """
+    cache = tempfile.mkdtemp(prefix='pycache-')
+    try:
+        result = {}
+        for role, statement in (('driver', DRIVER_IMPORT), ('worker', WORKER_IMPORT)):
+            env = dict(os.environ, PYTHONPATH=python_path(python_dir, role), PYTHONDONTWRITEBYTECODE='1')
+            if not bytecode:
+                # Les .pyc sont cherchés dans ce répertoire vide plutôt qu'à côté des sources
+                env['PYTHONPYCACHEPREFIX'] = cache
+            seconds = []
+            for _ in range(runs):
+                started = time.monotonic()
+                completed = subprocess.run([python, '-c', statement], stdout=subprocess.DEVNULL,
+                                           stderr=subprocess.PIPE, env=env, timeout=COMPILE_TIMEOUT)
+                seconds.append(time.monotonic() - started)
+                if completed.returncode != 0:
+                    lines = completed.stderr.decode(errors='replace').strip().splitlines()
+                    raise PycompileError(f"Import de PySpark impossible avec {python} : "
+                                         f"{lines[-1] if lines else completed.returncode}")
+            result[role] = statistics.median(seconds)
+        return result
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+
+
+def precompile(distribution_dir, pythons, unpack=False, runs=MEASURE_RUNS):
+    """Précompile $SPARK_HOME/python pour chaque interpréteur et mesure l'import avant et après
+
+    unpack=True remplace d'abord les zip de python/lib par leur contenu
+    (voir unpack_zips). Retourne un dictionnaire : unpacked et, par
+    interpréteur, errors, before et after (voir measure) ou error.
+    """
+    python_dir = os.path.join(distribution_dir, 'python')
+    if not os.path.isdir(python_dir):
+        raise PycompileError(f"{python_dir} absent (profil sans PySpark)")
+    result = {'unpacked': [], 'interpreters': {}}
+    with telemetry.span('pycompile', interpreters=len(pythons), unpack=unpack) as span:
+        before = {}
+        for python in pythons:
+            try:
+                before[python] = measure(python, python_dir, bytecode=False, runs=runs)
+            except PycompileError as e:
+                result['interpreters'][python] = {'error': str(e)}
+        if unpack:
+            result['unpacked'] = unpack_zips(python_dir)
+        for python in before:
+            try:
+                with telemetry.span('pycompile.compile', parent=span, python=python):
+                    errors = compile_tree(python, python_dir)
+                after = measure(python, python_dir, runs=runs)
+            except PycompileError as e:
+                result['interpreters'][python] = {'error': str(e)}
+                continue
+            result['interpreters'][python] = {'errors': errors, 'before': before[python], 'after': after}
+    return result
+
+
+def format_measure(result):
+    """Tableau des durées d'import sans et avec bytecode, par interpréteur"""
+    lines = []
+    for python, stats in result['interpreters'].items():
+        if 'error' in stats:
+            lines.append(f"{python} : {stats['error']}")
+            continue
+        lines.append(f"{python:<40} {'source':>8} {'.pyc':>8}")
+        for role, label in (('driver', 'import pyspark (driver)'), ('worker', 'import pyspark.worker')):
+            before, after = stats['before'][role], stats['after'][role]
+            lines.append(f"  {label:<38} {before:>7.2f}s {after:>7.2f}s  ({(after - before) / before:+.0%})")
+    return '\n'.join(lines)
@@ -0,0 +1,286 @@
+import glob
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+import artifact_cache
+import lazyimport
+import telemetry
+
+statistics = lazyimport.module('statistics')
+
+SMOKE_DIR = os.path.join(artifact_cache.CACHE_DIR, 'smoke')
+SMOKE_TIMEOUT = 900
+SMOKE_HISTORY = 10
+# Un nœud est signalé s'il fait THRESHOLD % moins bien que la référence
+THRESHOLD = 30.0
+SHUFFLE_ROWS = 20_000_000
+PARQUET_ROWS = 5_000_000
+UDF_ROWS = 1_000_000
+RESULT_PREFIX = 'SMOKE_RESULT '
+
+# Métrique -> (libellé, unité, sens) : 'rate' se compare par cœur, plus haut est mieux ;
+# 'latency' se compare telle quelle, plus bas est mieux
+METRICS = {
+    'startup': ("Démarrage de la session", 's', 'latency'),
+    'shuffle': ("Agrégation avec shuffle", 'lignes/s', 'rate'),
+    'parquet_write': ("Écriture Parquet", 'o/s', 'rate'),
+    'parquet_read': ("Lecture Parquet", 'lignes/s', 'rate'),
+    'udf': ("UDF Python", 'lignes/s', 'rate'),
+    'udf_latency': ("Aller-retour UDF", 's', 'latency'),
+}
+
+# Trois charges courtes en local[*] ; le résultat est imprimé sur une ligne JSON
+PYSPARK_JOB = """import json, os, sys, time
+started = time.perf_counter()
+from pyspark.sql import SparkSession, functions as F, types as T
+spark = SparkSession.builder.master('local[*]').appName('spark-installer-smoke').getOrCreate()
+spark.range(1).collect()
+result = {'startup': time.perf_counter() - started}
+shuffle_rows, parquet_rows, udf_rows = (int(arg) for arg in sys.argv[1:4])
+workdir = sys.argv[4]
+
+def timed(action):
+    begin = time.perf_counter()
+    action()
+    return time.perf_counter() - begin
+
+seconds = timed(lambda: spark.range(shuffle_rows).groupBy((F.col('id') % 100003).alias('k'))
+                .agg(F.sum('id')).agg(F.count('*')).collect())
+result['shuffle'] = shuffle_rows / seconds
+path = os.path.join(workdir, 'parquet')
+frame = spark.range(parquet_rows).select('id', F.col('id').cast('string').alias('s'), F.rand(7).alias('r'))
+seconds = timed(lambda: frame.write.mode('overwrite').parquet(path))
+size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+result['parquet_write'] = size / seconds
+seconds = timed(lambda: spark.read.parquet(path).agg(F.count('*'), F.sum('r')).collect())
+result['parquet_read'] = parquet_rows / seconds
+square = F.udf(lambda x: x * x, T.LongType())
+spark.range(10).select(square('id')).collect()
+result['udf_latency'] = timed(lambda: spark.range(10).select(square('id')).collect())
+seconds = timed(lambda: spark.range(udf_rows).select(square('id').alias('v')).agg(F.sum('v')).collect())
+result['udf'] = udf_rows / seconds
+print('SMOKE_RESULT ' + json.dumps(result), flush=True)
+spark.stop()
+"""
+
+# Sans PySpark (profil scala-batch) : mêmes charges en Spark SQL, sauf l'UDF Python
+SQL_JOB = """SELECT count(*) FROM (SELECT id % 100003 AS k, sum(id) FROM range({shuffle_rows}) GROUP BY id % 100003);
+INSERT OVERWRITE DIRECTORY '{path}' USING parquet
+SELECT id, cast(id AS string) AS s, rand(7) AS r FROM range({parquet_rows});
+SELECT count(*), sum(r) FROM parquet.`{path}`;
+"""
+_TIME_TAKEN = re.compile(r'Time taken: ([\d.]+) seconds')
+
+
+class SmokeError(Exception):
+    """Erreur levée quand les charges de validation ne peuvent pas s'exécuter"""
+
+
+def node_name():
+    return socket.gethostname()
+
+
+def _run(command, distribution_dir, workdir):
+    """Lance command hors ligne ; retourne (durée, sortie). Lève SmokeError si la commande échoue"""
+    # Aucune résolution de nom ni interface publique : le driver écoute sur la boucle locale
+    env = dict(os.environ, SPARK_HOME=distribution_dir, SPARK_LOCAL_IP='127.0.0.1',
+               SPARK_LOCAL_DIRS=os.environ.get('SPARK_LOCAL_DIRS', workdir))
+    started = time.monotonic()
+    try:
+        completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+                                   cwd=workdir, timeout=SMOKE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise SmokeError(f"{os.path.basename(command[0])} : {e}") from e
+    seconds = time.monotonic() - started
+    output = completed.stdout.decode(errors='replace')
+    if completed.returncode != 0:
+        lines = [line for line in output.splitlines() if line.strip()]
+        raise SmokeError(f"{os.path.basename(command[0])} a échoué (code {completed.returncode}) : "
+                         f"{lines[-1] if lines else ''}")
+    return seconds, output
+
+
+def _options():
+    return ['--master', 'local[*]', '--conf', 'spark.ui.enabled=false',
+            '--conf', 'spark.sql.adaptive.enabled=true']
+
+
+def _pyspark(distribution_dir, workdir):
+    script = os.path.join(workdir, 'smoke_job.py')
+    with open(script, 'w') as f:
+        f.write(PYSPARK_JOB)
+    command = [os.path.join(distribution_dir, 'bin', 'spark-submit')] + _options() + [
+        script, str(SHUFFLE_ROWS), str(PARQUET_ROWS), str(UDF_ROWS), workdir]
+    _, output = _run(command, distribution_dir, workdir)
+    for line in output.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise SmokeError("Le job de validation n'a pas rendu de résultat")
+
+
+def _sql(distribution_dir, workdir):
+    script = os.path.join(workdir, 'smoke.sql')
+    path = os.path.join(workdir, 'parquet')
+    with open(script, 'w') as f:
+        f.write(SQL_JOB.format(shuffle_rows=SHUFFLE_ROWS, parquet_rows=PARQUET_ROWS, path=path))
+    command = [os.path.join(distribution_dir, 'bin', 'spark-sql')] + _options() + ['-f', script]
+    seconds, output = _run(command, distribution_dir, workdir)
+    taken = [float(value) for value in _TIME_TAKEN.findall(output)]
+    if len(taken) != 3:
+        raise SmokeError(f"Durées de spark-sql illisibles ({len(taken)} requêtes sur 3)")
+    size = sum(os.path.getsize(p) for p in glob.glob(os.path.join(path, '*')) if os.path.isfile(p))
+    return {
+        # Sans mesure interne, le démarrage est ce qui reste hors des requêtes
+        'startup': max(seconds - sum(taken), 0.0),
+        'shuffle': SHUFFLE_ROWS / taken[0],
+        'parquet_write': size / taken[1],
+        'parquet_read': PARQUET_ROWS / taken[2],
+    }
+
+
+def run(distribution_dir):
+    """Exécute les charges de validation en local[*], sans réseau, dans un répertoire jetable
+
+    PySpark si la distribution l'embarque, sinon Spark SQL (sans l'UDF
+    Python). Retourne {métrique: valeur} (voir METRICS).
+    """
+    workdir = tempfile.mkdtemp(prefix='smoke-')
+    try:
+        with telemetry.span('smoke') as span:
+            if os.path.isdir(os.path.join(distribution_dir, 'python', 'pyspark')):
+                result = _pyspark(distribution_dir, workdir)
+            else:
+                result = _sql(distribution_dir, workdir)
+            span.set(**result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def _path(smoke_dir, node):
+    return os.path.join(smoke_dir, f"{node}.json")
+
+
+def load(smoke_dir, node):
+    """Historique de node dans smoke_dir, ou None"""
+    try:
+        with open(_path(smoke_dir, node)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def record(smoke_dir, node, distribution, cpus, result):
+    """Ajoute result à l'historique de node (SMOKE_HISTORY mesures au plus) ; retourne le document"""
+    document = load(smoke_dir, node) or {'node': node, 'runs': []}
+    document['runs'] = (document['runs'] + [{
+        'created': time.time(),
+        'distribution': distribution,
+        'cpus': cpus,
+        'results': result,
+    }])[-SMOKE_HISTORY:]
+    os.makedirs(smoke_dir, exist_ok=True)
+    tmp = f"{_path(smoke_dir, node)}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp, _path(smoke_dir, node))
+    return document
+
+
+def _normalized(run, metric):
+    value = run['results'][metric]
+    return value / max(run['cpus'], 1) if METRICS[metric][2] == 'rate' else value
+
+
+def _reference(runs, metric):
+    values = [_normalized(run, metric) for run in runs if metric in run['results']]
+    return statistics.median(values) if values else None
+
+
+def baselines(smoke_dir, node):
+    """Références de node : médiane de ses mesures précédentes, et de la dernière mesure des autres nœuds
+
+    smoke_dir peut être un répertoire partagé entre les nœuds (NFS) ou
+    dans lequel on rassemble leurs fichiers. Les débits sont ramenés au
+    nombre de cœurs, pour comparer des machines de tailles différentes.
+    """
+    own = load(smoke_dir, node)
+    previous = own['runs'][:-1] if own else []
+    others = []
+    for path in sorted(glob.glob(os.path.join(smoke_dir, '*.json'))):
+        if path == _path(smoke_dir, node):
+            continue
+        try:
+            with open(path) as f:
+                document = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if document.get('runs'):
+            others.append(document['runs'][-1])
+    return {
+        'node': {metric: _reference(previous, metric) for metric in METRICS},
+        'fleet': {metric: _reference(others, metric) for metric in METRICS},
+        'nodes': len(others),
+    }
+
+
+def compare(run, references, threshold=THRESHOLD):
+    """Métriques de run moins bonnes que la référence de plus de threshold %
+
+    Retourne une liste de (métrique, référence ('node' ou 'fleet'),
+    valeur de référence, valeur mesurée, écart en %), valeurs normalisées.
+    """
+    flagged = []
+    for metric, (_, _, kind) in METRICS.items():
+        if metric not in run['results']:
+            continue
+        value = _normalized(run, metric)
+        for scope in ('node', 'fleet'):
+            reference = references[scope][metric]
+            if not reference:
+                continue
+            percent = (value / reference - 1) * 100
+            if (percent < -threshold) if kind == 'rate' else (percent > threshold):
+                flagged.append((metric, scope, reference, value, percent))
+    return flagged
+
+
+def _format_value(value, unit):
+    if unit == 's':
+        return f"{value:.2f} s"
+    if unit == 'o/s':
+        return f"{value / 1024 ** 2:.1f} Mo/s"
+    return f"{value / 1e6:.2f} M{unit}"
+
+
+def format_run(run, references):
+    """Tableau des mesures face aux références du nœud et de la flotte (débits par cœur)"""
+    lines = [f"{'Charge':<26} {'Mesure':>16} {'Par cœur':>16} {'Nœud':>16} {'Flotte':>16}"]
+    for metric, (label, unit, kind) in METRICS.items():
+        if metric not in run['results']:
+            continue
+        value = run['results'][metric]
+        cells = [_format_value(value, unit),
+                 _format_value(_normalized(run, metric), unit) if kind == 'rate' else '']
+        for scope in ('node', 'fleet'):
+            reference = references[scope][metric]
+            cells.append(_format_value(reference, unit) if reference else '-')
+        lines.append(f"{label:<26} " + ' '.join(f"{cell:>16}" for cell in cells))
+    return '\n'.join(lines)
+
+
+def format_flags(flagged):
+    """Une ligne ⚠ par métrique en retrait sur la référence du nœud ou de la flotte"""
+    scopes = {'node': "mesures précédentes du nœud", 'fleet': "flotte"}
+    lines = []
+    for metric, scope, reference, value, percent in flagged:
+        label, unit, _ = METRICS[metric]
+        lines.append(f"⚠ {label} : {_format_value(value, unit)} contre {_format_value(reference, unit)} "
+                     f"({scopes[scope]}, {percent:+.0f} %)")
+    return '\n'.join(lines)
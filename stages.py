@@ -0,0 +1,186 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import telemetry
+
+PENDING = 'en attente'
+RUNNING = 'en cours'
+DONE = 'terminée'
+FAILED = 'échec'
+SKIPPED = 'ignorée'
+
+
+class StageError(Exception):
+    """Erreur levée quand le graphe des étapes est invalide"""
+
+
+class Stage:
+    """Une étape de l'installation et les mesures faites pendant son exécution"""
+
+    def __init__(self, name, func, requires=(), label=None):
+        self.name = name
+        self.func = func
+        self.requires = list(requires)
+        self.label = label or name
+        self.status = PENDING
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def seconds(self):
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, {self.status})"
+
+
+class Scheduler:
+    """Exécute des étapes dépendantes en parallèle
+
+    Chaque étape déclare les étapes dont elle dépend ; elle démarre dès que
+    toutes sont terminées, sur son propre thread. Une étape échoue si sa
+    fonction lève une exception ou retourne False ; les étapes qui en
+    dépendent sont alors ignorées, les autres continuent.
+
+    listener(étape), s'il est donné, est appelé à chaque changement d'état,
+    depuis le thread de l'étape.
+    """
+
+    def __init__(self, listener=None):
+        self.stages = {}
+        self.listener = listener
+        self.origin = None
+
+    def add(self, name, func, requires=(), label=None):
+        if name in self.stages:
+            raise StageError(f"Étape en double : {name}")
+        self.stages[name] = Stage(name, func, requires, label)
+        return self.stages[name]
+
+    def _validate(self):
+        for stage in self.stages.values():
+            unknown = [name for name in stage.requires if name not in self.stages]
+            if unknown:
+                raise StageError(f"{stage.name} dépend d'étapes inconnues : {', '.join(unknown)}")
+        visiting, visited = set(), set()
+
+        def visit(name, path):
+            if name in visited:
+                return
+            if name in visiting:
+                raise StageError(f"Dépendance circulaire : {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for required in self.stages[name].requires:
+                visit(required, path + [name])
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name, [])
+
+    def _notify(self, stage, status):
+        stage.status = status
+        if self.listener is not None:
+            self.listener(stage)
+
+    def _execute(self, stage, parent):
+        stage.started = time.monotonic() - self.origin
+        self._notify(stage, RUNNING)
+        try:
+            with telemetry.span(f"stage.{stage.name}", parent=parent) as span:
+                ok = stage.func() is not False
+                span.set(ok=ok)
+        except Exception as e:
+            stage.error = str(e)
+            ok = False
+        stage.finished = time.monotonic() - self.origin
+        self._notify(stage, DONE if ok else FAILED)
+
+    def _ready(self, pending):
+        """Retire de pending les étapes à lancer, et ignore celles qui ne pourront pas l'être"""
+        ready = []
+        changed = True
+        while changed:
+            changed = False
+            for stage in list(pending):
+                states = [self.stages[name].status for name in stage.requires]
+                if any(state in (FAILED, SKIPPED) for state in states):
+                    pending.remove(stage)
+                    self._notify(stage, SKIPPED)
+                    changed = True
+                elif all(state == DONE for state in states):
+                    pending.remove(stage)
+                    ready.append(stage)
+        return ready
+
+    def run(self):
+        """Exécute toutes les étapes et retourne le rapport (voir report)"""
+        self._validate()
+        self.origin = time.monotonic()
+        parent = telemetry.current()
+        pending = list(self.stages.values())
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1), thread_name_prefix='stage') as pool:
+            running = set()
+            while True:
+                for stage in self._ready(pending):
+                    running.add(pool.submit(self._execute, stage, parent))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+        return self.report()
+
+    def critical_path(self):
+        """Chaîne d'étapes qui a déterminé la durée totale
+
+        On part de l'étape terminée en dernier et on remonte, à chaque fois,
+        vers la dépendance qui s'est terminée le plus tard.
+        """
+        finished = [s for s in self.stages.values() if s.finished is not None]
+        if not finished:
+            return []
+        stage = max(finished, key=lambda s: s.finished)
+        path = [stage]
+        while stage.requires:
+            stage = max((self.stages[name] for name in stage.requires), key=lambda s: s.finished or 0)
+            path.append(stage)
+        return list(reversed(path))
+
+    def report(self):
+        """Rapport d'exécution : durée totale, détail par étape et chemin critique"""
+        finished = [s.finished for s in self.stages.values() if s.finished is not None]
+        return {
+            'ok': all(s.status == DONE for s in self.stages.values()),
+            'seconds': max(finished, default=0.0),
+            'stages': [
+                {
+                    'name': s.name,
+                    'label': s.label,
+                    'requires': s.requires,
+                    'status': s.status,
+                    'started': s.started,
+                    'seconds': s.seconds,
+                    'error': s.error,
+                }
+                for s in self.stages.values()
+            ],
+            'critical_path': [s.name for s in self.critical_path()],
+        }
+
+
+def format_report(report):
+    """Tableau récapitulatif des étapes et du chemin critique"""
+    lines = [f"{'Étape':<28} {'Début':>8} {'Durée':>8}  État"]
+    for stage in report['stages']:
+        if stage['started'] is None:
+            lines.append(f"{stage['label']:<28} {'-':>8} {'-':>8}  {stage['status']}")
+            continue
+        status = stage['status'] + (f" ({stage['error']})" if stage['error'] else "")
+        lines.append(f"{stage['label']:<28} {stage['started']:>7.2f}s {stage['seconds']:>7.2f}s  {status}")
+    labels = {stage['name']: stage for stage in report['stages']}
+    path = ' → '.join(f"{labels[name]['label']} ({labels[name]['seconds']:.2f} s)"
+                      for name in report['critical_path'])
+    lines.append(f"Chemin critique ({report['seconds']:.2f} s) : {path}")
+    return '\n'.join(lines)
@@ -0,0 +1,284 @@
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+
+METRIC_PREFIX = 'spark_installer'
+
+
+class Span:
+    """Intervalle de temps mesuré autour d'une étape ou sous-étape"""
+
+    def __init__(self, name, parent=None, attrs=None):
+        self.id = next(_ids)
+        self.name = name
+        self.parent = parent.id if isinstance(parent, Span) else parent
+        self.attrs = dict(attrs or {})
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.started = time.monotonic()
+        self.seconds = None
+        self.error = None
+
+    def set(self, **attrs):
+        """Ajoute des attributs (octets, débit, résultat...)"""
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'parent': self.parent,
+            'name': self.name,
+            'start': self.start,
+            'seconds': self.seconds,
+            'thread': self.thread,
+            'error': self.error,
+            'attrs': self.attrs,
+        }
+
+
+class _NoSpan:
+    """Span factice rendu quand la télémétrie est désactivée"""
+
+    id = None
+
+    def set(self, **attrs):
+        pass
+
+
+class Counter:
+    """Compteur incrémenté depuis plusieurs threads sans verrou
+
+    Chaque thread incrémente sa propre cellule ; value additionne les
+    cellules. Le coût par appel de add() est celui d'une addition.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.local = threading.local()
+        self.cells = []
+        self.lock = threading.Lock()
+
+    def add(self, amount=1):
+        try:
+            self.local.cell[0] += amount
+        except AttributeError:
+            cell = [amount]
+            with self.lock:
+                self.cells.append(cell)
+            self.local.cell = cell
+
+    @property
+    def value(self):
+        return sum(cell[0] for cell in self.cells)
+
+
+_ids = itertools.count(1)
+_local = threading.local()
+_lock = threading.Lock()
+_sinks = []
+_spans = []
+_counters = {}
+_NO_SPAN = _NoSpan()
+
+
+def enabled():
+    return bool(_sinks)
+
+
+def configure(sinks):
+    """Active la télémétrie avec les sinks donnés (liste vide : désactivée)"""
+    global _sinks
+    with _lock:
+        _sinks = list(sinks)
+        _spans.clear()
+        _counters.clear()
+
+
+def current():
+    """Span ouvert le plus récent du thread courant, ou None"""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def _finish(span):
+    with _lock:
+        _spans.append(span)
+        sinks = list(_sinks)
+    for sink in sinks:
+        sink.emit(span)
+
+
+@contextlib.contextmanager
+def span(name, parent=None, **attrs):
+    """Mesure la durée du bloc ; parent permet de rattacher un span ouvert dans un autre thread"""
+    if not _sinks:
+        yield _NO_SPAN
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    record = Span(name, parent if parent is not None else current(), attrs)
+    stack.append(record)
+    try:
+        yield record
+    except BaseException as e:
+        record.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stack.pop()
+        record.seconds = time.monotonic() - record.started
+        _finish(record)
+
+
+def observe(name, seconds, parent=None, **attrs):
+    """Enregistre une durée déjà mesurée (par exemple cumulée sur un pool de threads)"""
+    if not _sinks:
+        return
+    record = Span(name, parent if parent is not None else current(), attrs)
+    record.seconds = seconds
+    _finish(record)
+
+
+def counter(name):
+    """Compteur nommé, partagé par tous les threads"""
+    with _lock:
+        if name not in _counters:
+            _counters[name] = Counter(name)
+        return _counters[name]
+
+
+def close():
+    """Transmet l'ensemble des mesures aux sinks et les ferme"""
+    with _lock:
+        spans = list(_spans)
+        counters = {name: c.value for name, c in _counters.items()}
+        sinks = list(_sinks)
+    for sink in sinks:
+        sink.close(spans, counters)
+
+
+class JsonLinesSink:
+    """Une ligne JSON par span terminé, puis une ligne pour les compteurs"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+        self.lock = threading.Lock()
+
+    def emit(self, span):
+        line = json.dumps(dict(span.to_dict(), type='span'))
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self, spans, counters):
+        with self.lock:
+            self.file.write(json.dumps({'type': 'counters', 'time': time.time(), 'counters': counters}) + '\n')
+            self.file.close()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class PrometheusSink:
+    """Fichier texte pour le textfile collector de node_exporter
+
+    Écrit à la fin de l'exécution, de façon atomique (renommage), comme le
+    demande le collecteur. Les spans de même nom sont additionnés.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, span):
+        pass
+
+    def close(self, spans, counters):
+        seconds, rates, failures = {}, {}, {}
+        for span in spans:
+            seconds[span.name] = seconds.get(span.name, 0.0) + span.seconds
+            if 'rate' in span.attrs:
+                rates[span.name] = span.attrs['rate']
+            failures[span.name] = failures.get(span.name, 0) + (span.error is not None)
+        lines = [
+            f"# HELP {METRIC_PREFIX}_span_seconds Durée cumulée de chaque étape",
+            f"# TYPE {METRIC_PREFIX}_span_seconds gauge",
+        ]
+        lines += [f'{METRIC_PREFIX}_span_seconds{{span="{_escape(name)}"}} {value:.6f}'
+                  for name, value in sorted(seconds.items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_span_errors Nombre d'exécutions en erreur de chaque étape",
+            f"# TYPE {METRIC_PREFIX}_span_errors gauge",
+        ]
+        lines += [f'{METRIC_PREFIX}_span_errors{{span="{_escape(name)}"}} {value}'
+                  for name, value in sorted(failures.items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_rate_bytes_per_second Débit mesuré par étape",
+            f"# TYPE {METRIC_PREFIX}_rate_bytes_per_second gauge",
+        ]
+        lines += [f'{METRIC_PREFIX}_rate_bytes_per_second{{span="{_escape(name)}"}} {value:.1f}'
+                  for name, value in sorted(rates.items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_total Compteurs de l'installation (octets, fichiers)",
+            f"# TYPE {METRIC_PREFIX}_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_total{{counter="{_escape(name)}"}} {value}'
+                  for name, value in sorted(counters.items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds Fin de la dernière exécution",
+            f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{METRIC_PREFIX}_last_run_timestamp_seconds {time.time():.0f}",
+        ]
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
+
+
+class SummarySink:
+    """Tableau lisible des spans, en arbre, et des compteurs"""
+
+    def __init__(self, write=print):
+        self.write = write
+
+    def emit(self, span):
+        pass
+
+    def close(self, spans, counters):
+        self.write(format_summary(spans, counters))
+
+
+def format_summary(spans, counters):
+    """Arbre des spans (durée, attributs) suivi des compteurs"""
+    children = {}
+    for span in sorted(spans, key=lambda s: s.started):
+        children.setdefault(span.parent, []).append(span)
+    known = {span.id for span in spans}
+    lines = [f"{'Étape':<44} {'Durée':>9}  Détails"]
+
+    def walk(parent, depth):
+        for span in children.get(parent, []):
+            details = []
+            for key, value in span.attrs.items():
+                if key == 'rate':
+                    value = f"{value / 1024 ** 2:.1f} Mo/s"
+                elif key == 'bytes':
+                    value = f"{value / 1024 ** 2:.1f} Mo"
+                elif isinstance(value, float):
+                    value = f"{value:.3f}"
+                details.append(f"{key}={value}")
+            if span.error:
+                details.append(f"❌ {span.error}")
+            name = '  ' * depth + span.name
+            lines.append(f"{name:<44} {span.seconds:>8.3f}s  {' '.join(details)}")
+            walk(span.id, depth + 1)
+
+    # Racines : spans sans parent ou dont le parent n'a pas été enregistré
+    for root in sorted({s.parent for s in spans if s.parent is None or s.parent not in known},
+                       key=lambda p: (p is not None, p or 0)):
+        walk(root, 0)
+    for name, value in sorted(counters.items()):
+        lines.append(f"{name:<44} {value:>9}")
+    return '\n'.join(lines)
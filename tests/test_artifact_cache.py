@@ -0,0 +1,79 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifact_cache
+
+SIZE = 1000
+
+
+def writer(data, calls=None, delay=0):
+    """Faux téléchargement : écrit data et retourne son SHA-512"""
+    def download(path):
+        if calls is not None:
+            calls.append(path)
+        time.sleep(delay)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return hashlib.sha512(data).hexdigest()
+    return download
+
+
+def test_fetch_downloads_once_then_hits(tmp_path):
+    cache = artifact_cache.ArtifactCache(str(tmp_path / 'cache'))
+    calls = []
+    data = os.urandom(SIZE)
+    assert not cache.fetch('http://a/spark.tgz', str(tmp_path / 'first'), writer(data, calls))
+    assert cache.fetch('http://a/spark.tgz', str(tmp_path / 'second'), writer(data, calls))
+    assert len(calls) == 1
+    assert (tmp_path / 'second').read_bytes() == data
+    # Un SHA-512 attendu différent ne correspond pas à l'objet en cache
+    assert cache.lookup('http://a/spark.tgz', sha512='0' * 128) is None
+
+
+def test_same_url_downloaded_once_across_concurrent_fetches(tmp_path):
+    cache = artifact_cache.ArtifactCache(str(tmp_path / 'cache'))
+    calls = []
+    data = os.urandom(SIZE)
+    hits = []
+
+    def install(name):
+        hits.append(cache.fetch('http://a/spark.tgz', str(tmp_path / name), writer(data, calls, 0.3)))
+
+    threads = [threading.Thread(target=install, args=(f"dest{i}",)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(hits) == [False, True, True]
+    assert all((tmp_path / f"dest{i}").read_bytes() == data for i in range(3))
+
+
+def test_least_recently_used_object_is_evicted(tmp_path):
+    cache = artifact_cache.ArtifactCache(str(tmp_path / 'cache'), max_bytes=3 * SIZE)
+    urls = [f"http://a/{name}.tgz" for name in 'abcd']
+    for age, url in enumerate(urls[:3]):
+        path = str(tmp_path / 'incoming')
+        stored = cache.store(url, path, writer(os.urandom(SIZE))(path))
+        os.utime(stored, (1000 + age, 1000 + age))
+    # a est le plus ancien, mais vient d'être utilisé : c'est b qui part
+    assert cache.lookup(urls[0]) is not None
+    path = str(tmp_path / 'incoming')
+    cache.store(urls[3], path, writer(os.urandom(SIZE))(path))
+    assert cache.lookup(urls[1]) is None
+    assert all(cache.lookup(url) is not None for url in (urls[0], urls[2], urls[3]))
+    assert len(os.listdir(tmp_path / 'cache' / 'objects')) == 3
+
+
+def test_evict_keeps_object_larger_than_budget(tmp_path):
+    cache = artifact_cache.ArtifactCache(str(tmp_path / 'cache'), max_bytes=SIZE // 2)
+    path = str(tmp_path / 'incoming')
+    stored = cache.store('http://a/big.tgz', path, writer(os.urandom(SIZE))(path))
+    assert os.path.exists(stored)
+    assert cache.evict() == 1
+    assert cache.lookup('http://a/big.tgz') is None
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import downloader
+import localserver
+
+SEGMENT = 256 * 1024
+SIZE = 10 * SEGMENT + 1234
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    split = downloader.split_segments
+    monkeypatch.setattr(downloader, 'SEGMENT_SIZE', SEGMENT)
+    monkeypatch.setattr(downloader, 'split_segments', lambda total_size: split(total_size, SEGMENT))
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    data = os.urandom(SIZE)
+    served = tmp_path / 'www'
+    served.mkdir()
+    (served / 'spark.tgz').write_bytes(data)
+    server = localserver.serve_directory(str(served))
+    yield server.url + 'spark.tgz', served / 'spark.tgz', data
+    server.shutdown()
+    server.server_close()
+
+
+def interrupt_after(limit):
+    def progress(done, total):
+        if done >= limit:
+            raise Interrupted()
+    return progress
+
+
+def test_parallel_download_matches_source(mirror, small_segments, tmp_path):
+    url, _, data = mirror
+    result = downloader.download_file(url, str(tmp_path / 'out'), connections=4,
+                                      checksum=hashlib.sha512(data).hexdigest(), progress=False)
+    assert (tmp_path / 'out').read_bytes() == data
+    assert result['bytes'] == SIZE
+    assert result['connections'] == 4
+    assert result['verified']
+    assert not os.path.exists(str(tmp_path / 'out') + downloader.STATE_SUFFIX)
+
+
+def test_resume_after_interruption(mirror, small_segments, tmp_path):
+    url, _, data = mirror
+    path = str(tmp_path / 'out')
+    with pytest.raises(Interrupted):
+        downloader.download_file(url, path, connections=1, checksum=False,
+                                 progress=interrupt_after(4 * SEGMENT))
+    assert os.path.exists(path + downloader.STATE_SUFFIX)
+    result = downloader.download_file(url, path, connections=2,
+                                      checksum=hashlib.sha512(data).hexdigest(), progress=False)
+    assert (tmp_path / 'out').read_bytes() == data
+    # Le segment suivant a pu être écrit avant l'annulation
+    resumed = SIZE - result['bytes']
+    assert resumed >= 4 * SEGMENT and resumed % SEGMENT == 0
+    assert result['sha512'] == hashlib.sha512(data).hexdigest()
+
+
+def test_resume_refetches_from_corrupted_segment(mirror, small_segments, tmp_path):
+    url, _, data = mirror
+    path = str(tmp_path / 'out')
+    with pytest.raises(Interrupted):
+        downloader.download_file(url, path, connections=1, checksum=False,
+                                 progress=interrupt_after(6 * SEGMENT))
+    with open(path, 'r+b') as f:
+        f.seek(2 * SEGMENT + 10)
+        f.write(b'\0' * 16)
+    result = downloader.download_file(url, path, connections=2,
+                                      checksum=hashlib.sha512(data).hexdigest(), progress=False)
+    assert (tmp_path / 'out').read_bytes() == data
+    assert result['bytes'] == SIZE - 2 * SEGMENT
+
+
+def test_checksum_mismatch_repairs_only_bad_segment(mirror, small_segments, tmp_path, capsys):
+    url, served, data = mirror
+    # Le serveur livre d'abord un segment altéré, puis le bon contenu à la relecture
+    altered = bytearray(data)
+    altered[3 * SEGMENT + 100] ^= 0xff
+    served.write_bytes(bytes(altered))
+
+    def restore(done, total):
+        if done == total:
+            served.write_bytes(data)
+
+    downloader.download_file(url, str(tmp_path / 'out'), connections=2,
+                             checksum=hashlib.sha512(data).hexdigest(), progress=restore)
+    assert (tmp_path / 'out').read_bytes() == data
+    assert '1 segment(s) récupéré(s)' in capsys.readouterr().out
+
+
+def test_checksum_mismatch_without_fix_raises(mirror, small_segments, tmp_path):
+    url, _, data = mirror
+    path = str(tmp_path / 'out')
+    with pytest.raises(downloader.ChecksumError):
+        downloader.download_file(url, path, connections=2, checksum='0' * 128, progress=False)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + downloader.STATE_SUFFIX)
+
+
+def test_stream_delivers_segments_in_order(mirror, small_segments):
+    url, _, data = mirror
+    chunks = []
+    result = downloader.stream_file(url, chunks.append, connections=4,
+                                    checksum=hashlib.sha512(data).hexdigest())
+    assert b''.join(chunks) == data
+    assert result['sha512'] == hashlib.sha512(data).hexdigest()
@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fleet
+
+
+def plan(*targets, **settings):
+    return dict(settings, targets=list(targets))
+
+
+def test_defaults_fill_targets(tmp_path):
+    result = fleet.validate(plan(
+        {'version': '3.4.1', 'install_dir': str(tmp_path / 'a')},
+        {'version': '3.5.0', 'install_dir': str(tmp_path / 'b'), 'profile': 'full', 'priority': 5},
+        defaults={'profile': 'minimal-pyspark', 'activate': True},
+        bandwidth=50, workers=2,
+    ))
+    first, second = result['targets']
+    assert first['profile'] == 'minimal-pyspark' and first['activate']
+    assert first['variant'] == 'hadoop3' and first['priority'] == 0
+    assert first['distribution'] == 'spark-3.4.1-bin-hadoop3'
+    assert first['name'] == f"spark-3.4.1-bin-hadoop3@{tmp_path / 'a'}"
+    assert second['profile'] == 'full' and second['priority'] == 5
+    assert result['bandwidth'] == 50 and result['workers'] == 2
+    assert result['mirrors'] is None
+
+
+def test_install_dir_is_expanded(monkeypatch, tmp_path):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    target, = fleet.validate(plan({'version': '3.4.1', 'install_dir': '~/spark'}))['targets']
+    assert target['install_dir'] == str(tmp_path / 'spark')
+
+
+def test_mirrors_get_a_trailing_slash():
+    result = fleet.validate(plan({'version': '3.4.1', 'install_dir': '/opt/spark'},
+                                 mirrors=['https://a.example/spark', 'https://b.example/spark/']))
+    assert result['mirrors'] == ['https://a.example/spark/', 'https://b.example/spark/']
+
+
+@pytest.mark.parametrize('document, message', [
+    ({'targets': []}, "liste targets non vide"),
+    (plan({'version': '3.4.1', 'install_dir': '/opt'}, threads=4), "Clés inconnues dans le plan : threads"),
+    (plan({'install_dir': '/opt'}), "Cible 1 : version manquant"),
+    (plan({'version': '3.4.1', 'install_dir': '/opt', 'color': 'red'}), "clés inconnues color"),
+    (plan({'version': '3.4.1', 'install_dir': '/opt', 'variant': 'hadoop2'}), "variante inconnue"),
+    (plan({'version': '3.4.1', 'install_dir': '/opt', 'profile': 'tiny'}), "profil inconnu"),
+    (plan({'version': '3.4.1', 'install_dir': '/opt', 'priority': 'high'}), "priority doit être un entier"),
+    (plan({'version': '3.4.1', 'install_dir': '/opt'}, mirrors='https://a.example/'), "mirrors"),
+    (plan({'version': '3.4.1', 'install_dir': '/opt'}, {'version': '3.4.1', 'install_dir': '/opt/'}),
+     "apparaît deux fois"),
+    (plan({'version': '3.4.1', 'install_dir': '/opt', 'activate': True},
+          {'version': '3.5.0', 'install_dir': '/opt', 'activate': True}), "Plusieurs cibles activent"),
+])
+def test_invalid_plans_are_rejected(document, message):
+    with pytest.raises(fleet.PlanError, match=message):
+        fleet.validate(document)
+
+
+def test_load_plan_reports_unreadable_json(tmp_path):
+    path = tmp_path / 'plan.json'
+    path.write_text('{"targets": [')
+    with pytest.raises(fleet.PlanError, match="Plan illisible"):
+        fleet.load_plan(str(path))
+    path.write_text(json.dumps(plan({'version': '3.4.1', 'install_dir': str(tmp_path)})))
+    assert fleet.load_plan(str(path))['targets'][0]['version'] == '3.4.1'
+
+
+def test_priority_pool_serves_highest_priority_first():
+    pool = fleet._PriorityPool(1)
+    busy, gate = threading.Event(), threading.Event()
+    order = []
+
+    def block():
+        busy.set()
+        gate.wait()
+
+    try:
+        # Le seul thread est occupé pendant que les autres tâches s'accumulent
+        pool.submit(0, block)
+        busy.wait(5)
+        futures = [pool.submit(priority, order.append, name)
+                   for priority, name in ((0, 'low'), (10, 'high'), (5, 'medium'), (10, 'high-2'))]
+        gate.set()
+        for future in futures:
+            future.result(timeout=5)
+    finally:
+        pool.shutdown()
+    assert order == ['high', 'high-2', 'medium', 'low']
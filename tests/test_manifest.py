@@ -0,0 +1,100 @@
+import io
+import os
+import sys
+import tarfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extractor
+import installation
+import manifest
+
+DIST = 'spark-3.4.1-bin-hadoop3'
+
+
+def build_archive(path):
+    """Petite distribution : fichiers, script exécutable, lien symbolique et lien physique"""
+    with tarfile.open(path, 'w:gz') as tar:
+        def add(name, data, mode=0o644):
+            info = tarfile.TarInfo(f"{DIST}/{name}")
+            info.size = len(data)
+            info.mode = mode
+            info.mtime = 1700000000
+            tar.addfile(info, io.BytesIO(data))
+
+        directory = tarfile.TarInfo(f"{DIST}/jars")
+        directory.type = tarfile.DIRTYPE
+        directory.mode = 0o755
+        tar.addfile(directory)
+        add('RELEASE', b'Spark 3.4.1\n')
+        add('bin/spark-submit', b'#!/bin/sh\necho submit\n', 0o755)
+        add('jars/spark-core.jar', os.urandom(4096))
+        link = tarfile.TarInfo(f"{DIST}/jars/current.jar")
+        link.type = tarfile.SYMTYPE
+        link.linkname = 'spark-core.jar'
+        tar.addfile(link)
+        hard = tarfile.TarInfo(f"{DIST}/jars/core-copy.jar")
+        hard.type = tarfile.LNKTYPE
+        hard.linkname = f"{DIST}/jars/spark-core.jar"
+        tar.addfile(hard)
+
+
+def install(tmp_path):
+    archive = str(tmp_path / 'spark.tgz')
+    build_archive(archive)
+    root = str(tmp_path / 'install')
+    stats = extractor.extract_archive(archive, root, workers=2)
+    manifest.write(root, DIST, stats['entries'], version='3.4.1')
+    return archive, root, manifest.load(root, DIST)
+
+
+def test_clean_install_verifies(tmp_path):
+    _, root, document = install(tmp_path)
+    for fast in (True, False):
+        assert manifest.verify(root, document, fast=fast)['damaged'] == {}
+
+
+def test_verify_reports_each_kind_of_damage(tmp_path):
+    _, root, document = install(tmp_path)
+    release = os.path.join(root, DIST, 'RELEASE')
+    # Même taille, même date : seule la vérification complète le voit
+    with open(release, 'r+b') as f:
+        f.write(b'X')
+    os.utime(release, (1700000000, 1700000000))
+    os.chmod(os.path.join(root, DIST, 'bin/spark-submit'), 0o644)
+    os.remove(os.path.join(root, DIST, 'jars/current.jar'))
+    assert manifest.verify(root, document, fast=True)['damaged'] == {
+        f"{DIST}/bin/spark-submit": "droits modifiés",
+        f"{DIST}/jars/current.jar": "absent",
+    }
+    damaged = manifest.verify(root, document)['damaged']
+    assert damaged[f"{DIST}/RELEASE"] == "contenu modifié"
+    assert len(damaged) == 3
+
+
+def test_repair_filter_keeps_hardlink_pairs_together(tmp_path):
+    _, _, document = install(tmp_path)
+    keep = manifest.repair_filter(document, {f"{DIST}/jars/core-copy.jar": "lien physique rompu"})
+    assert keep(f"{DIST}/jars/spark-core.jar")
+    assert keep(f"/{DIST}/jars/core-copy.jar")
+    assert not keep(f"{DIST}/RELEASE")
+
+
+def test_repair_restores_only_damaged_entries(tmp_path, monkeypatch):
+    archive, root, document = install(tmp_path)
+    monkeypatch.setattr(installation, 'INSTALL_DIR', root)
+    jar = os.path.join(root, DIST, 'jars/spark-core.jar')
+    with open(jar, 'ab') as f:
+        f.write(b'corrupted')
+    os.remove(os.path.join(root, DIST, 'RELEASE'))
+    untouched = os.path.join(root, DIST, 'bin/spark-submit')
+    before = os.stat(untouched).st_ino
+    damaged = manifest.verify(root, document)['damaged']
+    assert set(damaged) == {f"{DIST}/jars/spark-core.jar", f"{DIST}/RELEASE"}
+    keep = installation.remove_damaged(document, damaged)
+    stats = extractor.extract_archive(archive, root, workers=2, keep=keep)
+    # Le lien physique est réécrit avec sa cible
+    assert set(name for name, entry in stats['entries'].items() if entry['type'] != 'dir') == {
+        f"{DIST}/RELEASE", f"{DIST}/jars/spark-core.jar", f"{DIST}/jars/core-copy.jar"}
+    assert manifest.verify(root, document)['damaged'] == {}
+    assert os.stat(untouched).st_ino == before
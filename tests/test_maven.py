@@ -0,0 +1,107 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import maven
+
+GROUP = 'org.example'
+
+
+def dependency(artifact, version=None, scope=None, optional=False, exclusions=()):
+    parts = [f"<groupId>{GROUP}</groupId>", f"<artifactId>{artifact}</artifactId>"]
+    if version:
+        parts.append(f"<version>{version}</version>")
+    if scope:
+        parts.append(f"<scope>{scope}</scope>")
+    if optional:
+        parts.append("<optional>true</optional>")
+    if exclusions:
+        parts.append("<exclusions>" + ''.join(
+            f"<exclusion><groupId>{GROUP}</groupId><artifactId>{name}</artifactId></exclusion>"
+            for name in exclusions) + "</exclusions>")
+    return "<dependency>" + ''.join(parts) + "</dependency>"
+
+
+def publish(repo, artifact, version, dependencies=(), extra='', packaging='jar'):
+    """Écrit le POM (et le jar avec sa somme .sha1) de GROUP:artifact:version dans repo"""
+    pom = (f'<project xmlns="http://maven.apache.org/POM/4.0.0"><modelVersion>4.0.0</modelVersion>'
+           f"<groupId>{GROUP}</groupId><artifactId>{artifact}</artifactId><version>{version}</version>"
+           f"<packaging>{packaging}</packaging>{extra}"
+           f"<dependencies>{''.join(dependencies)}</dependencies></project>")
+    path = repo / maven.artifact_path(GROUP, artifact, version, 'pom')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(pom)
+    if packaging == 'jar':
+        data = f"{artifact}-{version}".encode()
+        jar = repo / maven.artifact_path(GROUP, artifact, version)
+        jar.write_bytes(data)
+        (jar.parent / (jar.name + '.sha1')).write_text(hashlib.sha1(data).hexdigest() + '\n')
+
+
+def versions(artifacts):
+    return {node['artifact']: node['version'] for node in artifacts}
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / 'm2'
+    # app -> lib-a -> common 2.0 (profondeur 2) ; app -> lib-b -> lib-c -> common 1.0 (profondeur 3)
+    publish(repo, 'app', '1.0', [dependency('lib-a', '1.0'), dependency('lib-b', '1.0'),
+                                 dependency('junit', '4.13', scope='test'),
+                                 dependency('extra', '1.0', optional=True)])
+    publish(repo, 'lib-a', '1.0', [dependency('common', '2.0')])
+    publish(repo, 'lib-b', '1.0', [dependency('lib-c', '1.0', exclusions=['logging'])])
+    publish(repo, 'lib-c', '1.0', [dependency('common', '1.0'), dependency('logging', '1.0')])
+    for artifact, version in (('common', '1.0'), ('common', '2.0'), ('logging', '1.0')):
+        publish(repo, artifact, version)
+    return repo
+
+
+def test_nearest_version_wins(repo):
+    artifacts = maven.Resolver([maven.Repository(str(repo))]).resolve([f"{GROUP}:app:1.0"])
+    assert versions(artifacts) == {'app': '1.0', 'lib-a': '1.0', 'lib-b': '1.0', 'lib-c': '1.0',
+                                   'common': '2.0'}
+
+
+def test_root_declaration_overrides_transitive_version(repo):
+    artifacts = maven.Resolver([maven.Repository(str(repo))]).resolve(
+        [f"{GROUP}:app:1.0", f"{GROUP}:common:1.0"])
+    assert versions(artifacts)['common'] == '1.0'
+
+
+def test_managed_version_and_properties_from_parent(tmp_path):
+    repo = tmp_path / 'm2'
+    managed = ("<properties><common.version>2.0</common.version></properties>"
+               f"<dependencyManagement><dependencies>{dependency('common', '${common.version}')}"
+               f"</dependencies></dependencyManagement>")
+    publish(repo, 'parent', '1', extra=managed, packaging='pom')
+    publish(repo, 'child', '1.0', [dependency('common')],
+            extra=f"<parent><groupId>{GROUP}</groupId><artifactId>parent</artifactId><version>1</version></parent>")
+    publish(repo, 'common', '2.0')
+    artifacts = maven.Resolver([maven.Repository(str(repo))]).resolve([f"{GROUP}:child:1.0"])
+    assert versions(artifacts) == {'child': '1.0', 'common': '2.0'}
+
+
+def test_prefetch_copies_jars_and_reports_conflicts(repo, tmp_path):
+    jars = tmp_path / 'jars'
+    jars.mkdir()
+    (jars / 'common-1.5.jar').write_bytes(b'shipped with spark')
+    result = maven.prefetch([f"{GROUP}:app:1.0"], str(jars), [maven.Repository(str(repo))])
+    assert sorted(result['added']) == ['app-1.0.jar', 'lib-a-1.0.jar', 'lib-b-1.0.jar', 'lib-c-1.0.jar']
+    assert result['conflicts'] == ['common-2.0.jar (déjà fourni : common-1.5.jar)']
+    assert (jars / 'lib-c-1.0.jar').read_bytes() == b'lib-c-1.0'
+    assert sorted(os.listdir(jars)) == sorted(result['added'] + ['common-1.5.jar'])
+
+
+def test_prefetch_rejects_wrong_sha1(repo, tmp_path):
+    jar = repo / maven.artifact_path(GROUP, 'common', '2.0')
+    jar.write_bytes(b'tampered')
+    jars = tmp_path / 'jars'
+    jars.mkdir()
+    with pytest.raises(maven.MavenError, match="SHA-1 incorrect"):
+        maven.prefetch([f"{GROUP}:common:2.0"], str(jars), [maven.Repository(str(repo))])
+    assert os.listdir(jars) == []
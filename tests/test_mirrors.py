@@ -0,0 +1,112 @@
+import hashlib
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import downloader
+import localserver
+import mirrors
+
+PATH = 'spark/spark.tgz'
+SIZE = 3 * 1024 * 1024
+SEGMENT = 256 * 1024
+
+
+def stop(server):
+    """Arrête server et coupe ses transferts en cours, comme un miroir qui tombe"""
+    server.shutdown()
+    server.server_close()
+    for connection in server.connections:
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def payload(tmp_path):
+    data = os.urandom(SIZE)
+    (tmp_path / 'spark').mkdir()
+    (tmp_path / 'spark' / 'spark.tgz').write_bytes(data)
+    return data
+
+
+@pytest.fixture
+def serve(tmp_path):
+    started = []
+
+    def start(rate=None):
+        server = localserver.serve_directory(str(tmp_path), rate=rate)
+        server.connections = []
+        setup = server.handler.setup
+
+        def track(handler):
+            setup(handler)
+            server.connections.append(handler.connection)
+
+        server.handler.setup = track
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        stop(server)
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    split = downloader.split_segments
+    monkeypatch.setattr(downloader, 'SEGMENT_SIZE', SEGMENT)
+    monkeypatch.setattr(downloader, 'split_segments', lambda total_size: split(total_size, SEGMENT))
+
+
+def test_total_size_unknown():
+    assert mirrors._total_size('bytes 0-1023/4096') == 4096
+    assert mirrors._total_size('bytes 0-1023/*') is None
+    assert mirrors._total_size('') is None
+
+
+def test_probe_ranks_fastest_mirror_first(payload, serve):
+    slow = serve(rate=512 * 1024)
+    medium = serve(rate=2 * 1024 * 1024)
+    fast = serve()
+    ranked = mirrors.probe_mirrors([slow.url, medium.url, fast.url], PATH)
+    assert [m.base for m in ranked] == [fast.url, medium.url, slow.url]
+    assert all(m.alive and m.ranges and m.size == SIZE for m in ranked)
+    assert mirrors.MirrorPool(ranked, key=PATH).current.base == fast.url
+
+
+def test_probe_skips_dead_mirror(payload, serve):
+    dead = serve()
+    alive = serve()
+    stop(dead)
+    ranked = mirrors.probe_mirrors([dead.url, alive.url], PATH)
+    assert ranked[0].base == alive.url
+    assert not ranked[1].alive
+    assert mirrors.MirrorPool(ranked, key=PATH).mirrors == [ranked[0]]
+
+
+def test_failover_when_mirror_stops_mid_transfer(payload, serve, small_segments, tmp_path):
+    first = serve()
+    second = serve(rate=2 * 1024 * 1024)
+    pool = mirrors.MirrorPool(mirrors.probe_mirrors([first.url, second.url], PATH), key=PATH)
+    assert pool.current.base == first.url
+    # Lent pendant le transfert pour que l'arrêt tombe en plein téléchargement
+    first.handler.rate = 256 * 1024
+    second.handler.rate = None
+    timer = threading.Timer(0.5, stop, args=(first,))
+    timer.start()
+    try:
+        result = downloader.download_file(pool, str(tmp_path / 'out.tgz'), connections=2,
+                                          checksum=hashlib.sha512(payload).hexdigest(), progress=False)
+    finally:
+        timer.cancel()
+    assert (tmp_path / 'out.tgz').read_bytes() == payload
+    assert result['sha512'] == hashlib.sha512(payload).hexdigest()
+    assert pool.current.base == second.url
+    assert not pool._mirror(first.url + PATH).alive
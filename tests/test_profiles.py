@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiles
+
+ROOT = 'spark-3.4.1-bin-hadoop3/'
+
+
+def test_nested_tests_excluded_from_minimal_pyspark():
+    keep = profiles.member_filter('minimal-pyspark')
+    assert not keep(ROOT + 'python/pyspark/tests/test_context.py')
+    assert not keep(ROOT + 'python/pyspark/sql/tests/test_dataframe.py')
+    assert not keep(ROOT + 'python/pyspark/sql/tests')
+    assert not keep(ROOT + 'python/pyspark/sql/connect/tests/test_client.py')
+    assert keep(ROOT + 'python/pyspark/sql/dataframe.py')
+    assert keep(ROOT + 'python/pyspark/testing/utils.py')
+
+
+def test_directory_pattern_with_wildcard():
+    assert profiles._matches('python/pyspark/sql/tests/test_x.py', 'python/pyspark/*/tests/')
+    assert profiles._matches('python/pyspark/sql/tests', 'python/pyspark/*/tests/')
+    assert not profiles._matches('python/pyspark/sql/testsuite.py', 'python/pyspark/*/tests/')
+    assert profiles._matches('examples/jars/spark-examples.jar', 'examples/')
+    assert not profiles._matches('examples2/x', 'examples/')
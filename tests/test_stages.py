@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stages
+
+
+def recorder(log, name, result=True, delay=0.0):
+    def run():
+        log.append(('start', name))
+        time.sleep(delay)
+        log.append(('end', name))
+        return result
+    return run
+
+
+def test_stages_start_after_their_requirements():
+    log = []
+    scheduler = stages.Scheduler()
+    scheduler.add('download', recorder(log, 'download', delay=0.05))
+    scheduler.add('extract', recorder(log, 'extract'), requires=['download'])
+    scheduler.add('packages', recorder(log, 'packages'))
+    scheduler.add('activate', recorder(log, 'activate'), requires=['extract', 'packages'])
+    report = scheduler.run()
+    assert report['ok']
+    assert log.index(('end', 'download')) < log.index(('start', 'extract'))
+    assert log.index(('end', 'extract')) < log.index(('start', 'activate'))
+    assert log.index(('end', 'packages')) < log.index(('start', 'activate'))
+    assert report['critical_path'] == ['download', 'extract', 'activate']
+
+
+def test_independent_stages_overlap():
+    barrier = threading.Barrier(2, timeout=5)
+    scheduler = stages.Scheduler()
+    # Chaque étape attend l'autre : elles ne passent que si elles tournent en même temps
+    scheduler.add('packages', barrier.wait)
+    scheduler.add('download', barrier.wait)
+    assert scheduler.run()['ok']
+
+
+def test_failure_skips_dependents_only():
+    log = []
+    scheduler = stages.Scheduler()
+
+    def broken():
+        raise RuntimeError("miroir injoignable")
+
+    scheduler.add('download', broken)
+    scheduler.add('extract', recorder(log, 'extract'), requires=['download'])
+    scheduler.add('activate', recorder(log, 'activate'), requires=['extract'])
+    scheduler.add('packages', recorder(log, 'packages', result=False))
+    scheduler.add('python', recorder(log, 'python'), requires=['packages'])
+    scheduler.add('prerequisites', recorder(log, 'prerequisites'))
+    report = scheduler.run()
+    status = {stage['name']: stage['status'] for stage in report['stages']}
+    assert not report['ok']
+    assert status == {
+        'download': stages.FAILED,
+        'extract': stages.SKIPPED,
+        'activate': stages.SKIPPED,
+        'packages': stages.FAILED,
+        'python': stages.SKIPPED,
+        'prerequisites': stages.DONE,
+    }
+    assert report['stages'][0]['error'] == "miroir injoignable"
+    assert ('start', 'extract') not in log and ('start', 'python') not in log
+
+
+def test_listener_sees_every_transition():
+    seen = []
+    scheduler = stages.Scheduler(listener=lambda stage: seen.append((stage.name, stage.status)))
+    scheduler.add('a', lambda: True)
+    scheduler.add('b', lambda: False, requires=['a'])
+    scheduler.add('c', lambda: True, requires=['b'])
+    scheduler.run()
+    assert seen == [('a', stages.RUNNING), ('a', stages.DONE), ('b', stages.RUNNING),
+                    ('b', stages.FAILED), ('c', stages.SKIPPED)]
+
+
+def test_invalid_graphs_are_rejected():
+    scheduler = stages.Scheduler()
+    scheduler.add('a', lambda: True, requires=['b'])
+    scheduler.add('b', lambda: True, requires=['a'])
+    with pytest.raises(stages.StageError, match="circulaire"):
+        scheduler.run()
+    scheduler = stages.Scheduler()
+    scheduler.add('a', lambda: True, requires=['missing'])
+    with pytest.raises(stages.StageError, match="inconnues"):
+        scheduler.run()
+    with pytest.raises(stages.StageError, match="double"):
+        scheduler.add('a', lambda: True)
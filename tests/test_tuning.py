@@ -0,0 +1,75 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tuning
+
+GB = 1024 ** 3
+
+
+def host(tmp_path, cpus=8):
+    return {
+        'cpus': cpus,
+        'memory': 32 * GB,
+        'numa': [{'cpus': cpus // 2, 'memory': 16 * GB}, {'cpus': cpus // 2, 'memory': 16 * GB}],
+        'disks': [
+            {'device': 'nvme0n1', 'mount': str(tmp_path / 'ssd'), 'fstype': 'ext4',
+             'free': 100 * GB, 'rotational': False},
+            {'device': 'sda', 'mount': str(tmp_path / 'hdd'), 'fstype': 'ext4',
+             'free': 500 * GB, 'rotational': True},
+        ],
+    }
+
+
+def read(conf_dir):
+    return {name: (conf_dir / name).read_text() for name in (tuning.DEFAULTS_FILE, tuning.ENV_FILE)}
+
+
+def test_apply_is_idempotent(tmp_path):
+    conf_dir = tmp_path / 'conf'
+    settings = tuning.recommend(host(tmp_path))
+    first = tuning.apply(str(conf_dir), settings)
+    assert all(entry['changed'] for entry in first.values())
+    written = read(conf_dir)
+    second = tuning.apply(str(conf_dir), settings)
+    assert not any(entry['changed'] for entry in second.values())
+    assert read(conf_dir) == written
+    for text in written.values():
+        assert text.count(tuning.BEGIN_MARKER) == 1 and text.count(tuning.END_MARKER) == 1
+    # Seul le SSD accueille spark.local.dir
+    assert f"spark.local.dir {tmp_path / 'ssd' / tuning.LOCAL_DIR}" in written[tuning.DEFAULTS_FILE]
+
+
+def test_rerun_replaces_block_and_keeps_manual_lines(tmp_path):
+    conf_dir = tmp_path / 'conf'
+    conf_dir.mkdir()
+    (conf_dir / tuning.DEFAULTS_FILE).write_text("spark.driver.memory 2g\nspark.eventLog.enabled true\n")
+    tuning.apply(str(conf_dir), tuning.recommend(host(tmp_path, cpus=8)))
+    result = tuning.apply(str(conf_dir), tuning.recommend(host(tmp_path, cpus=4)))
+    text = (conf_dir / tuning.DEFAULTS_FILE).read_text()
+    assert result[tuning.DEFAULTS_FILE]['skipped'] == ['spark.driver.memory']
+    assert text.startswith("spark.driver.memory 2g\nspark.eventLog.enabled true\n")
+    assert text.count('spark.driver.memory') == 1
+    assert text.count('spark.sql.shuffle.partitions') == 1
+    assert 'spark.sql.shuffle.partitions 12' in text
+    assert text.count(tuning.BEGIN_MARKER) == 1
+
+
+def test_unusable_local_dirs_are_dropped(tmp_path):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    usable = str(tmp_path / 'ssd' / tuning.LOCAL_DIR)
+    broken = str(blocker / tuning.LOCAL_DIR)
+    settings = [(tuning.DEFAULTS_FILE, 'spark.local.dir', f"{usable},{broken}", ''),
+                (tuning.ENV_FILE, 'SPARK_LOCAL_DIRS', f"{usable},{broken}", ''),
+                (tuning.DEFAULTS_FILE, 'spark.executor.cores', '4', '')]
+    kept, unusable = tuning.prepare_local_dirs(settings)
+    assert list(unusable) == [broken]
+    assert os.path.isdir(usable)
+    assert [(key, value) for _, key, value, _ in kept] == [
+        ('spark.local.dir', usable), ('SPARK_LOCAL_DIRS', usable), ('spark.executor.cores', '4')]
+    # Sans répertoire utilisable, les deux réglages disparaissent
+    kept, _ = tuning.prepare_local_dirs([(target, key, broken, reason)
+                                         for target, key, _, reason in settings])
+    assert [key for _, key, _, _ in kept] == ['spark.executor.cores']
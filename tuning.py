@@ -0,0 +1,341 @@
+import glob
+import os
+import re
+import shutil
+
+# Mémoire laissée au système et aux démons (10 %, au moins 1 Go)
+OS_RESERVE_FRACTION = 0.1
+OS_RESERVE_MIN = 1024 ** 3
+DRIVER_MEMORY_MIN = 1024 ** 3
+DRIVER_MEMORY_MAX = 8 * 1024 ** 3
+# Au-delà de 5 cœurs par exécuteur, le débit HDFS/S3 par tâche se dégrade
+EXECUTOR_CORES_MAX = 5
+EXECUTOR_MEMORY_MIN = 512 * 1024 ** 2
+# Part de la mémoire d'un exécuteur réservée hors tas (spark.executor.memoryOverheadFactor)
+MEMORY_OVERHEAD = 0.1
+SHUFFLE_PARTITIONS_PER_CORE = 3
+PARALLELISM_PER_CORE = 2
+# Réglages listant les répertoires de shuffle et de débordement
+LOCAL_DIR_KEYS = ('spark.local.dir', 'SPARK_LOCAL_DIRS')
+# Un disque n'accueille spark.local.dir que s'il lui reste au moins 10 Go
+LOCAL_DIR_MIN_FREE = 10 * 1024 ** 3
+LOCAL_DIR = 'spark-local'
+ROOT_LOCAL_DIR = '/var/tmp/spark-local'
+LOCAL_FILESYSTEMS = {'ext3', 'ext4', 'xfs', 'btrfs', 'f2fs', 'zfs'}
+
+DEFAULTS_FILE = 'spark-defaults.conf'
+ENV_FILE = 'spark-env.sh'
+BEGIN_MARKER = '# >>> spark-installer : réglages générés, ne pas modifier entre ces lignes >>>'
+END_MARKER = '# <<< spark-installer <<<'
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _cpu_list(text):
+    """Nombre de CPU d'une liste au format du noyau (0-3,8-11)"""
+    count = 0
+    for part in text.strip().split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            count += int(last) - int(first) + 1
+        elif part:
+            count += 1
+    return count
+
+
+def _memory():
+    """Mémoire disponible en octets : MemTotal, bornée par la limite du cgroup s'il y en a une"""
+    match = re.search(r'^MemTotal:\s+(\d+) kB', _read('/proc/meminfo') or '', re.M)
+    total = int(match.group(1)) * 1024 if match else os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        limit = (_read(path) or '').strip()
+        if limit.isdigit():
+            total = min(total, int(limit))
+    return total
+
+
+def _numa_nodes():
+    """CPU et mémoire de chaque nœud NUMA ; un seul nœud si le noyau n'en expose pas"""
+    nodes = []
+    for directory in sorted(glob.glob('/sys/devices/system/node/node[0-9]*')):
+        cpus = _cpu_list(_read(os.path.join(directory, 'cpulist')) or '')
+        match = re.search(r'MemTotal:\s+(\d+) kB', _read(os.path.join(directory, 'meminfo')) or '')
+        if cpus:
+            nodes.append({'cpus': cpus, 'memory': int(match.group(1)) * 1024 if match else 0})
+    return nodes
+
+
+def _rotational(device):
+    """True pour un disque à plateaux, False pour un SSD/NVMe, None si inconnu"""
+    name = os.path.basename(os.path.realpath(device))
+    block = os.path.realpath(os.path.join('/sys/class/block', name))
+    # Une partition n'a pas de queue/ : c'est le disque parent qui la porte
+    for candidate in (block, os.path.dirname(block)):
+        value = (_read(os.path.join(candidate, 'queue', 'rotational')) or '').strip()
+        if value in ('0', '1'):
+            return value == '1'
+    return None
+
+
+def _disks():
+    """Systèmes de fichiers locaux montés en écriture, un point de montage par périphérique"""
+    disks = {}
+    for line in (_read('/proc/self/mounts') or '').splitlines():
+        device, mount, fstype, options = line.split()[:4]
+        mount = mount.replace('\\040', ' ')
+        if fstype not in LOCAL_FILESYSTEMS or 'ro' in options.split(',') or not os.path.isdir(mount):
+            continue
+        # Montages liés : on garde le chemin le plus court du périphérique
+        if device in disks and len(disks[device]['mount']) <= len(mount):
+            continue
+        try:
+            free = shutil.disk_usage(mount).free
+        except OSError:
+            continue
+        disks[device] = {'device': device, 'mount': mount, 'fstype': fstype, 'free': free,
+                         'rotational': _rotational(device)}
+    return sorted(disks.values(), key=lambda disk: disk['mount'])
+
+
+def inspect_host():
+    """Description de la machine : CPU utilisables, mémoire, nœuds NUMA et disques locaux"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    memory = _memory()
+    nodes = _numa_nodes() or [{'cpus': cpus, 'memory': memory}]
+    return {'cpus': cpus, 'memory': memory, 'numa': nodes, 'disks': _disks()}
+
+
+def format_size(size):
+    """Taille au format de Spark (4g, 512m), arrondie au Mo inférieur"""
+    megabytes = int(size // 1024 ** 2)
+    if megabytes % 1024 == 0:
+        return f"{megabytes // 1024}g"
+    return f"{megabytes}m"
+
+
+def local_dirs(disks):
+    """Répertoires de spark.local.dir : un par disque rapide ayant assez d'espace libre
+
+    Les SSD sont préférés ; à défaut, tous les disques locaux assez grands
+    servent, Spark répartissant les fichiers de shuffle entre eux.
+    """
+    roomy = [disk for disk in disks if disk['free'] >= LOCAL_DIR_MIN_FREE]
+    fast = [disk for disk in roomy if disk['rotational'] is False]
+    chosen = fast or roomy
+    return [ROOT_LOCAL_DIR if disk['mount'] == '/' else os.path.join(disk['mount'], LOCAL_DIR)
+            for disk in chosen]
+
+
+def recommend(host):
+    """Réglages adaptés à host (voir inspect_host)
+
+    Retourne une liste de tuples (fichier, clé, valeur, justification),
+    fichier étant DEFAULTS_FILE ou ENV_FILE.
+    """
+    cpus = host['cpus']
+    nodes = host['numa']
+    reserve = max(OS_RESERVE_MIN, int(host['memory'] * OS_RESERVE_FRACTION))
+    usable = max(host['memory'] - reserve, DRIVER_MEMORY_MIN + EXECUTOR_MEMORY_MIN)
+    driver = min(DRIVER_MEMORY_MAX, max(DRIVER_MEMORY_MIN, usable // 8))
+    # Un exécuteur ne déborde pas d'un nœud NUMA : ses accès mémoire restent locaux
+    node_cpus = max(1, min(node['cpus'] for node in nodes))
+    executor_cores = max(1, min(EXECUTOR_CORES_MAX, node_cpus, cpus))
+    executors = max(1, cpus // executor_cores)
+    executor = max(EXECUTOR_MEMORY_MIN, int((usable - driver) / executors / (1 + MEMORY_OVERHEAD)))
+    memory_note = (f"{format_size(host['memory'])} au total, {format_size(reserve)} laissés au système, "
+                   f"{format_size(driver)} au driver")
+    settings = [
+        (DEFAULTS_FILE, 'spark.driver.memory', format_size(driver),
+         "1/8 de la mémoire utilisable, entre 1g et 8g (défaut de Spark : 1g)"),
+        (DEFAULTS_FILE, 'spark.executor.cores', str(executor_cores),
+         f"au plus {EXECUTOR_CORES_MAX} cœurs et pas plus qu'un nœud NUMA ({node_cpus} CPU)"),
+        (DEFAULTS_FILE, 'spark.executor.memory', format_size(executor),
+         f"{executors} exécuteur(s) de {executor_cores} cœurs : {memory_note}, "
+         f"{MEMORY_OVERHEAD:.0%} de surcoût hors tas"),
+        (DEFAULTS_FILE, 'spark.serializer', 'org.apache.spark.serializer.KryoSerializer',
+         "plus rapide et plus compact que la sérialisation Java"),
+        (DEFAULTS_FILE, 'spark.kryoserializer.buffer.max', '256m',
+         "évite l'échec Kryo sur les enregistrements volumineux"),
+        (DEFAULTS_FILE, 'spark.sql.adaptive.enabled', 'true',
+         "exécution adaptative : plans revus d'après les statistiques du shuffle"),
+        (DEFAULTS_FILE, 'spark.sql.adaptive.coalescePartitions.enabled', 'true',
+         "fusionne les partitions de shuffle trop petites"),
+        (DEFAULTS_FILE, 'spark.sql.adaptive.skewJoin.enabled', 'true',
+         "découpe les partitions déséquilibrées des jointures"),
+        (DEFAULTS_FILE, 'spark.sql.shuffle.partitions', str(cpus * SHUFFLE_PARTITIONS_PER_CORE),
+         f"{SHUFFLE_PARTITIONS_PER_CORE} par cœur ({cpus} CPU), l'exécution adaptative fusionnant "
+         f"le surplus (défaut de Spark : 200)"),
+        (DEFAULTS_FILE, 'spark.default.parallelism', str(cpus * PARALLELISM_PER_CORE),
+         f"{PARALLELISM_PER_CORE} tâches par cœur pour les RDD"),
+    ]
+    directories = local_dirs(host['disks'])
+    if directories:
+        speed = 'SSD' if any(disk['rotational'] is False and disk['free'] >= LOCAL_DIR_MIN_FREE
+                             for disk in host['disks']) else 'disques locaux'
+        reason = (f"shuffle et débordements répartis sur {len(directories)} {speed} "
+                  f"ayant au moins {format_size(LOCAL_DIR_MIN_FREE)} libres (défaut de Spark : /tmp)")
+        settings.append((DEFAULTS_FILE, 'spark.local.dir', ','.join(directories), reason))
+        # En mode standalone, SPARK_LOCAL_DIRS remplace spark.local.dir sur les workers
+        settings.append((ENV_FILE, 'SPARK_LOCAL_DIRS', ','.join(directories), reason))
+    workers = len(nodes)
+    worker_memory = max(EXECUTOR_MEMORY_MIN, (usable - driver) // workers)
+    if workers > 1:
+        settings.append((ENV_FILE, 'SPARK_WORKER_INSTANCES', str(workers),
+                         f"un worker standalone par nœud NUMA ({workers})"))
+    settings += [
+        (ENV_FILE, 'SPARK_WORKER_CORES', str(max(1, cpus // workers)),
+         f"{cpus} CPU répartis entre {workers} worker(s)"),
+        (ENV_FILE, 'SPARK_WORKER_MEMORY', format_size(worker_memory),
+         f"mémoire utilisable hors driver répartie entre {workers} worker(s)"),
+    ]
+    return settings
+
+
+def _defines(line, filename):
+    """Clé définie par une ligne de fichier de configuration, ou None"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if filename == ENV_FILE:
+        match = re.match(r'(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)=', line)
+        return match.group(1) if match else None
+    return line.split()[0]
+
+
+def _render(filename, key, value):
+    if filename == ENV_FILE:
+        return f'export {key}="{value}"'
+    return f"{key} {value}"
+
+
+def _split(text):
+    """Sépare un fichier en lignes écrites à la main et bloc généré"""
+    manual, block, inside = [], [], False
+    for line in text.splitlines():
+        if line == BEGIN_MARKER:
+            inside = True
+        elif line == END_MARKER:
+            inside = False
+        elif inside:
+            block.append(line)
+        else:
+            manual.append(line)
+    return manual, block
+
+
+def plan(conf_dir, settings):
+    """Contenu à écrire dans chaque fichier de conf_dir
+
+    Les réglages sont regroupés dans un bloc délimité par BEGIN_MARKER et
+    END_MARKER, remplacé à chaque passage : relancer le générateur
+    n'ajoute jamais de doublon. Une clé déjà définie à la main hors du bloc
+    est conservée et le réglage généré est écarté.
+
+    Retourne {fichier: {'path', 'text', 'changed', 'skipped'}}.
+    """
+    result = {}
+    for filename in (DEFAULTS_FILE, ENV_FILE):
+        path = os.path.join(conf_dir, filename)
+        existing = _read(path) or ''
+        manual, block = _split(existing)
+        defined = {_defines(line, filename) for line in manual}
+        lines, skipped = [], []
+        for target, key, value, _ in settings:
+            if target != filename:
+                continue
+            if key in defined:
+                skipped.append(key)
+            else:
+                lines.append(_render(filename, key, value))
+        while manual and not manual[-1].strip():
+            manual.pop()
+        if filename == ENV_FILE and not manual:
+            manual = ['#!/usr/bin/env bash']
+        text = '\n'.join(manual + ([''] if manual else []) + [BEGIN_MARKER] + lines + [END_MARKER]) + '\n'
+        result[filename] = {'path': path, 'text': text, 'changed': text != existing, 'skipped': skipped}
+    return result
+
+
+def prepare_local_dirs(settings):
+    """Crée les répertoires de spark.local.dir et retire des réglages ceux qui sont inutilisables
+
+    Sans droits sur la racine d'un montage (/mnt, /data... pour un
+    utilisateur non root), le répertoire est retiré de spark.local.dir et
+    de SPARK_LOCAL_DIRS ; s'il n'en reste aucun, les deux réglages sont
+    abandonnés et Spark garde /tmp.
+    Retourne (réglages, {répertoire: raison}).
+    """
+    unusable = {}
+    for _, key, value, _ in settings:
+        if key not in LOCAL_DIR_KEYS:
+            continue
+        for directory in value.split(','):
+            if directory in unusable:
+                continue
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                unusable[directory] = e.strerror or str(e)
+                continue
+            if not os.access(directory, os.W_OK | os.X_OK):
+                unusable[directory] = "écriture refusée"
+    kept = []
+    for target, key, value, reason in settings:
+        if key in LOCAL_DIR_KEYS and unusable:
+            value = ','.join(directory for directory in value.split(',') if directory not in unusable)
+            if not value:
+                continue
+        kept.append((target, key, value, reason))
+    return kept, unusable
+
+
+def apply(conf_dir, settings):
+    """Écrit les fichiers de configuration (voir plan)
+
+    Chaque fichier est remplacé de façon atomique : il peut être partagé
+    par lien physique avec une autre version installée. Les répertoires de
+    spark.local.dir sont à créer avant (prepare_local_dirs).
+    Retourne le résultat de plan.
+    """
+    result = plan(conf_dir, settings)
+    os.makedirs(conf_dir, exist_ok=True)
+    for filename, entry in result.items():
+        if not entry['changed']:
+            continue
+        tmp = f"{entry['path']}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(entry['text'])
+        os.chmod(tmp, 0o755 if filename == ENV_FILE else 0o644)
+        os.replace(tmp, entry['path'])
+    return result
+
+
+def format_host(host):
+    """Résumé de la machine inspectée"""
+    lines = [f"CPU : {host['cpus']}, mémoire : {format_size(host['memory'])}, nœuds NUMA : "
+             + ', '.join(f"{node['cpus']} CPU/{format_size(node['memory'])}" for node in host['numa'])]
+    for disk in host['disks']:
+        kind = {True: 'disque à plateaux', False: 'SSD', None: 'type inconnu'}[disk['rotational']]
+        lines.append(f"Disque {disk['mount']} ({disk['device']}, {disk['fstype']}, {kind}) : "
+                     f"{disk['free'] / 1024 ** 3:.0f} Go libres")
+    return '\n'.join(lines)
+
+
+def format_explain(host, settings):
+    """Machine inspectée puis chaque réglage avec sa justification"""
+    lines = [format_host(host)]
+    for filename in (DEFAULTS_FILE, ENV_FILE):
+        lines.append(f"\n{filename}")
+        for target, key, value, reason in settings:
+            if target == filename:
+                lines.append(f"  {key} = {value}\n      {reason}")
+    return '\n'.join(lines)
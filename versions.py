@@ -0,0 +1,91 @@
+import os
+
+import manifest
+
+CURRENT_LINK = 'current'
+DEFAULT_VARIANT = 'hadoop3'
+VARIANTS = ['hadoop3', 'hadoop3-scala2.13', 'without-hadoop']
+
+
+class VersionError(Exception):
+    """Erreur levée quand la version demandée n'est pas installée"""
+
+
+def distribution(version, variant=DEFAULT_VARIANT):
+    """Nom du répertoire de la distribution : spark-<version>-bin-<variante>"""
+    return f"spark-{version}-bin-{variant}"
+
+
+def archive_path(version, variant=DEFAULT_VARIANT):
+    """Chemin de l'archive relatif à la racine d'un miroir Apache"""
+    return f"spark-{version}/{distribution(version, variant)}.tgz"
+
+
+def installed(root):
+    """Distributions installées dans root (celles qui ont un manifeste), triées"""
+    directory = os.path.join(root, manifest.MANIFEST_DIR)
+    if not os.path.isdir(directory):
+        return []
+    names = [name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json')]
+    return sorted(name for name in names if os.path.isdir(os.path.join(root, name)))
+
+
+def current(root):
+    """Distribution pointée par root/current, ou None"""
+    try:
+        return os.path.basename(os.readlink(os.path.join(root, CURRENT_LINK)))
+    except OSError:
+        return None
+
+
+def switch(root, name):
+    """Fait pointer root/current vers name
+
+    Le nouveau lien est créé à côté puis renommé par-dessus l'ancien :
+    rename(2) est atomique, un processus qui résout current voit toujours
+    l'une ou l'autre version, jamais un lien absent.
+    """
+    if not os.path.isdir(os.path.join(root, name)):
+        raise VersionError(f"{name} n'est pas installé dans {root}")
+    link = os.path.join(root, CURRENT_LINK)
+    tmp = f"{link}.{os.getpid()}.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(name, tmp)
+    os.replace(tmp, link)
+
+
+def content_index(root, exclude=None):
+    """Fonction reuse(entrée) pour extractor : fichier déjà installé de même contenu
+
+    L'index est construit à partir des manifestes des autres distributions
+    de root, par (SHA-256, taille, droits). Un candidat n'est retenu que si
+    sa taille et sa date sur disque correspondent encore à son manifeste.
+    """
+    index = {}
+    for name in installed(root):
+        if name == exclude:
+            continue
+        try:
+            document = manifest.load(root, name)
+        except manifest.ManifestError:
+            continue
+        for path, entry in document['entries'].items():
+            if entry['type'] == 'file' and 'sha256' in entry and not entry.get('unpacked'):
+                index.setdefault((entry['sha256'], entry['size'], entry['mode']), (path, entry))
+
+    def reuse(entry):
+        candidate = index.get((entry['sha256'], entry['size'], entry['mode']))
+        if candidate is None:
+            return None
+        path, known = candidate
+        path = os.path.join(root, path)
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        if info.st_size != known['size'] or int(info.st_mtime) != known['mtime']:
+            return None
+        return path
+
+    return reuse